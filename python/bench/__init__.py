@@ -0,0 +1 @@
+"""Benchmarks of the youtube simulator on synthetic catalogues."""
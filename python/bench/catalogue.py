@@ -0,0 +1,99 @@
+"""A generator of synthetic video library files."""
+
+import argparse
+import itertools
+import random
+
+
+# Tags and title words are drawn from vocabularies of these sizes with
+# Zipf-like frequencies, so a few are very common and most are rare.
+_TAG_COUNT = 5000
+_WORD_COUNT = 20000
+_ZIPF_EXPONENT = 1.1
+
+# Share of the videos carrying 0, 1, 2, ... tags.
+_TAGS_PER_VIDEO = (0.05, 0.15, 0.25, 0.25, 0.15, 0.1, 0.05)
+
+_SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "qu",
+              "dra", "fen", "gor", "hil", "jus", "pla", "tri", "wen")
+
+# Videos generated per batch, bounding the memory used by the generator.
+_BATCH_SIZE = 10000
+
+
+def _words(rng, count):
+    """Returns count distinct made-up words, in random order."""
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(_SYLLABLES)
+                          for _ in range(rng.randint(1, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def _zipf_weights(count):
+    return list(itertools.accumulate(
+        1 / rank ** _ZIPF_EXPONENT for rank in range(1, count + 1)))
+
+
+def tag_vocabulary(seed=0):
+    """Returns the tags generated catalogues draw from, most common first."""
+    rng = random.Random(seed)
+    return ["#" + word for word in _words(rng, _TAG_COUNT)]
+
+
+def generate(path, size, seed=0):
+    """Writes a library file of synthetic videos.
+
+    Titles are two to eight words long, starting with a capital. Every
+    video has a unique id and up to six distinct tags.
+
+    Args:
+        path: The library file to write.
+        size: The number of videos.
+        seed: Seeds the generator, so that the same file is generated.
+    """
+    rng = random.Random(seed)
+    tags = tag_vocabulary(seed)
+    tag_weights = _zipf_weights(len(tags))
+    words = _words(rng, _WORD_COUNT)
+    word_weights = _zipf_weights(len(words))
+    tag_counts = list(range(len(_TAGS_PER_VIDEO)))
+    with open(path, "w") as library_file:
+        for start in range(0, size, _BATCH_SIZE):
+            # Everything random in a batch is drawn at once, then split
+            # between the videos.
+            count = min(_BATCH_SIZE, size - start)
+            title_lengths = [rng.randint(2, 8) for _ in range(count)]
+            title_words = iter(rng.choices(
+                words, cum_weights=word_weights, k=sum(title_lengths)))
+            video_tag_counts = rng.choices(
+                tag_counts, _TAGS_PER_VIDEO, k=count)
+            video_tags = iter(rng.choices(
+                tags, cum_weights=tag_weights, k=sum(video_tag_counts)))
+            lines = []
+            for number, length, tag_count in zip(
+                    range(start, start + count), title_lengths,
+                    video_tag_counts):
+                title = " ".join(itertools.islice(title_words, length))
+                distinct_tags = dict.fromkeys(
+                    itertools.islice(video_tags, tag_count))
+                lines.append(f"{title[:1].upper()}{title[1:]} | "
+                             f"video_{number:08d} | "
+                             f"{','.join(distinct_tags)}\n")
+            library_file.writelines(lines)
+
+
+def main(argv=None):
+    """Writes a synthetic library file."""
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument("path", help="the library file to write")
+    arg_parser.add_argument("size", type=int, help="the number of videos")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args(argv)
+    generate(args.path, args.size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
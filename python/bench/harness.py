@@ -0,0 +1,245 @@
+"""Times library loads and player commands on synthetic catalogues."""
+
+from .catalogue import generate, tag_vocabulary
+from src.command_parser import CommandException, CommandParser
+from src.library_snapshot import snapshot_path
+from src.output_sink import OutputSink
+from src.sqlite_library import SQLiteVideoLibrary
+from src.video_library import VideoLibrary
+from src.video_player import VideoPlayer
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+_SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Times every command is run by default. Commands listing a share of the
+# catalogue are run fewer times on large catalogues.
+_REPEAT = 20
+
+
+class _DiscardingSink(OutputSink):
+    """A sink formatting everything, like any other, then dropping it."""
+
+    def write(self, text):
+        pass
+
+
+def _result(size, backend, benchmark, timings_ns):
+    """Returns the machine-readable record of one benchmark."""
+    timings_us = [timing / 1000 for timing in timings_ns]
+    return {
+        "size": size,
+        "backend": backend,
+        "benchmark": benchmark,
+        "repeat": len(timings_us),
+        "min_us": round(min(timings_us), 3),
+        "median_us": round(statistics.median(timings_us), 3),
+        "mean_us": round(statistics.fmean(timings_us), 3),
+        "max_us": round(max(timings_us), 3),
+        "python": platform.python_version(),
+    }
+
+
+def _time(function, repeat):
+    """Returns the run time of every call to function, in nanoseconds."""
+    timings = []
+    for index in range(repeat):
+        start = time.perf_counter_ns()
+        function(index)
+        timings.append(time.perf_counter_ns() - start)
+    return timings
+
+
+def _execute(parser, output, command):
+    """Runs a command, reporting its errors like the command line does."""
+    try:
+        parser.execute_command(command)
+    except CommandException as e:
+        output.message(str(e))
+
+
+def _load(videos_path, backend, workers=None):
+    """Loads a library, the way a player does."""
+    if backend == "sqlite":
+        return SQLiteVideoLibrary(videos_path.with_suffix(".db"), videos_path)
+    return VideoLibrary(videos_path, workers)
+
+
+def _remove_caches(videos_path):
+    """Removes the snapshot and the database built from a library file."""
+    for cache in (snapshot_path(videos_path), videos_path.with_suffix(".db")):
+        if cache.exists():
+            cache.unlink()
+
+
+def _command_benchmarks(size, repeat, seed):
+    """Returns (name, repeat, command for each run) for every benchmark.
+
+    Commands that change the player are arranged so that every run does
+    the same work, e.g. each run adds a video the playlist does not have.
+    """
+    def video_id(index):
+        return f"video_{index:08d}"
+
+    rng = random.Random(seed)
+    sample = [video_id(rng.randrange(size)) for _ in range(repeat)]
+    tags = tag_vocabulary(seed)
+    common_tag, rare_tag = tags[0], tags[-1]
+    listing_repeat = max(1, min(repeat, 1_000_000 // size))
+    return [
+        ("NUMBER_OF_VIDEOS", repeat,
+         lambda index: ["NUMBER_OF_VIDEOS"]),
+        ("RELOAD_LIBRARY unchanged", repeat,
+         lambda index: ["RELOAD_LIBRARY"]),
+        ("PLAY", repeat, lambda index: ["PLAY", sample[index]]),
+        ("PLAY_RANDOM", repeat, lambda index: ["PLAY_RANDOM"]),
+        ("PAUSE", repeat, lambda index: ["PAUSE"]),
+        ("SHOW_PLAYING", repeat, lambda index: ["SHOW_PLAYING"]),
+        ("CONTINUE", repeat, lambda index: ["CONTINUE"]),
+        ("STOP", repeat,
+         lambda index: ["STOP"] if index % 2 else ["PLAY", sample[index]]),
+        ("CREATE_PLAYLIST", repeat,
+         lambda index: ["CREATE_PLAYLIST", f"bench_{index}"]),
+        ("ADD_TO_PLAYLIST", repeat,
+         lambda index: ["ADD_TO_PLAYLIST", "bench_0", video_id(index)]),
+        ("SHOW_ALL_PLAYLISTS", repeat, lambda index: ["SHOW_ALL_PLAYLISTS"]),
+        ("SHOW_PLAYLIST", repeat, lambda index: ["SHOW_PLAYLIST", "bench_0"]),
+        ("PLAY_PLAYLIST", repeat, lambda index: ["PLAY_PLAYLIST", "bench_0"]),
+        ("NEXT", repeat, lambda index: ["NEXT"]),
+        ("SHOW_CURRENT_PLAYLIST", repeat,
+         lambda index: ["SHOW_CURRENT_PLAYLIST"]),
+        ("REMOVE_FROM_PLAYLIST", repeat,
+         lambda index: ["REMOVE_FROM_PLAYLIST", "bench_0", video_id(index)]),
+        ("UNDO", repeat, lambda index: ["UNDO"]),
+        ("REDO", repeat, lambda index: ["REDO"]),
+        ("CLEAR_PLAYLIST", repeat,
+         lambda index: ["CLEAR_PLAYLIST", f"bench_{index}"]),
+        ("DELETE_PLAYLIST", repeat,
+         lambda index: ["DELETE_PLAYLIST", f"bench_{index}"]),
+        ("FLAG_VIDEO", repeat,
+         lambda index: ["FLAG_VIDEO", video_id(index), "bench"]),
+        ("ALLOW_VIDEO", repeat, lambda index: ["ALLOW_VIDEO", video_id(index)]),
+        ("RATE_VIDEO", repeat,
+         lambda index: ["RATE_VIDEO", sample[index], str(1 + index % 5)]),
+        ("SHOW_VIDEO_RATING", repeat,
+         lambda index: ["SHOW_VIDEO_RATING", sample[index]]),
+        ("SHOW_VIDEOS_BY_RATING 10", repeat,
+         lambda index: ["SHOW_VIDEOS_BY_RATING", "10"]),
+        ("SEARCH_VIDEOS_WITH_TAG rare", repeat,
+         lambda index: ["SEARCH_VIDEOS_WITH_TAG", rare_tag]),
+        ("SEARCH_VIDEOS rare", repeat,
+         lambda index: ["SEARCH_VIDEOS", "quzevi"]),
+        ("SEARCH_VIDEOS_FUZZY", repeat,
+         lambda index: ["SEARCH_VIDEOS_FUZZY", "quzevix"]),
+        ("SEARCH_VIDEOS_RANKED common", repeat,
+         lambda index: ["SEARCH_VIDEOS_RANKED", "dra"]),
+        ("SEARCH_VIDEOS_RANKED short", repeat,
+         lambda index: ["SEARCH_VIDEOS_RANKED", "ka"]),
+        ("SEARCH_VIDEOS_WITH_TAG common", listing_repeat,
+         lambda index: ["SEARCH_VIDEOS_WITH_TAG", common_tag]),
+        ("SEARCH_VIDEOS_WITH_TAG prefix", listing_repeat,
+         lambda index: ["SEARCH_VIDEOS_WITH_TAG", "#dra", "PREFIX"]),
+        ("SEARCH_VIDEOS short", listing_repeat,
+         lambda index: ["SEARCH_VIDEOS", "ka"]),
+        ("SEARCH_VIDEOS common", listing_repeat,
+         lambda index: ["SEARCH_VIDEOS", "dra"]),
+        ("SHOW_VIDEOS_BY_RATING", listing_repeat,
+         lambda index: ["SHOW_VIDEOS_BY_RATING"]),
+        ("SHOW_ALL_VIDEOS page", repeat,
+         lambda index: ["SHOW_ALL_VIDEOS", "LIMIT", "20",
+                        "OFFSET", str(size // repeat * index)]),
+        ("SEARCH_VIDEOS common page", listing_repeat,
+         lambda index: ["SEARCH_VIDEOS", "dra", "LIMIT", "20"]),
+        ("SHOW_ALL_VIDEOS", listing_repeat,
+         lambda index: ["SHOW_ALL_VIDEOS"]),
+    ]
+
+
+def run(size, backend="memory", repeat=_REPEAT, data_dir=None, seed=0,
+        workers=None):
+    """Benchmarks a catalogue of the given size.
+
+    The catalogue is generated in data_dir unless it is already there.
+
+    Args:
+        size: The number of videos in the catalogue.
+        backend: "memory" for VideoLibrary, "sqlite" for SQLiteVideoLibrary.
+        repeat: How many times each command is timed.
+        data_dir: Where to keep the generated catalogues, a temporary
+            directory by default.
+        seed: Seeds the catalogue generator and the command arguments.
+        workers: How many processes parse the catalogue on a cold load of
+            the memory backend, see VideoLibrary.
+
+    Returns:
+        A list of result records, one per benchmark.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = Path(temp_dir if data_dir is None else data_dir)
+        videos_path = data_dir / f"videos_{size}_{seed}.txt"
+        if not videos_path.exists():
+            generate(videos_path, size, seed)
+
+        results = []
+        _remove_caches(videos_path)
+        results.append(_result(size, backend, "load cold", _time(
+            lambda index: _load(videos_path, backend, workers), 1)))
+        library = None
+
+        def load(index):
+            nonlocal library
+            library = _load(videos_path, backend)
+        results.append(_result(size, backend, "load warm",
+                               _time(load, min(repeat, 3))))
+
+        output = _DiscardingSink()
+        player = VideoPlayer(seed=seed, ask=lambda prompt: "",
+                             output=output, library=library)
+        parser = CommandParser(player)
+        for name, runs, command in _command_benchmarks(size, repeat, seed):
+            timings = _time(
+                lambda index: _execute(parser, output, command(index)), runs)
+            results.append(_result(size, backend, name, timings))
+        return results
+
+
+def main(argv=None):
+    """Runs the benchmarks and writes one JSON record per line."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "sizes", nargs="*", default=["10k"],
+        help="catalogue sizes: 10k, 1m, 10m or a number of videos")
+    arg_parser.add_argument("--backend", choices=["memory", "sqlite"],
+                            default="memory")
+    arg_parser.add_argument("--repeat", type=int, default=_REPEAT)
+    arg_parser.add_argument(
+        "--workers", type=int,
+        help="processes parsing the catalogue on a cold load, one per CPU "
+             "for large catalogues by default")
+    arg_parser.add_argument("--data-dir",
+                            help="keep generated catalogues in this directory")
+    arg_parser.add_argument("--output", help="write the results to this file")
+    args = arg_parser.parse_args(argv)
+
+    if args.data_dir is not None:
+        os.makedirs(args.data_dir, exist_ok=True)
+    output = sys.stdout if args.output is None else open(args.output, "w")
+    try:
+        for size in args.sizes:
+            size = _SIZES.get(size.lower()) or int(size)
+            for result in run(size, args.backend, args.repeat, args.data_dir,
+                              workers=args.workers):
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
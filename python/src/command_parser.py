@@ -1,7 +1,8 @@
 """A command parser class."""
 
-import textwrap
+from collections import namedtuple
 from typing import Sequence
+import time
 
 
 class CommandException(Exception):
@@ -9,11 +10,289 @@ class CommandException(Exception):
     pass
 
 
+Command = namedtuple(
+    "Command", ["handler", "syntax", "description", "min_args", "max_args",
+                "usage", "paged"])
+Command.__doc__ = """A command the parser can execute.
+
+handler: Called with the video player and the command's arguments, and
+    with a page keyword argument if the command is paged and given one.
+syntax: How the command is written, e.g. "PLAY <video_id>".
+description: What the command does, shown by HELP.
+min_args, max_args: How many arguments the command takes; max_args is
+    None if it ignores any extra arguments.
+usage: The message of the CommandException raised when the command is
+    given the wrong number of arguments.
+paged: Whether the command lists videos a page at a time when its
+    arguments end with LIMIT <n> and/or OFFSET <n>.
+"""
+
+Page = namedtuple("Page", ["offset", "limit"])
+Page.__doc__ = """The part of a listing to show.
+
+offset: How many of the listed items to skip.
+limit: The most items to show, None for all of them.
+"""
+
+_PAGE_KEYWORDS = ("LIMIT", "OFFSET")
+
+_PAGE_USAGE = ("Please follow LIMIT with a positive number and OFFSET with "
+               "a number, each given at most once.")
+
+
+def _split_page(args, min_args):
+    """Splits the trailing LIMIT and OFFSET arguments off a paged command.
+
+    Returns:
+        The remaining arguments, and the Page asked for or None.
+    """
+    offset, limit = 0, None
+    keywords = set()
+    while (len(args) >= min_args + 2
+           and args[-2].upper() in _PAGE_KEYWORDS):
+        keyword, value = args[-2].upper(), args[-1]
+        if (keyword in keywords or not value.isdecimal()
+                or (keyword == "LIMIT" and int(value) == 0)):
+            raise CommandException(_PAGE_USAGE)
+        if keyword == "LIMIT":
+            limit = int(value)
+        else:
+            offset = int(value)
+        keywords.add(keyword)
+        args = args[:-2]
+    return args, Page(offset, limit) if keywords else None
+
+
+def _search_videos_with_tag(player, video_tag, option=None, page=None):
+    if option is None:
+        player.search_videos_tag(video_tag, page=page)
+    elif option.upper() == "PREFIX":
+        player.search_videos_tag(video_tag, prefix=True, page=page)
+    else:
+        raise CommandException(_COMMANDS["SEARCH_VIDEOS_WITH_TAG"].usage)
+
+
+def _show_videos_by_rating(player, limit=None):
+    if limit is None:
+        player.show_videos_by_rating()
+    elif limit.isdecimal() and int(limit) > 0:
+        player.show_videos_by_rating(int(limit))
+    else:
+        raise CommandException(_COMMANDS["SHOW_VIDEOS_BY_RATING"].usage)
+
+
+def _search_videos_ranked(player, search_term, limit=None):
+    if limit is None:
+        player.search_videos_ranked(search_term)
+    elif limit.isdecimal() and int(limit) > 0:
+        player.search_videos_ranked(search_term, int(limit))
+    else:
+        raise CommandException(_COMMANDS["SEARCH_VIDEOS_RANKED"].usage)
+
+
+def _command(name, handler, syntax, description, min_args=0, max_args=None,
+             usage=None, paged=False):
+    """Adds a command to the built-in commands."""
+    _COMMANDS[name] = Command(handler, syntax, description, min_args,
+                              max_args, usage, paged)
+
+
+# The built-in commands by name, in the order HELP lists them.
+_COMMANDS = {}
+
+_command(
+    "NUMBER_OF_VIDEOS", lambda player: player.number_of_videos(),
+    "NUMBER_OF_VIDEOS", "Shows how many videos are in the library.")
+_command(
+    "RELOAD_LIBRARY", lambda player: player.reload_library(),
+    "RELOAD_LIBRARY",
+    "Applies the changes made to the library file since it was loaded.")
+_command(
+    "SHOW_ALL_VIDEOS", lambda player, page=None: player.show_all_videos(page),
+    "SHOW_ALL_VIDEOS [LIMIT <n>] [OFFSET <n>]",
+    "Lists all videos from the library.", paged=True)
+_command(
+    "PLAY", lambda player, video_id: player.play_video(video_id),
+    "PLAY <video_id>", "Plays specified video.", 1, 1,
+    "Please enter PLAY command followed by video_id.")
+_command(
+    "PLAY_RANDOM", lambda player: player.play_random_video(),
+    "PLAY_RANDOM", "Plays a random video from the library.")
+_command(
+    "STOP", lambda player: player.stop_video(),
+    "STOP", "Stop the current video.")
+_command(
+    "PAUSE", lambda player: player.pause_video(),
+    "PAUSE", "Pause the current video.")
+_command(
+    "CONTINUE", lambda player: player.continue_video(),
+    "CONTINUE", "Resume the current paused video.")
+_command(
+    "SHOW_PLAYING", lambda player: player.show_playing(),
+    "SHOW_PLAYING", "Displays the title, url and paused status of the video "
+    "that is currently playing (or paused).")
+_command(
+    "CREATE_PLAYLIST", lambda player, name: player.create_playlist(name),
+    "CREATE_PLAYLIST <playlist_name>",
+    "Creates a new (empty) playlist with the provided name.", 1, 1,
+    "Please enter CREATE_PLAYLIST command followed by a playlist name.")
+_command(
+    "ADD_TO_PLAYLIST",
+    lambda player, name, video_id: player.add_to_playlist(name, video_id),
+    "ADD_TO_PLAYLIST <playlist_name> <video_id>",
+    "Adds the requested video to the playlist.", 2, 2,
+    "Please enter ADD_TO_PLAYLIST command followed by a playlist name and "
+    "video_id to add.")
+_command(
+    "REMOVE_FROM_PLAYLIST",
+    lambda player, name, video_id: player.remove_from_playlist(name, video_id),
+    "REMOVE_FROM_PLAYLIST <playlist_name> <video_id>",
+    "Removes the specified video from the specified playlist", 2, 2,
+    "Please enter REMOVE_FROM_PLAYLIST command followed by a playlist name "
+    "and video_id to remove.")
+_command(
+    "CLEAR_PLAYLIST", lambda player, name: player.clear_playlist(name),
+    "CLEAR_PLAYLIST <playlist_name>",
+    "Removes all the videos from the playlist.", 1, 1,
+    "Please enter CLEAR_PLAYLIST command followed by a playlist name.")
+_command(
+    "DELETE_PLAYLIST", lambda player, name: player.delete_playlist(name),
+    "DELETE_PLAYLIST <playlist_name>", "Deletes the playlist.", 1, 1,
+    "Please enter DELETE_PLAYLIST command followed by a playlist name.")
+_command(
+    "SHOW_PLAYLIST",
+    lambda player, name, page=None: player.show_playlist(name, page),
+    "SHOW_PLAYLIST <playlist_name> [LIMIT <n>] [OFFSET <n>]",
+    "List all the videos in this playlist.", 1, 1,
+    "Please enter SHOW_PLAYLIST command followed by a playlist name.",
+    paged=True)
+_command(
+    "SHOW_ALL_PLAYLISTS", lambda player: player.show_all_playlists(),
+    "SHOW_ALL_PLAYLISTS", "Display all the available playlists.")
+_command(
+    "SEARCH_VIDEOS",
+    lambda player, term, page=None: player.search_videos(term, page),
+    "SEARCH_VIDEOS <search_term> [LIMIT <n>] [OFFSET <n>]",
+    "Display all the videos whose titles contain the search_term.", 1, 1,
+    "Please enter SEARCH_VIDEOS command followed by a search term.",
+    paged=True)
+_command(
+    "SEARCH_VIDEOS_FUZZY",
+    lambda player, term, page=None: player.search_videos_fuzzy(term, page),
+    "SEARCH_VIDEOS_FUZZY <search_term> [LIMIT <n>] [OFFSET <n>]",
+    "Display the videos whose titles match the search_term, allowing for "
+    "typos.", 1, 1,
+    "Please enter SEARCH_VIDEOS_FUZZY command followed by a search term.",
+    paged=True)
+_command(
+    "SEARCH_VIDEOS_RANKED", _search_videos_ranked,
+    "SEARCH_VIDEOS_RANKED <search_term> [limit]",
+    "Display the videos most relevant to the search_term, best first, "
+    "20 of them or limit if given.", 1, 2,
+    "Please enter SEARCH_VIDEOS_RANKED command followed by a search term and "
+    "an optional number of videos.")
+_command(
+    "SEARCH_VIDEOS_WITH_TAG", _search_videos_with_tag,
+    "SEARCH_VIDEOS_WITH_TAG <tag_name> [PREFIX] [LIMIT <n>] [OFFSET <n>]",
+    "Display all videos with the provided tag, or with tags starting with "
+    "it if PREFIX is given.", 1, 2,
+    "Please enter SEARCH_VIDEOS_WITH_TAG command followed by a video tag and "
+    "an optional PREFIX.", paged=True)
+_command(
+    "FLAG_VIDEO",
+    lambda player, video_id, *reason: player.flag_video(video_id, *reason),
+    "FLAG_VIDEO <video_id> <flag_reason>", "Mark a video as flagged.", 1, 2,
+    "Please enter FLAG_VIDEO command followed by a video_id and an optional "
+    "flag reason.")
+_command(
+    "ALLOW_VIDEO", lambda player, video_id: player.allow_video(video_id),
+    "ALLOW_VIDEO <video_id>", "Removes a flag from a video.", 1, 1,
+    "Please enter ALLOW_VIDEO command followed by a video_id.")
+_command(
+    "PLAY_PLAYLIST", lambda player, name: player.play_playlist(name),
+    "PLAY_PLAYLIST <playlist_name>", "Play specified video.", 1, 1,
+    "Please enter PLAY_PLAYLIST command followed by a playlist name.")
+_command(
+    "NEXT", lambda player: player.next_video(),
+    "NEXT", "Skip to the next video of the playlist.")
+_command(
+    "SHOW_CURRENT_PLAYLIST", lambda player: player.show_current_playlist(),
+    "SHOW_CURRENT_PLAYLIST",
+    "Displays the name of the playlist that is currently playing.")
+_command(
+    "RATE_VIDEO",
+    lambda player, video_id, rating: player.rate_video(video_id, rating),
+    "RATE_VIDEO <video_id> <rating>", "Rate specified video.", 2, 2,
+    "Please enter RATE_VIDEO command followed by a video_id and rating.")
+_command(
+    "SHOW_VIDEO_RATING",
+    lambda player, video_id: player.show_video_rating(video_id),
+    "SHOW_VIDEO_RATING <video_id>", "Show rating of specified video.", 1, 1,
+    "Please enter SHOW_VIDEO_RATING command followed by a video_id.")
+_command(
+    "SHOW_VIDEOS_BY_RATING", _show_videos_by_rating,
+    "SHOW_VIDEOS_BY_RATING [<k>]",
+    "Show videos by rating, only the k best rated if given.", 0, 1,
+    "Please enter SHOW_VIDEOS_BY_RATING command followed by an optional "
+    "number of videos to show.")
+_command(
+    "UNDO", lambda player: player.undo(),
+    "UNDO", "Undo the previous command, repeat to go further back.")
+_command(
+    "REDO", lambda player: player.redo(),
+    "REDO", "Redo the last undone command.")
+
+# EXIT is handled by the loop reading the commands, but HELP lists it.
+_EXIT_HELP = "EXIT - Terminates the program execution."
+
+
 class CommandParser:
-    """A class used to parse and execute a user Command."""
+    """A class used to parse and execute a user Command.
+
+    Commands are looked up by name in a table of Command entries, which
+    also checks how many arguments they get and makes up the HELP text.
+
+    Given a CommandStats, the parser times every command it executes; STATS
+    shows what was recorded. Without one, nothing is timed.
+    """
 
-    def __init__(self, video_player):
+    def __init__(self, video_player, stats=None):
+        """CommandParser constructor.
+
+        Args:
+            video_player: The VideoPlayer the commands are executed on.
+            stats: The CommandStats recording how long commands take, if
+                any.
+        """
         self._player = video_player
+        self._stats = stats
+        self._commands = dict(_COMMANDS)
+        self.add_command("STATS", lambda player: self._show_stats(),
+                         "STATS", "Shows how long each command has taken.")
+        self.add_command("HELP", lambda player: self._get_help(),
+                         "HELP", "Displays help.")
+
+    def add_command(self, name, handler, syntax, description, min_args=0,
+                    max_args=None, usage=None, paged=False):
+        """Adds a command, or replaces the command with the same name.
+
+        Args:
+            name: The name of the command, matched case-insensitively.
+            handler: Called with the video player and the command's
+                arguments.
+            syntax: How the command is written, shown by HELP.
+            description: What the command does, shown by HELP.
+            min_args: The fewest arguments the command takes.
+            max_args: The most arguments the command takes, None if it
+                ignores any extra arguments.
+            usage: The message of the CommandException raised when the
+                command is given the wrong number of arguments.
+            paged: Whether the command takes trailing LIMIT <n> and
+                OFFSET <n> arguments, passed to the handler as a Page in
+                its page keyword argument.
+        """
+        self._commands[name.upper()] = Command(
+            handler, syntax, description, min_args, max_args, usage, paged)
 
     def execute_command(self, command: Sequence[str]):
         """Executes the user command. Expects the command to be upper case.
@@ -24,180 +303,52 @@ class CommandParser:
                 "Please enter a valid command, "
                 "type HELP for a list of available commands.")
 
-        if command[0].upper() == "NUMBER_OF_VIDEOS":
-            self._player.number_of_videos()
-
-        elif command[0].upper() == "SHOW_ALL_VIDEOS":
-            self._player.show_all_videos()
-
-        elif command[0].upper() == "PLAY":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter PLAY command followed by video_id.")
-            self._player.play_video(command[1])
-
-        elif command[0].upper() == "PLAY_RANDOM":
-            self._player.play_random_video()
-
-        elif command[0].upper() == "STOP":
-            self._player.stop_video()
-
-        elif command[0].upper() == "PAUSE":
-            self._player.pause_video()
-
-        elif command[0].upper() == "CONTINUE":
-            self._player.continue_video()
-
-        elif command[0].upper() == "SHOW_PLAYING":
-            self._player.show_playing()
-
-        elif command[0].upper() == "CREATE_PLAYLIST":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter CREATE_PLAYLIST command followed by a "
-                    "playlist name.")
-            self._player.create_playlist(command[1])
-
-        elif command[0].upper() == "ADD_TO_PLAYLIST":
-            if len(command) != 3:
-                raise CommandException(
-                    "Please enter ADD_TO_PLAYLIST command followed by a "
-                    "playlist name and video_id to add.")
-            self._player.add_to_playlist(command[1], command[2])
-
-        elif command[0].upper() == "REMOVE_FROM_PLAYLIST":
-            if len(command) != 3:
-                raise CommandException(
-                    "Please enter REMOVE_FROM_PLAYLIST command followed by a "
-                    "playlist name and video_id to remove.")
-            self._player.remove_from_playlist(command[1], command[2])
-
-        elif command[0].upper() == "CLEAR_PLAYLIST":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter CLEAR_PLAYLIST command followed by a "
-                    "playlist name.")
-            self._player.clear_playlist(command[1])
-
-        elif command[0].upper() == "DELETE_PLAYLIST":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter DELETE_PLAYLIST command followed by a "
-                    "playlist name.")
-            self._player.delete_playlist(command[1])
-
-        elif command[0].upper() == "SHOW_PLAYLIST":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter SHOW_PLAYLIST command followed by a "
-                    "playlist name.")
-            self._player.show_playlist(command[1])
-
-        elif command[0].upper() == "SHOW_ALL_PLAYLISTS":
-            self._player.show_all_playlists()
-
-        elif command[0].upper() == "SEARCH_VIDEOS":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter SEARCH_VIDEOS command followed by a "
-                    "search term.")
-            self._player.search_videos(command[1])
-
-        elif command[0].upper() == "SEARCH_VIDEOS_WITH_TAG":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter SEARCH_VIDEOS_WITH_TAG command followed by a "
-                    "video tag.")
-            self._player.search_videos_tag(command[1])
-
-        elif command[0].upper() == "FLAG_VIDEO":
-            if len(command) == 3:
-                self._player.flag_video(command[1], command[2])
-            elif len(command) == 2:
-                self._player.flag_video(command[1])
-            else:
-                raise CommandException(
-                    "Please enter FLAG_VIDEO command followed by a "
-                    "video_id and an optional flag reason.")
-
-        elif command[0].upper() == "ALLOW_VIDEO":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter ALLOW_VIDEO command followed by a "
-                    "video_id.")
-            self._player.allow_video(command[1])
-
-        elif command[0].upper() == "PLAY_PLAYLIST":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter PLAY_PLAYLIST command followed by a "
-                    "playlist name.")
-            self._player.play_playlist(command[1])
-
-        elif command[0].upper() == "NEXT":
-            self._player.next_video()
-
-        elif command[0].upper() == "SHOW_CURRENT_PLAYLIST":
-            self._player.show_current_playlist()
-
-        elif command[0].upper() == "RATE_VIDEO":
-            if len(command) != 3:
-                raise CommandException(
-                    "Please enter RATE_VIDEO command followed by a "
-                    "video_id and rating.")
-            self._player.rate_video(command[1], command[2])
-
-        elif command[0].upper() == "SHOW_VIDEO_RATING":
-            if len(command) != 2:
-                raise CommandException(
-                    "Please enter SHOW_VIDEO_RATING command followed by a "
-                    "video_id.")
-            self._player.show_video_rating(command[1])
-        
-        elif command[0].upper() == "SHOW_VIDEOS_BY_RATING":
-            self._player.show_videos_by_rating()
-
-        elif command[0].upper() == "UNDO":
-            self._player.undo()
-
-        elif command[0].upper() == "HELP":
-            self._get_help()
-        else:
-            print(
+        entry = self._commands.get(command[0].upper())
+        if entry is None:
+            self._player.output.message(
                 "Please enter a valid command, type HELP for a list of "
                 "available commands.")
+            return
+
+        args = command[1:]
+        page = None
+        if entry.paged:
+            args, page = _split_page(args, entry.min_args)
+        if len(args) < entry.min_args or (
+                entry.max_args is not None and len(args) > entry.max_args):
+            raise CommandException(entry.usage)
+        if entry.max_args is None:
+            args = args[:entry.min_args]
+        kwargs = {} if page is None else {"page": page}
+        stats = self._stats
+        if stats is None:
+            entry.handler(self._player, *args, **kwargs)
+            return
+        start = time.perf_counter_ns()
+        try:
+            entry.handler(self._player, *args, **kwargs)
+        finally:
+            stats.record(command[0].upper(), time.perf_counter_ns() - start)
+
+    def _show_stats(self):
+        """Displays the call counts and latencies of the commands run."""
+        if self._stats is None:
+            self._player.output.message(
+                "Command statistics are not being collected")
+        elif not self._stats.timings():
+            self._player.output.message("No commands have been timed yet")
+        else:
+            self._player.output.listing(
+                "Command statistics:",
+                ["  " + line for line in self._stats.summary()])
 
     def _get_help(self):
         """Displays all available commands to the user."""
-        help_text = textwrap.dedent("""
-        Available commands:
-            NUMBER_OF_VIDEOS - Shows how many videos are in the library.
-            SHOW_ALL_VIDEOS - Lists all videos from the library.
-            PLAY <video_id> - Plays specified video.
-            PLAY_RANDOM - Plays a random video from the library.
-            STOP - Stop the current video.
-            PAUSE - Pause the current video.
-            CONTINUE - Resume the current paused video.
-            SHOW_PLAYING - Displays the title, url and paused status of the video that is currently playing (or paused).
-            CREATE_PLAYLIST <playlist_name> - Creates a new (empty) playlist with the provided name.
-            ADD_TO_PLAYLIST <playlist_name> <video_id> - Adds the requested video to the playlist.
-            REMOVE_FROM_PLAYLIST <playlist_name> <video_id> - Removes the specified video from the specified playlist
-            CLEAR_PLAYLIST <playlist_name> - Removes all the videos from the playlist.
-            DELETE_PLAYLIST <playlist_name> - Deletes the playlist.
-            SHOW_PLAYLIST <playlist_name> - List all the videos in this playlist.
-            SHOW_ALL_PLAYLISTS - Display all the available playlists.
-            SEARCH_VIDEOS <search_term> - Display all the videos whose titles contain the search_term.
-            SEARCH_VIDEOS_WITH_TAG <tag_name> -Display all videos whose tags contains the provided tag.
-            FLAG_VIDEO <video_id> <flag_reason> - Mark a video as flagged.
-            ALLOW_VIDEO <video_id> - Removes a flag from a video.
-            PLAY_PLAYLIST <playlist_name> - Play specified video.
-            NEXT - Skip to the next video of the playlist.
-            SHOW_CURRENT_PLAYLIST - Displays the name of the playlist that is currently playing.
-            RATE_VIDEO <video_id> <rating> - Rate specified video.
-            SHOW_VIDEO_RATING <video_id> - Show rating of specified video.
-            SHOW_VIDEOS_BY_RATING - Show videos by rating
-            UNDO - Undo the previous command.
-            HELP - Displays help.
-            EXIT - Terminates the program execution.
-        """)
-        print(help_text)
+        lines = [f"    {entry.syntax} - {entry.description}"
+                 for entry in self._commands.values()]
+        # HELP comes last among the commands, followed by EXIT.
+        lines.append(lines.pop(list(self._commands).index("HELP")))
+        self._player.output.write(
+            "\nAvailable commands:\n"
+            + "".join(line + "\n" for line in lines)
+            + f"    {_EXIT_HELP}\n\n")
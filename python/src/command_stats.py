@@ -0,0 +1,153 @@
+"""Call counts and latency histograms of the commands a parser executes."""
+
+from collections import namedtuple
+from pathlib import Path
+import json
+import os
+import threading
+
+
+# Latencies are counted in buckets doubling in width: bucket 0 holds the
+# runs faster than 1024ns, bucket n those taking [512 << n, 1024 << n) ns.
+# The last bucket also holds anything slower.
+_BUCKET_SHIFT = 10
+_BUCKET_COUNT = 32
+
+CommandTimings = namedtuple(
+    "CommandTimings", ["count", "total_ns", "max_ns", "histogram"])
+CommandTimings.__doc__ = """The latencies recorded for one command.
+
+count: How many times the command was executed.
+total_ns: The time all of its runs took, in nanoseconds.
+max_ns: The time its slowest run took, in nanoseconds.
+histogram: How many runs fell in each latency bucket, see bucket_bound().
+"""
+
+
+def bucket_bound(bucket):
+    """Returns the latency in nanoseconds every run in the bucket is under.
+
+    The last bucket has no bound: None is returned for it.
+    """
+    if bucket == _BUCKET_COUNT - 1:
+        return None
+    return 1 << (_BUCKET_SHIFT + bucket)
+
+
+def _format_ns(nanoseconds):
+    if nanoseconds < 1_000_000:
+        return f"{nanoseconds / 1000:.1f}us"
+    if nanoseconds < 1_000_000_000:
+        return f"{nanoseconds / 1_000_000:.1f}ms"
+    return f"{nanoseconds / 1_000_000_000:.2f}s"
+
+
+class CommandStats:
+    """A class used to collect how long the commands of a parser take.
+
+    A CommandParser given a CommandStats records the run time of every
+    command it executes, including the commands that fail and the time
+    spent waiting for the answer to a prompt. The same CommandStats can be
+    given to several parsers, e.g. to every session of a server.
+
+    Each command keeps a call count, a total, a maximum and a histogram of
+    power-of-two buckets, so recording a run costs a few integer
+    operations and percentiles are known to within a factor of two.
+    """
+
+    def __init__(self, dump_path=None):
+        """CommandStats constructor.
+
+        Args:
+            dump_path: The file dump() writes to by default, if any.
+        """
+        self._dump_path = dump_path
+        self._lock = threading.Lock()
+        # [count, total_ns, max_ns, histogram] by command name.
+        self._commands = {}
+
+    def record(self, name, elapsed_ns):
+        """Records that a run of the named command took elapsed_ns."""
+        bucket = min((elapsed_ns >> _BUCKET_SHIFT).bit_length(),
+                     _BUCKET_COUNT - 1)
+        with self._lock:
+            timings = self._commands.get(name)
+            if timings is None:
+                timings = self._commands[name] = [
+                    0, 0, 0, [0] * _BUCKET_COUNT]
+            timings[0] += 1
+            timings[1] += elapsed_ns
+            if elapsed_ns > timings[2]:
+                timings[2] = elapsed_ns
+            timings[3][bucket] += 1
+
+    def timings(self):
+        """Returns the CommandTimings of every command run, by name."""
+        with self._lock:
+            return {name: CommandTimings(count, total_ns, max_ns,
+                                         tuple(histogram))
+                    for name, (count, total_ns, max_ns, histogram)
+                    in sorted(self._commands.items())}
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self._commands = {}
+
+    @staticmethod
+    def percentile(timings, fraction):
+        """Returns a bound in nanoseconds on a percentile of the runs.
+
+        Args:
+            timings: The CommandTimings of a command.
+            fraction: Which percentile, e.g. 0.99 for the 99th.
+
+        Returns:
+            The upper bound of the bucket the percentile falls in, or the
+            slowest run if that is faster.
+        """
+        rank = fraction * timings.count
+        seen = 0
+        for bucket, count in enumerate(timings.histogram):
+            seen += count
+            if count and seen >= rank:
+                bound = bucket_bound(bucket)
+                if bound is None:
+                    return timings.max_ns
+                return min(bound, timings.max_ns)
+        return timings.max_ns
+
+    def summary(self):
+        """Returns one line per command run, as shown by STATS."""
+        lines = []
+        for name, timings in self.timings().items():
+            lines.append(
+                f"{name}: {timings.count} calls, mean "
+                f"{_format_ns(timings.total_ns // timings.count)}, p50 <= "
+                f"{_format_ns(self.percentile(timings, 0.5))}, p99 <= "
+                f"{_format_ns(self.percentile(timings, 0.99))}, max "
+                f"{_format_ns(timings.max_ns)}")
+        return lines
+
+    def dump(self, path=None):
+        """Writes everything recorded so far to a JSON file.
+
+        The file maps command names to their count, total_ns, max_ns and
+        histogram, along with the bucket bounds of the histograms, null for
+        the last bucket. It is replaced atomically, so it can be read while
+        a process dumps to it.
+
+        Args:
+            path: The file to write, the dump_path given to the
+                constructor by default.
+        """
+        path = Path(self._dump_path if path is None else path)
+        text = json.dumps({
+            "bucket_bounds_ns": [bucket_bound(bucket)
+                                 for bucket in range(_BUCKET_COUNT)],
+            "commands": {name: timings._asdict()
+                         for name, timings in self.timings().items()},
+        })
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(text + "\n")
+        os.replace(temp_path, path)
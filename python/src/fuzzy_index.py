@@ -0,0 +1,136 @@
+"""Typo-tolerant lookup of the words of video titles."""
+
+from collections import namedtuple
+import re
+
+
+_WORD = re.compile(r"\w+")
+
+WordIndex = namedtuple("WordIndex", ["tree", "postings"])
+WordIndex.__doc__ = """The words of the titles of a library.
+
+tree: A BKTree of every distinct word of the lowercased titles.
+postings: Maps every word to the positions of the videos whose titles
+    have it, in library order, or None if the library looks them up
+    itself.
+"""
+
+
+def title_words(folded_title):
+    """Returns the words of a lowercased title, in order."""
+    return _WORD.findall(folded_title)
+
+
+def max_typos(word):
+    """Returns how many edits a word may be away from a match.
+
+    Short words match exactly, since one edit already turns them into
+    many other words; longer words may have one or two typos. Two words
+    match if they are within the typos allowed for both.
+    """
+    if len(word) <= 2:
+        return 0
+    if len(word) <= 5:
+        return 1
+    return 2
+
+
+def edit_distance(first, second):
+    """Returns the Levenshtein distance between two strings.
+
+    Uses the bit-parallel algorithm of Myers, as formulated by Hyyro: a
+    column of the distance matrix is kept as bit vectors of the +1 and -1
+    differences between its cells, one bit per character of the shorter
+    string, and advanced a whole column at a time.
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    if not second:
+        return len(first)
+    char_bits = {}
+    for index, char in enumerate(second):
+        char_bits[char] = char_bits.get(char, 0) | (1 << index)
+    mask = (1 << len(second)) - 1
+    last = 1 << (len(second) - 1)
+    plus, minus, distance = mask, 0, len(second)
+    for char in first:
+        matches = char_bits.get(char, 0)
+        vertical = matches | minus
+        horizontal = ((((matches & plus) + plus) ^ plus) | matches) & mask
+        horizontal_plus = (minus | ~(horizontal | plus)) & mask
+        horizontal_minus = plus & horizontal
+        if horizontal_plus & last:
+            distance += 1
+        elif horizontal_minus & last:
+            distance -= 1
+        horizontal_plus = ((horizontal_plus << 1) | 1) & mask
+        horizontal_minus = (horizontal_minus << 1) & mask
+        plus = (horizontal_minus | ~(vertical | horizontal_plus)) & mask
+        minus = horizontal_plus & vertical
+    return distance
+
+
+class BKTree:
+    """A class used to find the words within an edit distance of a word.
+
+    A BK-tree keeps every word under a parent at the distance between the
+    two. By the triangle inequality, the words within max_distance of a
+    query can only be under children whose distance to their parent is
+    within max_distance of the query's distance to the parent, so a search
+    only computes distances to a small part of the words.
+    """
+
+    def __init__(self, words=()):
+        """BKTree constructor.
+
+        Args:
+            words: The words to start with; duplicates are ignored.
+        """
+        # Every node is [word, {distance: child node}].
+        self._root = None
+        self._size = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, word):
+        """Adds a word to the tree unless it is there already."""
+        if self._root is None:
+            self._root = [word, {}]
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self._size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """Returns the words at most max_distance edits away from word.
+
+        Returns:
+            A list of (word, distance) pairs, in no particular order.
+        """
+        if self._root is None:
+            return []
+        found = []
+        nodes = [self._root]
+        while nodes:
+            node_word, children = nodes.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance:
+                found.append((node_word, distance))
+            for child_distance in range(max(1, distance - max_distance),
+                                        distance + max_distance + 1):
+                child = children.get(child_distance)
+                if child is not None:
+                    nodes.append(child)
+        return found
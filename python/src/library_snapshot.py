@@ -0,0 +1,243 @@
+"""A compiled snapshot of a video library file."""
+
+from array import array
+from collections import namedtuple
+from pathlib import Path
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+
+_MAGIC = b"YTLIBSNP"
+_VERSION = 4
+
+# Magic, format version, byte order of the integer arrays, then the size
+# and modification time of the source file as stamped before it was
+# parsed, the SHA-256 of the chunk hashes of the bytes parsed, and the
+# number of chunks. The end offset of every chunk follows the section
+# table.
+_HEADER = struct.Struct("<8sH6sQQ32sQ")
+
+# Sections in file order. Every section starts with its element count and
+# is padded to a multiple of eight bytes.
+_SECTIONS = (
+    ("titles", "strings"),
+    ("video_ids", "strings"),
+    ("tags", "strings"),
+    ("video_tags", "ragged"),
+    ("title_order", "positions"),
+    ("tag_names", "strings"),
+    ("tag_postings", "postings"),
+    ("grams", "strings"),
+    ("gram_postings", "postings"),
+)
+
+# Offset and length of every section, right after the header.
+_SECTION_TABLE = struct.Struct("<" + "QQ" * len(_SECTIONS))
+_COUNT = struct.Struct("=Q")
+
+LibrarySnapshot = namedtuple(
+    "LibrarySnapshot", [name for name, _ in _SECTIONS])
+LibrarySnapshot.__doc__ = """The parsed contents and indexes of a library.
+
+titles, video_ids: One entry per video, in library order.
+tags: Every distinct tag, as written in the source file.
+video_tags: The offsets and refs of the video tags, as kept by VideoStore.
+title_order: Video positions sorted by title.
+tag_names, tag_postings: Sorted lowercased tags and, for each, the
+    positions of the videos carrying it in title order.
+grams, gram_postings: The keys of the title substring index and, for
+    each, the positions of the videos whose title contains it, ordered by
+    where it first occurs in the title.
+"""
+
+
+def snapshot_path(source_path):
+    """Returns the path of the snapshot kept next to a library file."""
+    source_path = Path(source_path)
+    return source_path.with_name(source_path.name + ".snap")
+
+
+def chunk_hash(data):
+    """Returns the hash of the bytes of a chunk of a library file."""
+    return hashlib.sha256(data).digest()
+
+
+def _combined_hash(chunk_hashes):
+    return hashlib.sha256(b"".join(chunk_hashes)).digest()
+
+
+def _source_hash(source_path, ends):
+    """Returns the hash of a library file cut into chunks ending at ends."""
+    chunk_hashes = []
+    with open(source_path, "rb") as source_file:
+        start = 0
+        for end in ends:
+            digest = hashlib.sha256()
+            while start < end:
+                block = source_file.read(min(1 << 20, end - start))
+                if not block:
+                    break
+                digest.update(block)
+                start += len(block)
+            chunk_hashes.append(digest.digest())
+    return _combined_hash(chunk_hashes)
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 8)
+
+
+def _pack_strings(strings):
+    offsets = array("Q", [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+    return (_COUNT.pack(len(strings)) + offsets.tobytes()
+            + "".join(strings).encode("utf-8"))
+
+
+def _pack_ragged(columns):
+    offsets, values = columns
+    return (_COUNT.pack(len(offsets) - 1) + array("Q", offsets).tobytes()
+            + array("I", values).tobytes())
+
+
+def _pack_postings(postings):
+    offsets = array("Q", [0])
+    values = array("I")
+    for positions in postings:
+        values.extend(positions)
+        offsets.append(len(values))
+    return _pack_ragged((offsets, values))
+
+
+def _unpack_strings(view):
+    count = _COUNT.unpack_from(view)[0]
+    end = _COUNT.size + (count + 1) * 8
+    offsets = view[_COUNT.size:end].cast("Q")
+    text = str(view[end:], "utf-8").rstrip("\0")
+    return [text[start:stop] for start, stop in zip(offsets, offsets[1:])]
+
+
+def _unpack_ragged(view):
+    count = _COUNT.unpack_from(view)[0]
+    end = _COUNT.size + (count + 1) * 8
+    offsets = view[_COUNT.size:end].cast("Q")
+    return offsets, view[end:end + offsets[-1] * 4].cast("I")
+
+
+def _unpack_postings(view):
+    offsets, values = _unpack_ragged(view)
+    return [values[start:stop] for start, stop in zip(offsets, offsets[1:])]
+
+
+_PACKERS = {
+    "strings": _pack_strings,
+    "ragged": _pack_ragged,
+    "postings": _pack_postings,
+    "positions": lambda positions: (
+        _COUNT.pack(len(positions)) + array("I", positions).tobytes()),
+}
+
+_UNPACKERS = {
+    "strings": _unpack_strings,
+    "ragged": _unpack_ragged,
+    "postings": _unpack_postings,
+    "positions": lambda view: view[_COUNT.size:].cast("I")[
+        :_COUNT.unpack_from(view)[0]].tolist(),
+}
+
+
+def write_snapshot(source_path, snapshot, stamp, source_chunks):
+    """Compiles a snapshot next to the library file it was parsed from.
+
+    The snapshot is written to a temporary file first and then moved into
+    place, so readers never see a partially written one. Failing to write
+    it, e.g. in a read-only directory, is not an error.
+
+    Args:
+        source_path: The library file the snapshot was parsed from.
+        snapshot: The LibrarySnapshot to write.
+        stamp: The size and modification time of the library file, taken
+            before it was parsed.
+        source_chunks: (end, hash) of every chunk the library file was
+            parsed in, end being the offset where the chunk ends and hash
+            the chunk_hash() of the bytes parsed.
+    """
+    source_path = Path(source_path)
+    target = snapshot_path(source_path)
+    temporary = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    ends = array("Q", (end for end, _ in source_chunks))
+    try:
+        sections = [_pad(_PACKERS[kind](getattr(snapshot, name)))
+                    for name, kind in _SECTIONS]
+        table = []
+        offset = _HEADER.size + _SECTION_TABLE.size + len(ends) * 8
+        offset += -offset % 8
+        start = offset
+        for section in sections:
+            table += [offset, len(section)]
+            offset += len(section)
+        with open(temporary, "wb") as snapshot_file:
+            snapshot_file.write(_HEADER.pack(
+                _MAGIC, _VERSION, sys.byteorder.encode("ascii"), *stamp,
+                _combined_hash(hash for _, hash in source_chunks), len(ends)))
+            snapshot_file.write(_SECTION_TABLE.pack(*table))
+            snapshot_file.write(ends.tobytes())
+            snapshot_file.write(b"\0" * (start - snapshot_file.tell()))
+            for section in sections:
+                snapshot_file.write(section)
+        os.replace(temporary, target)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+def read_snapshot(source_path):
+    """Loads the snapshot of a library file if it is still up to date.
+
+    The snapshot is memory-mapped and its postings are returned as
+    read-only views of the mapping rather than copied. It is used when the
+    size of the library file is unchanged and either its modification time
+    or its content hash matches the one the snapshot was compiled from.
+
+    Args:
+        source_path: The library file.
+
+    Returns:
+        The LibrarySnapshot, or None if there is no usable snapshot.
+    """
+    source_path = Path(source_path)
+    try:
+        stat = source_path.stat()
+        with open(snapshot_path(source_path), "rb") as snapshot_file:
+            # The mapping stays open for as long as views of it are alive.
+            mapped = mmap.mmap(snapshot_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        return _parse(source_path, stat, mapped)
+    except (OSError, ValueError, IndexError, TypeError, struct.error):
+        return None
+
+
+def _parse(source_path, stat, mapped):
+    magic, version, byteorder, size, mtime_ns, source_hash, chunks = (
+        _HEADER.unpack_from(mapped))
+    if (magic != _MAGIC or version != _VERSION
+            or byteorder.rstrip(b"\0") != sys.byteorder.encode("ascii")
+            or size != stat.st_size):
+        return None
+    if mtime_ns != stat.st_mtime_ns:
+        ends_offset = _HEADER.size + _SECTION_TABLE.size
+        ends = memoryview(mapped)[ends_offset:ends_offset + chunks * 8]
+        if source_hash != _source_hash(source_path, ends.cast("Q")):
+            return None
+    table = _SECTION_TABLE.unpack_from(mapped, _HEADER.size)
+    view = memoryview(mapped)
+    return LibrarySnapshot(*(
+        _UNPACKERS[kind](view[offset:offset + length])
+        for (_, kind), offset, length
+        in zip(_SECTIONS, table[::2], table[1::2])))
@@ -0,0 +1,123 @@
+"""Output sinks the video player writes to."""
+
+from collections import namedtuple
+import sys
+import threading
+
+
+Listing = namedtuple("Listing", ["header", "lines", "videos"])
+Listing.__doc__ = """A listing written by the player.
+
+header: The line introducing the listing.
+lines: One line per listed item.
+videos: The listed Video objects, in the same order, if the items are
+    videos; empty otherwise.
+"""
+
+
+class OutputSink:
+    """A class used to receive what the video player writes.
+
+    The player writes single-line messages and listings. Text sinks only
+    have to implement write(), which gets the text of a whole message or
+    listing at once.
+    """
+
+    def message(self, text):
+        """Writes a single-line message."""
+        self.write(text + "\n")
+
+    def listing(self, header, lines, videos=()):
+        """Writes a header followed by the lines of a listing.
+
+        Args:
+            header: The line introducing the listing, or None.
+            lines: One line per listed item.
+            videos: The listed Video objects, if the items are videos.
+        """
+        if header is not None:
+            lines = [header, *lines]
+        if lines:
+            self.write("\n".join(lines) + "\n")
+
+    def write(self, text):
+        """Writes text made of complete lines."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Makes sure everything written so far has been delivered."""
+
+
+class TextSink(OutputSink):
+    """A sink writing straight to a text stream, sys.stdout by default."""
+
+    def __init__(self, stream=None):
+        self._stream = stream
+
+    def write(self, text):
+        # sys.stdout is looked up on every write so that redirecting it,
+        # e.g. with contextlib.redirect_stdout, is honoured.
+        (sys.stdout if self._stream is None else self._stream).write(text)
+
+    def flush(self):
+        (sys.stdout if self._stream is None else self._stream).flush()
+
+
+class BufferedSink(OutputSink):
+    """A sink collecting text and writing it to a stream in large chunks."""
+
+    def __init__(self, stream=None, buffer_size=1 << 16):
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._chunks = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._chunks.append(text)
+            self._buffered += len(text)
+            if self._buffered >= self._buffer_size:
+                self._write_chunks()
+
+    def flush(self):
+        with self._lock:
+            self._write_chunks()
+            (sys.stdout if self._stream is None else self._stream).flush()
+
+    def _write_chunks(self):
+        if self._chunks:
+            stream = sys.stdout if self._stream is None else self._stream
+            stream.write("".join(self._chunks))
+            self._chunks.clear()
+            self._buffered = 0
+
+
+class ListSink(OutputSink):
+    """A sink keeping every line written in a list."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.extend(text.splitlines())
+
+
+class RecordingSink(OutputSink):
+    """A sink keeping what is written as results rather than text.
+
+    Every message is kept as a string and every listing as a Listing, so
+    callers embedding the player can use them without parsing any text.
+    """
+
+    def __init__(self):
+        self.results = []
+
+    def message(self, text):
+        self.results.append(text)
+
+    def listing(self, header, lines, videos=()):
+        self.results.append(Listing(header, tuple(lines), tuple(videos)))
+
+    def write(self, text):
+        self.results.extend(text.splitlines())
@@ -2,13 +2,34 @@
 from .video_player import VideoPlayer
 from .command_parser import CommandException
 from .command_parser import CommandParser
+from .command_stats import CommandStats
+from .output_sink import BufferedSink
+from .sqlite_library import SQLiteVideoLibrary
+import argparse
+import contextlib
+import io
+import sys
+import time
 
 
-if __name__ == "__main__":
+# Size of the buffer batch runs write their output through.
+_BATCH_BUFFER_SIZE = 1 << 20
+
+
+def run_interactive(state_path=None, library=None, stats=None):
+    """Reads commands from the terminal until the user enters EXIT.
+
+    Args:
+        state_path: The state log keeping playlists, flags and ratings
+            across runs, if any.
+        library: The library to play from, the shared VideoLibrary by
+            default.
+        stats: The CommandStats timing the commands, if any.
+    """
     print("""Hello and welcome to YouTube, what would you like to do?
     Enter HELP for list of available commands or EXIT to terminate.""")
-    video_player = VideoPlayer()
-    parser = CommandParser(video_player)
+    video_player = VideoPlayer(library=library, state_path=state_path)
+    parser = CommandParser(video_player, stats)
     while True:
         command = input("YT> ")
         if command.upper() == "EXIT":
@@ -17,5 +38,107 @@ if __name__ == "__main__":
             parser.execute_command(command.split())
         except CommandException as e:
             print(e)
+    video_player.close()
     print("YouTube has now terminated its execution. "
           "Thank you and goodbye!")
+
+
+def run_batch(script, output, state_path=None, library=None, stats=None):
+    """Runs a script of commands, one per line, until its end or EXIT.
+
+    Everything the commands write goes to output. Prompts such as the one
+    after a search are answered by the next line of the script. Blank
+    lines, and comment lines starting with "#", are skipped.
+
+    Args:
+        script: An iterable of command lines.
+        output: A text stream to write the output to.
+        state_path: The state log keeping playlists, flags and ratings
+            across runs, if any.
+        library: The library to play from, the shared VideoLibrary by
+            default.
+        stats: The CommandStats timing the commands, if any.
+
+    Returns:
+        The number of commands run, not counting skipped lines.
+    """
+    lines = iter(script)
+    sink = BufferedSink(output)
+    video_player = VideoPlayer(
+        ask=lambda prompt: next(lines, "").rstrip("\n"), output=sink,
+        library=library, state_path=state_path)
+    parser = CommandParser(video_player, stats)
+    count = 0
+    for line in lines:
+        command = line.split()
+        if not command or command[0].startswith("#"):
+            continue
+        if command[0].upper() == "EXIT":
+            break
+        count += 1
+        try:
+            parser.execute_command(command)
+        except CommandException as e:
+            sink.message(str(e))
+    video_player.close()
+    sink.flush()
+    return count
+
+
+def main(argv=None):
+    """Runs the simulator, interactively unless given a script."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "script", nargs="?",
+        help="run the commands in this file instead of prompting for them, "
+             "'-' to read them from standard input")
+    arg_parser.add_argument(
+        "--state", metavar="PATH",
+        help="keep playlists, flags and ratings in this file across runs")
+    arg_parser.add_argument(
+        "--database", metavar="PATH",
+        help="keep the library in this SQLite database, built from the "
+             "library file if needed, instead of in memory")
+    arg_parser.add_argument(
+        "--stats", metavar="PATH",
+        help="time every command and write the latencies to this file "
+             "on exit")
+    args = arg_parser.parse_args(argv)
+    library = None
+    if args.database is not None:
+        library = SQLiteVideoLibrary(args.database)
+    stats = None if args.stats is None else CommandStats(args.stats)
+    try:
+        _run(args, library, stats)
+    finally:
+        if stats is not None:
+            stats.dump()
+
+
+def _run(args, library, stats):
+    """Runs the simulator as the command line arguments say."""
+    if args.script is None:
+        run_interactive(args.state, library, stats)
+        return
+
+    output = io.TextIOWrapper(
+        io.BufferedWriter(io.FileIO(sys.stdout.fileno(), "w", closefd=False),
+                          buffer_size=_BATCH_BUFFER_SIZE),
+        encoding=sys.stdout.encoding, errors=sys.stdout.errors)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if args.script == "-":
+            script = sys.stdin
+        else:
+            script = stack.enter_context(open(args.script))
+        sys.stdout.flush()
+        count = run_batch(script, output, args.state, library, stats)
+        output.flush()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    print(f"Ran {count} commands in {elapsed:.3f}s ({rate:.0f} commands/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
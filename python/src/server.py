@@ -0,0 +1,190 @@
+"""A youtube simulator serving many users over TCP or Unix sockets."""
+from .video_library import VideoLibrary
+from .video_player import VideoPlayer
+from .command_parser import CommandException
+from .command_parser import CommandParser
+from .command_stats import CommandStats
+from .output_sink import OutputSink
+import argparse
+import asyncio
+import logging
+
+
+# The longest command line a client may send.
+_LINE_LIMIT = 1 << 16
+
+# A connection's commands are not run while more than this many bytes of
+# its output wait to be sent, so a slow client cannot make the server
+# buffer an unbounded amount of output for it.
+_WRITE_HIGH_WATER = 1 << 18
+
+_GREETING = """Hello and welcome to YouTube, what would you like to do?
+    Enter HELP for list of available commands or EXIT to terminate."""
+
+_GOODBYE = "YouTube has now terminated its execution. Thank you and goodbye!"
+
+logger = logging.getLogger(__name__)
+
+
+class _ConnectionSink(OutputSink):
+    """A sink keeping the output of a connection until it is sent.
+
+    Commands run in worker threads, while the transport of the connection
+    may only be written from the event loop.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def take(self):
+        """Returns the output written since the last call, as bytes."""
+        text = "".join(self._parts)
+        self._parts = []
+        return text.encode()
+
+
+class Session:
+    """A class used to represent the session of one client connection.
+
+    Every session has a VideoPlayer of its own, so what is playing, the
+    playlists and the undo journal are kept per connection, while the
+    library is shared by every session of the server. A session keeps the
+    library as it was when it connected until it runs RELOAD_LIBRARY; the
+    first session to do so builds the reloaded library once, which the
+    sessions reloading after it and every new session share.
+
+    Commands run one at a time, each in a worker thread, so a slow one
+    such as RELOAD_LIBRARY, or one waiting for the state log to reach the
+    disk, does not hold up the other connections. After every command the
+    session sends its output and waits for the client to take it before
+    reading the next line, so a client that stops reading stops being
+    served.
+    """
+
+    def __init__(self, library, reader, writer, stats=None):
+        """Session constructor.
+
+        Args:
+            library: The VideoLibrary shared by the sessions.
+            reader: The asyncio StreamReader of the connection.
+            writer: The asyncio StreamWriter of the connection.
+            stats: The CommandStats shared by the sessions, if any.
+        """
+        self._reader = reader
+        self._writer = writer
+        self._output = _ConnectionSink()
+        # Prompts are left open and answered by the next line received.
+        self._player = VideoPlayer(
+            ask=lambda prompt: None, output=self._output, library=library)
+        self._parser = CommandParser(self._player, stats)
+
+    async def run(self):
+        """Serves the client until it sends EXIT or disconnects."""
+        loop = asyncio.get_running_loop()
+        self._output.message(_GREETING)
+        while True:
+            await self._send()
+            try:
+                line = await self._reader.readline()
+            except ValueError:
+                self._output.message("Command is too long")
+                break
+            if not line:
+                break
+            text = line.decode(errors="replace").rstrip("\r\n")
+            command = text.split()
+            if (not self._player.awaiting_answer and command
+                    and command[0].upper() == "EXIT"):
+                self._output.message(_GOODBYE)
+                break
+            await loop.run_in_executor(None, self._execute, text, command)
+        await self._send()
+
+    async def _send(self):
+        """Sends the output written so far and waits for the client."""
+        self._writer.write(self._output.take())
+        await self._writer.drain()
+
+    def _execute(self, text, command):
+        """Answers the pending prompt with a line, or runs it as a command."""
+        if self._player.awaiting_answer:
+            self._player.answer(text)
+            return
+        try:
+            self._parser.execute_command(command)
+        except CommandException as e:
+            self._output.message(str(e))
+
+
+async def start_server(library=None, host=None, port=None, path=None,
+                       stats=None):
+    """Starts serving the command language on a TCP or a Unix socket.
+
+    Args:
+        library: The VideoLibrary to share between the sessions, a new
+            VideoLibrary by default.
+        host: The host to listen on, for TCP.
+        port: The port to listen on, for TCP.
+        path: The path of the Unix socket to listen on instead of TCP.
+        stats: The CommandStats timing the commands of every session, if
+            any.
+
+    Returns:
+        The asyncio Server, already serving.
+    """
+    if library is None:
+        library = VideoLibrary()
+
+    async def serve_client(reader, writer):
+        writer.transport.set_write_buffer_limits(high=_WRITE_HIGH_WATER)
+        try:
+            await Session(library, reader, writer, stats).run()
+        except ConnectionError:
+            pass
+        except Exception:
+            logger.exception("Session failed")
+        finally:
+            writer.close()
+
+    if path is not None:
+        return await asyncio.start_unix_server(
+            serve_client, path, limit=_LINE_LIMIT)
+    return await asyncio.start_server(
+        serve_client, host, port, limit=_LINE_LIMIT)
+
+
+def main(argv=None):
+    """Serves the simulator until interrupted."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--host", help="the host to listen on")
+    arg_parser.add_argument("--port", type=int, default=8023,
+                            help="the TCP port to listen on")
+    arg_parser.add_argument("--unix", metavar="PATH",
+                            help="listen on this Unix socket instead of TCP")
+    arg_parser.add_argument(
+        "--stats", metavar="PATH",
+        help="time every command and write the latencies to this file "
+             "on exit")
+    args = arg_parser.parse_args(argv)
+    stats = None if args.stats is None else CommandStats(args.stats)
+
+    async def serve():
+        server = await start_server(host=args.host, port=args.port,
+                                    path=args.unix, stats=stats)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stats is not None:
+            stats.dump()
+
+
+if __name__ == "__main__":
+    main()
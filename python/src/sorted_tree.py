@@ -0,0 +1,132 @@
+"""An immutable sorted collection with logarithmic updates."""
+
+
+# Every node is a tuple (key, left, right, height); an empty tree is None.
+_KEY, _LEFT, _RIGHT, _HEIGHT = range(4)
+
+
+def _height(node):
+    return node[_HEIGHT] if node is not None else 0
+
+
+def _node(key, left, right):
+    left_height, right_height = _height(left), _height(right)
+    return (key, left, right,
+            (left_height if left_height > right_height else right_height) + 1)
+
+
+def _balanced(key, left, right):
+    """Returns a node of key over left and right, rotated to stay balanced.
+
+    The heights of left and right differ by at most two.
+    """
+    left_height, right_height = _height(left), _height(right)
+    if left_height > right_height + 1:
+        left_key, left_left, left_right, _ = left
+        if _height(left_left) >= _height(left_right):
+            return _node(left_key, left_left, _node(key, left_right, right))
+        middle_key, middle_left, middle_right, _ = left_right
+        return _node(middle_key, _node(left_key, left_left, middle_left),
+                     _node(key, middle_right, right))
+    if right_height > left_height + 1:
+        right_key, right_left, right_right, _ = right
+        if _height(right_right) >= _height(right_left):
+            return _node(right_key, _node(key, left, right_left), right_right)
+        middle_key, middle_left, middle_right, _ = right_left
+        return _node(middle_key, _node(key, left, middle_left),
+                     _node(right_key, middle_right, right_right))
+    return _node(key, left, right)
+
+
+def _insert(node, key):
+    if node is None:
+        return (key, None, None, 1)
+    node_key, left, right, _ = node
+    if key < node_key:
+        return _balanced(node_key, _insert(left, key), right)
+    return _balanced(node_key, left, _insert(right, key))
+
+
+def _pop_first(node):
+    """Returns the smallest key under node and the node without it."""
+    node_key, left, right, _ = node
+    if left is None:
+        return node_key, right
+    first, left = _pop_first(left)
+    return first, _balanced(node_key, left, right)
+
+
+def _remove(node, key):
+    if node is None:
+        raise KeyError(key)
+    node_key, left, right, _ = node
+    if key < node_key:
+        return _balanced(node_key, _remove(left, key), right)
+    if node_key < key:
+        return _balanced(node_key, left, _remove(right, key))
+    if left is None:
+        return right
+    if right is None:
+        return left
+    first, right = _pop_first(right)
+    return _balanced(first, left, right)
+
+
+def _from_sorted(keys, start, end):
+    if start == end:
+        return None
+    middle = (start + end) // 2
+    return _node(keys[middle], _from_sorted(keys, start, middle),
+                 _from_sorted(keys, middle + 1, end))
+
+
+class SortedTree:
+    """A class used to keep distinct keys sorted, as an immutable value.
+
+    It is a persistent AVL tree: adding or removing a key returns a new
+    tree in O(log n), sharing all but O(log n) nodes with the old one,
+    which is left as it was. Copying a tree is therefore free, and a
+    reader can walk a tree while writers move on to newer ones.
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, keys=()):
+        """SortedTree constructor.
+
+        Args:
+            keys: The distinct keys to start with, in any order.
+        """
+        keys = sorted(keys)
+        self._root = _from_sorted(keys, 0, len(keys))
+        self._size = len(keys)
+
+    @classmethod
+    def _of(cls, root, size):
+        tree = cls.__new__(cls)
+        tree._root = root
+        tree._size = size
+        return tree
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """Yields the keys in ascending order."""
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node[_LEFT]
+            node = stack.pop()
+            yield node[_KEY]
+            node = node[_RIGHT]
+
+    def add(self, key):
+        """Returns a tree with key added; key must not be in this one."""
+        return self._of(_insert(self._root, key), self._size + 1)
+
+    def remove(self, key):
+        """Returns a tree without key; KeyError if it is not in this one."""
+        return self._of(_remove(self._root, key), self._size - 1)
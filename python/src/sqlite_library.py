@@ -0,0 +1,570 @@
+"""A video library kept in a SQLite database."""
+
+from .fuzzy_index import BKTree, WordIndex, title_words
+from .sorted_tree import SortedTree
+from .video import Video
+from .video_library import (
+    LibraryChanges, VideoLibrary, _DEFAULT_VIDEOS_PATH, _LazyIndex,
+    _read_videos, _source_stamp)
+from .video_store import VideoStoreOverlay
+from pathlib import Path
+import functools
+import itertools
+import os
+import sqlite3
+import threading
+
+
+# Rows of the videos table kept in memory by each store.
+_ROW_CACHE_SIZE = 1 << 14
+
+# Rows inserted per statement while building the database.
+_BATCH_SIZE = 10000
+
+_SCHEMA = """
+CREATE TABLE source (size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+                     title_search INTEGER NOT NULL);
+CREATE TABLE videos (
+    position INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    folded_title TEXT NOT NULL,
+    tags TEXT NOT NULL
+);
+CREATE TABLE video_tags (
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (tag, position)
+) WITHOUT ROWID;
+"""
+
+_INDEXES = """
+CREATE INDEX videos_by_id ON videos (video_id);
+CREATE INDEX videos_by_title ON videos (title, position);
+"""
+
+# Substring index of the lowercased titles, where FTS5 is available.
+_TITLE_SEARCH = """
+CREATE VIRTUAL TABLE title_search USING fts5(
+    folded_title, content='videos', content_rowid='position',
+    tokenize='trigram case_sensitive 1');
+"""
+
+# Tags are separated by commas in the library file, so never contain one.
+_TAG_SEPARATOR = ","
+
+# Shortest term the trigram index can look up.
+_TRIGRAM_SIZE = 3
+
+# Rows fetched at a time from queries read lazily.
+_FETCH_SIZE = 256
+
+# Held while checking whether a database is current and building it.
+_build_lock = threading.Lock()
+
+
+def _connect_read_only(database_path, **kwargs):
+    return sqlite3.connect(
+        database_path.resolve().as_uri() + "?mode=ro", uri=True, **kwargs)
+
+
+def _fetch_lazily(cursor, lock):
+    """Yields the rows of a cursor, fetching them as they are needed."""
+    while True:
+        with lock:
+            rows = cursor.fetchmany(_FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def _last_of_each_id(rows):
+    """Yields the last of every run of rows with the same video_id."""
+    previous = None
+    for row in rows:
+        if previous is not None and previous[0] != row[0]:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+
+def _build(database_path, videos_path):
+    """Builds the database of a library file, replacing any older one."""
+    temp_path = database_path.with_name(database_path.name + ".tmp")
+    if temp_path.exists():
+        temp_path.unlink()
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.executescript(_SCHEMA)
+        try:
+            connection.executescript(_TITLE_SEARCH)
+            title_search = True
+        except sqlite3.OperationalError:
+            title_search = False
+        videos = enumerate(_read_videos(videos_path))
+        while True:
+            batch = list(itertools.islice(videos, _BATCH_SIZE))
+            if not batch:
+                break
+            connection.executemany(
+                "INSERT INTO videos VALUES (?, ?, ?, ?, ?)",
+                ((position, video_id, title, title.lower(),
+                  _TAG_SEPARATOR.join(tags))
+                 for position, (title, video_id, tags) in batch))
+            connection.executemany(
+                "INSERT INTO video_tags VALUES (?, ?)",
+                ((tag, position)
+                 for position, (_, _, tags) in batch
+                 for tag in {tag.lower() for tag in tags}))
+        connection.executescript(_INDEXES)
+        if title_search:
+            connection.execute(
+                "INSERT INTO title_search (title_search) VALUES ('rebuild')")
+        connection.execute("INSERT INTO source VALUES (?, ?, ?)",
+                           (*_source_stamp(videos_path), title_search))
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, database_path)
+
+
+class _SharedConnection:
+    """A read-only connection to a database, shared by libraries.
+
+    It counts the libraries using it and is closed once the last of them
+    has moved on to another database.
+    """
+
+    def __init__(self, database_path):
+        self.connection = _connect_read_only(
+            database_path, check_same_thread=False)
+        # Held while using the connection.
+        self.lock = threading.Lock()
+        self._users = 1
+
+    def share(self):
+        """Counts one more library using the connection."""
+        with self.lock:
+            self._users += 1
+
+    def release(self):
+        """Counts one library less, closing the connection after the last."""
+        with self.lock:
+            self._users -= 1
+            if not self._users:
+                self.connection.close()
+
+
+class SQLiteVideoStore:
+    """A class used to read the videos of a library from its database.
+
+    It offers the reading side of VideoStore, fetching videos by position
+    and keeping the most recently used ones in memory. The videos it holds
+    are neither flagged nor rated: flags and ratings are kept in a
+    VideoStoreOverlay over it.
+    """
+
+    def __init__(self, connection, lock):
+        """SQLiteVideoStore constructor.
+
+        Args:
+            connection: The sqlite3 connection to the library database.
+            lock: The lock to hold while using the connection.
+        """
+        self._connection = connection
+        self._lock = lock
+        self._length = self._query_one("SELECT count(*) FROM videos")[0]
+        self._row = functools.lru_cache(maxsize=_ROW_CACHE_SIZE)(self._fetch)
+
+    def _query_one(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchone()
+
+    def _fetch(self, position):
+        row = self._query_one(
+            "SELECT video_id, title, tags FROM videos WHERE position = ?",
+            (position,))
+        if row is None:
+            raise IndexError(position)
+        video_id, title, tags = row
+        return video_id, title, tuple(tags.split(_TAG_SEPARATOR)) if tags else ()
+
+    def __len__(self):
+        return self._length
+
+    def position(self, video_id):
+        """Returns the position of a video, or None if it is not stored."""
+        # Like VideoStore, the last video with a given id wins.
+        row = self._query_one(
+            "SELECT max(position) FROM videos WHERE video_id = ?", (video_id,))
+        return row[0]
+
+    def video_positions(self):
+        """Returns the (video_id, position) pairs of the stored videos."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT video_id, max(position) FROM videos"
+                " GROUP BY video_id ORDER BY 2").fetchall()
+
+    def title(self, position):
+        return self._row(position)[1]
+
+    def video_id(self, position):
+        return self._row(position)[0]
+
+    def tags(self, position):
+        return self._row(position)[2]
+
+    def flag_reason(self, position):
+        return None
+
+    def average_rating(self, position):
+        return 0
+
+    def rating_summary(self, position):
+        return None
+
+    def rating_record(self, position):
+        return None
+
+    def overlay(self):
+        """Returns a VideoStoreOverlay of this store."""
+        return VideoStoreOverlay(self)
+
+
+class SQLiteVideoLibrary(VideoLibrary):
+    """A class used to represent a Video Library kept in SQLite.
+
+    It answers like VideoLibrary, but the videos stay in a database built
+    next to the library file, so memory does not grow with the catalogue.
+    Videos are looked up by id through an index, titles are searched
+    through a trigram index of the lowercased titles, and tags through a
+    table indexed by lowercased tag. The title order is an index too.
+
+    Flags and ratings are kept in memory for the videos that have them,
+    like in the sessions of a VideoLibrary. A random playable video is
+    found by drawing videos until one is not flagged.
+    """
+
+    def __init__(self, database_path=None, videos_path=None):
+        """The SQLiteVideoLibrary class is initialized.
+
+        Args:
+            database_path: The database file, built from the library file
+                if it does not exist or the library file has changed since.
+                videos.db next to the library file by default.
+            videos_path: The library file, videos.txt next to the
+                video_library module by default.
+        """
+        videos_path = Path(
+            _DEFAULT_VIDEOS_PATH if videos_path is None else videos_path)
+        database_path = Path(
+            videos_path.with_suffix(".db") if database_path is None
+            else database_path)
+        with _build_lock:
+            if not self._is_current(database_path, videos_path):
+                _build(database_path, videos_path)
+        self._database_path = database_path
+        self._videos_path = videos_path
+        self._successor_lock = threading.Lock()
+        self._open()
+        self._create_locks()
+
+    def _open(self):
+        """Opens the database, with no video flagged nor rated yet."""
+        self._shared_connection = _SharedConnection(self._database_path)
+        self._connection = self._shared_connection.connection
+        self._connection_lock = self._shared_connection.lock
+        title_search, size, mtime_ns = self._query(
+            "SELECT title_search, size, mtime_ns FROM source")[0]
+        self._title_search = bool(title_search)
+        self._source_stamp = size, mtime_ns
+        # The videos are read from the database; flags and ratings are
+        # kept in an overlay.
+        self._store = SQLiteVideoStore(
+            self._connection, self._connection_lock).overlay()
+        self._rating_order = SortedTree()
+        self._flagged = 0
+        self._shares_rating_order = False
+        self._word_index = _LazyIndex(self._build_word_index)
+
+    def session(self):
+        """Returns a library with the videos and indexes of this one.
+
+        Flags and ratings are kept apart as in the sessions of a
+        VideoLibrary. The session reads from the same database connection
+        until it reloads.
+        """
+        session = super().session()
+        session._shared_connection.share()
+        return session
+
+    def reload(self):
+        """Applies the changes made to the library file since it was opened.
+
+        The database is built again from the file, unless another library
+        has done so already, and opened in place of the old one. The videos
+        get new positions there, so flags and ratings are moved over by
+        video_id, and Video objects handed out before must be looked up
+        again: the old connection is closed once no other library uses
+        it. New sessions of the library this one is a session of are
+        given the new database too.
+
+        Returns:
+            The LibraryChanges, or None if the file has not changed.
+        """
+        if _source_stamp(self._videos_path) == self._source_stamp:
+            return None
+        with _build_lock:
+            if not self._is_current(self._database_path, self._videos_path):
+                _build(self._database_path, self._videos_path)
+        old_store, old_connection = self._store, self._shared_connection
+        old_rows = self._latest_rows()
+        self._open()
+        changes = self._diff(old_rows, self._latest_rows())
+        rating_keys = []
+        for old_position in old_store.overlaid_positions():
+            position = self._store.position(old_store.video_id(old_position))
+            if position is None:
+                continue
+            reason = old_store.flag_reason(old_position)
+            if reason is not None:
+                self._store.set_flag(position, reason)
+                self._flagged += 1
+            record = old_store.rating_record(old_position)
+            if record is not None:
+                self._store.set_rating_record(position, record)
+                rating_keys.append(
+                    (-self._store.average_rating(position), position))
+        self._rating_order = SortedTree(rating_keys)
+        old_connection.release()
+        parent = self._parent
+        if parent is not None and parent._parent is None:
+            with parent._successor_lock:
+                latest = parent._latest()
+                if latest._source_stamp != self._source_stamp:
+                    latest._successor = type(self)(
+                        self._database_path, self._videos_path)
+        return changes
+
+    def _latest_rows(self):
+        """Returns the (video_id, position, title, tags) of the videos.
+
+        The rows come lazily by video_id, the last video of every id only.
+        """
+        return _last_of_each_id(self._rows(
+            "SELECT video_id, position, title, tags FROM videos"
+            " ORDER BY video_id, position"))
+
+    @staticmethod
+    def _diff(old_rows, new_rows):
+        """Returns the LibraryChanges between two databases.
+
+        Args:
+            old_rows, new_rows: The rows of the databases as given by
+                _latest_rows().
+        """
+        # Both go by video_id, so they are merged in one pass.
+        added, removed, changed = [], [], []
+        old, new = next(old_rows, None), next(new_rows, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[0] < new[0]):
+                removed.append(old[1::-1])
+                old = next(old_rows, None)
+            elif old is None or new[0] < old[0]:
+                added.append(new[1::-1])
+                new = next(new_rows, None)
+            else:
+                if old[2:] != new[2:]:
+                    changed.append(old[1::-1])
+                old, new = next(old_rows, None), next(new_rows, None)
+        return LibraryChanges(
+            *([video_id for _, video_id in sorted(video_ids)]
+              for video_ids in (added, removed, changed)))
+
+    @staticmethod
+    def _is_current(database_path, videos_path):
+        """Returns whether the database was built from the library file."""
+        if not database_path.exists():
+            return False
+        try:
+            connection = _connect_read_only(database_path)
+            try:
+                row = connection.execute(
+                    "SELECT size, mtime_ns FROM source").fetchone()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return False
+        return row == _source_stamp(videos_path)
+
+    def _query(self, sql, parameters=()):
+        with self._connection_lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _positions(self, sql, parameters=()):
+        return [position for position, in self._query(sql, parameters)]
+
+    def _rows(self, sql, parameters=()):
+        """Runs a query and returns an iterator fetching its rows lazily."""
+        lock = self._connection_lock
+        with lock:
+            cursor = self._connection.execute(sql, parameters)
+        return _fetch_lazily(cursor, lock)
+
+    def get_videos_by_title(self, offset=0, limit=None):
+        """Returns videos from the video library sorted by title.
+
+        Args:
+            offset: How many videos to skip from the start of the order.
+            limit: The most videos to return, all of them if None.
+        """
+        return self._videos(self._positions(
+            "SELECT position FROM videos ORDER BY title, position"
+            " LIMIT ? OFFSET ?", (-1 if limit is None else limit, offset)))
+
+    def search_titles(self, search_term):
+        """Returns the videos whose titles contain the search_term.
+
+        The match is case-insensitive and the videos are sorted by title,
+        videos with the same title keeping their library order.
+        """
+        term = search_term.lower()
+        if not term:
+            return self.get_videos_by_title()
+        condition, parameters = self._title_condition(term)
+        return self._videos(self._positions(
+            f"SELECT position FROM videos WHERE {condition}"
+            " ORDER BY title, position", parameters))
+
+    def _title_condition(self, term):
+        """Returns an SQL condition matching the titles containing term.
+
+        Args:
+            term: A non-empty lowercased search term.
+
+        Returns:
+            The condition and the parameters it takes.
+        """
+        if self._title_search and len(term) >= _TRIGRAM_SIZE:
+            phrase = '"' + term.replace('"', '""') + '"'
+            return ("position IN (SELECT rowid FROM title_search"
+                    " WHERE title_search MATCH ?) AND instr(folded_title, ?)",
+                    (phrase, term))
+        return "instr(folded_title, ?)", (term,)
+
+    def _title_matches(self, term):
+        condition, parameters = self._title_condition(term)
+        return self._positions(
+            f"SELECT position FROM videos WHERE {condition}", parameters)
+
+    def _build_word_index(self):
+        """Returns the WordIndex of the titles, without postings.
+
+        The titles are read through a connection of its own, so the
+        library can be used meanwhile.
+        """
+        words = set()
+        connection = _connect_read_only(self._database_path)
+        try:
+            cursor = connection.execute("SELECT folded_title FROM videos")
+            while True:
+                rows = cursor.fetchmany(_BATCH_SIZE)
+                if not rows:
+                    break
+                for folded_title, in rows:
+                    words.update(title_words(folded_title))
+        finally:
+            connection.close()
+        return WordIndex(BKTree(words), None)
+
+    def _word_positions(self, word_index, word):
+        condition, parameters = self._title_condition(word)
+        return [position for position, folded_title in self._query(
+                    "SELECT position, folded_title FROM videos"
+                    f" WHERE {condition}", parameters)
+                if word in title_words(folded_title)]
+
+    def _folded_title(self, position):
+        return self._store.title(position).lower()
+
+    def _title_offsets(self, term):
+        if not term:
+            yield from ((0, position) for position in range(len(self._store)))
+            return
+        condition, parameters = self._title_condition(term)
+        yield from self._rows(
+            "SELECT instr(folded_title, ?) - 1 AS offset, position FROM videos"
+            f" WHERE {condition} ORDER BY offset, position",
+            (term, *parameters))
+
+    def _tag_positions(self, tag_names):
+        tag_names = sorted(tag_names)
+        return (position for position, in self._rows(
+            "SELECT position FROM video_tags WHERE tag IN"
+            f" ({', '.join('?' * len(tag_names))})", tag_names))
+
+    def _in_title_order(self, positions):
+        return sorted(positions,
+                      key=lambda position: (self._store.title(position),
+                                            position))
+
+    def search_tags(self, video_tag, prefix=False):
+        """Returns the videos carrying the given tag, sorted by title.
+
+        Args:
+            video_tag: The tag to look for, matched case-insensitively.
+            prefix: Match every tag starting with video_tag instead of
+                only the tag itself.
+        """
+        tag = video_tag.lower()
+        if not prefix:
+            condition, parameters = "tag = ?", (tag,)
+        elif not tag:
+            condition, parameters = "1", ()
+        elif ord(tag[-1]) == 0x10FFFF:
+            condition, parameters = "tag >= ? AND substr(tag, 1, ?) = ?", (
+                tag, len(tag), tag)
+        else:
+            # The tags starting with tag sort between it and the same
+            # string with its last character incremented.
+            condition, parameters = "tag >= ? AND tag < ?", (
+                tag, tag[:-1] + chr(ord(tag[-1]) + 1))
+        return self._videos(self._positions(
+            "SELECT position FROM videos WHERE position IN"
+            f" (SELECT position FROM video_tags WHERE {condition})"
+            " ORDER BY title, position", parameters))
+
+    def get_random_playable_video(self, rng):
+        """Returns a random video that is not flagged.
+
+        Args:
+            rng: The random.Random instance to draw from.
+
+        Returns:
+            A Video object, or None if every video is flagged.
+        """
+        with self._playable_lock:
+            playable = len(self._store) - self._flagged
+        if not playable:
+            return None
+        if playable * 2 < len(self._store):
+            # Mostly flagged: pick among the playable videos directly.
+            index = rng.randrange(playable)
+            playable_positions = (
+                position for position in range(len(self._store))
+                if self._store.flag_reason(position) is None)
+            position = next(itertools.islice(playable_positions, index, None))
+        else:
+            while True:
+                position = rng.randrange(len(self._store))
+                if self._store.flag_reason(position) is None:
+                    break
+        return Video.view(self._store, position)
+
+    def _remove_playable(self, position):
+        self._flagged += 1
+
+    def _add_playable(self, position):
+        self._flagged -= 1
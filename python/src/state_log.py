@@ -0,0 +1,245 @@
+"""A write-ahead log of the changes made to a player's state."""
+
+from collections import namedtuple
+from pathlib import Path
+import json
+import os
+import threading
+
+
+# Longest time an appended record waits before it is synced to disk. The
+# records appended in the meantime are synced together.
+_SYNC_INTERVAL = 0.005
+
+PlayerState = namedtuple("PlayerState", ["playlists", "flags", "ratings"])
+PlayerState.__doc__ = """The durable state of a player.
+
+playlists: (name, video_ids) for every playlist, in creation order.
+flags: (video_id, reason) for every flagged video.
+ratings: (video_id, record) for every rated video, record being the list
+    returned by VideoStore.rating_record().
+"""
+
+
+def _write_atomically(path, text):
+    """Replaces a file with the given text, so it is never seen half written."""
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "w") as temp_file:
+        temp_file.write(text)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+    _sync_directory(path)
+
+
+def _sync_directory(path):
+    """Makes a rename in the directory of path durable, where supported."""
+    try:
+        fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StateLog:
+    """A class used to make a player's state survive restarts.
+
+    Every change is appended to the log as one JSON line, such as
+    ["add", "my_playlist", "funny_dogs_video_id"]. Appending only writes to
+    a buffer; a background thread syncs the log to disk shortly after,
+    with one fsync for all the records appended in the meantime. sync()
+    waits until everything appended so far is on disk.
+
+    compact() writes the whole state to a snapshot next to the log and
+    starts the log afresh. The first line of the log holds its generation,
+    which the snapshot records too: a log older than the snapshot, left by
+    a crash during compaction, is ignored when loading.
+    """
+
+    def __init__(self, path, sync_interval=_SYNC_INTERVAL):
+        """StateLog constructor. Opens the log, creating it if needed.
+
+        Args:
+            path: The log file. The snapshot is kept next to it, with a
+                ".snapshot" suffix.
+            sync_interval: How long appended records may wait to be
+                synced, in seconds.
+        """
+        self._path = Path(path)
+        self._snapshot_path = self._path.with_name(
+            self._path.name + ".snapshot")
+        self._sync_interval = sync_interval
+        self._condition = threading.Condition()
+        # Counts of records ever appended, synced and compacted. They only
+        # grow, so a sync() waiting for a count outlives compactions.
+        self._appended = 0
+        self._synced = 0
+        self._compacted = 0
+        self._syncing = False
+        self._closed = False
+        self._state, self._records, self._generation = self._load()
+        self._file = open(self._path, "a")
+        if self._file.tell() == 0:
+            self._write_header(self._file, self._generation)
+        self._syncer = threading.Thread(target=self._sync_loop, daemon=True)
+        self._syncer.start()
+
+    def __len__(self):
+        """Returns the number of records in the log since the snapshot."""
+        return len(self._records) + self._appended - self._compacted
+
+    def _load(self):
+        """Reads the snapshot and the records logged after it.
+
+        A torn record at the end of the log, left by a crash, is cut off.
+        """
+        state, generation = None, 0
+        try:
+            with open(self._snapshot_path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            pass
+        else:
+            generation = snapshot["generation"]
+            state = PlayerState(
+                playlists=[tuple(playlist)
+                           for playlist in snapshot["playlists"]],
+                flags=[tuple(flag) for flag in snapshot["flags"]],
+                ratings=[tuple(rating) for rating in snapshot["ratings"]])
+
+        records = []
+        try:
+            log_file = open(self._path, "rb")
+        except FileNotFoundError:
+            return state, records, generation
+        with log_file:
+            header = log_file.readline()
+            try:
+                log_generation = json.loads(header)["generation"]
+            except (ValueError, KeyError, TypeError):
+                log_generation = None
+            if log_generation != generation:
+                # Compacted into the snapshot, or not a complete log.
+                good_end = 0
+            else:
+                good_end = log_file.tell()
+                for line in log_file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                    good_end += len(line)
+        with open(self._path, "r+b") as log_file:
+            log_file.truncate(good_end)
+        return state, records, generation
+
+    def _write_header(self, log_file, generation):
+        log_file.write(json.dumps({"generation": generation}) + "\n")
+        log_file.flush()
+        os.fsync(log_file.fileno())
+
+    def recovered(self):
+        """Returns the snapshot state, or None, and the records after it.
+
+        Only meant to be called once, right after opening the log.
+        """
+        state, records = self._state, self._records
+        self._state = None
+        return state, records
+
+    def append(self, *record):
+        """Appends a record of strings and numbers to the log."""
+        line = json.dumps(record) + "\n"
+        with self._condition:
+            if self._closed:
+                raise ValueError("append to a closed StateLog")
+            self._file.write(line)
+            self._appended += 1
+            self._condition.notify_all()
+
+    def sync(self):
+        """Waits until every record appended so far is on disk."""
+        with self._condition:
+            target = self._appended
+            self._condition.notify_all()
+            while self._synced < target and not self._closed:
+                self._condition.wait()
+
+    def _sync_loop(self):
+        """Syncs the appended records in groups until the log is closed."""
+        with self._condition:
+            while True:
+                while self._synced == self._appended and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                # Let more records join the group before syncing.
+                self._condition.wait(self._sync_interval)
+                if self._closed:
+                    return
+                self._file.flush()
+                target = self._appended
+                fd = self._file.fileno()
+                self._syncing = True
+                self._condition.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._condition.acquire()
+                    self._syncing = False
+                self._synced = max(self._synced, target)
+                self._condition.notify_all()
+
+    def compact(self, state):
+        """Replaces the log by a snapshot of the given state.
+
+        No change may be made to the state, nor logged, while compacting.
+
+        Args:
+            state: The PlayerState with every change logged so far applied.
+        """
+        with self._condition:
+            while self._syncing:
+                self._condition.wait()
+            generation = self._generation + 1
+            _write_atomically(self._snapshot_path, json.dumps({
+                "generation": generation,
+                "playlists": state.playlists,
+                "flags": state.flags,
+                "ratings": state.ratings,
+            }))
+            # From here on the old log is ignored, so a new one can replace it.
+            self._file.close()
+            temp_path = self._path.with_name(self._path.name + ".tmp")
+            with open(temp_path, "w") as new_log:
+                self._write_header(new_log, generation)
+            os.replace(temp_path, self._path)
+            _sync_directory(self._path)
+            self._file = open(self._path, "a")
+            self._generation = generation
+            self._records = []
+            # Everything appended so far is in the durable snapshot.
+            self._synced = self._compacted = self._appended
+            self._condition.notify_all()
+
+    def close(self):
+        """Syncs the log and closes it."""
+        with self._condition:
+            if self._closed:
+                return
+            while self._syncing:
+                self._condition.wait()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = self._appended
+            self._closed = True
+            self._file.close()
+            self._condition.notify_all()
+        self._syncer.join()
@@ -1,37 +1,90 @@
 """A video class."""
 
-from typing import Sequence
+from .video_store import RatingSummary, VideoStore
+from typing import Optional, Sequence
 
 
 class Video:
-    """A class used to represent a Video."""
+    """A class used to represent a Video.
+
+    A Video is a light view of one position in a VideoStore, which holds
+    the actual data. Views of the same position compare equal.
+    """
+
+    __slots__ = ("_store", "_position")
 
     def __init__(self, video_title: str, video_id: str, video_tags: Sequence[str]):
-        """Video constructor."""
-        self._title = video_title
-        self._video_id = video_id
-        self._flag = False
-        self._rating = []
-        self._avg_rating = 0
-        # Turn the tags into a tuple here so it's unmodifiable,
-        # in case the caller changes the 'video_tags' they passed to us
-        self._tags = tuple(video_tags)
+        """Video constructor. The video gets a store of its own."""
+        self._store = VideoStore()
+        # The store turns the tags into a tuple on every access, so they
+        # are unmodifiable and unaffected by changes to 'video_tags'.
+        self._position = self._store.append(video_title, video_id, video_tags)
+
+    @classmethod
+    def view(cls, store: VideoStore, position: int) -> "Video":
+        """Returns the video stored at the given position of a store."""
+        video = cls.__new__(cls)
+        video._store = store
+        video._position = position
+        return video
+
+    def __eq__(self, other):
+        if not isinstance(other, Video):
+            return NotImplemented
+        return self._store is other._store and self._position == other._position
+
+    def __hash__(self):
+        return hash((id(self._store), self._position))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # A view is a reference to the stored video, never a copy of it.
+        return self
+
+    def __repr__(self):
+        return f"Video({self.title!r}, {self.video_id!r}, {self.tags!r})"
 
     @property
     def title(self) -> str:
         """Returns the title of a video."""
-        return self._title
+        return self._store.title(self._position)
 
     @property
     def video_id(self) -> str:
         """Returns the video id of a video."""
-        return self._video_id
+        return self._store.video_id(self._position)
 
     @property
     def tags(self) -> Sequence[str]:
         """Returns the list of tags of a video."""
-        return self._tags
+        return self._store.tags(self._position)
+
+    @property
+    def flag_reason(self) -> Optional[str]:
+        """Returns why the video is flagged, or None if it is not flagged."""
+        return self._store.flag_reason(self._position)
+
+    @property
+    def flagged(self) -> bool:
+        """Returns whether the video is flagged."""
+        return self.flag_reason is not None
+
+    @property
+    def avg_rating(self) -> float:
+        """Returns the unrounded average rating, 0 if not yet rated."""
+        return self._store.average_rating(self._position)
+
+    @property
+    def rating_summary(self) -> Optional[RatingSummary]:
+        """Returns the aggregated ratings, or None if not yet rated."""
+        return self._store.rating_summary(self._position)
+
+    @property
+    def rating_record(self):
+        """Returns a copy of the raw rating aggregates, or None if unrated."""
+        return self._store.rating_record(self._position)
 
     def rating(self):
-        self._avg_rating = sum(self._rating)/len(self._rating)
-        return round(self._avg_rating, 1)
\ No newline at end of file
+        return round(self.avg_rating, 1)
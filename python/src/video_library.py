@@ -1,8 +1,80 @@
 """A video library class."""
 
+from .fuzzy_index import BKTree, WordIndex, max_typos, title_words
 from .video import Video
+from .sorted_tree import SortedTree
+from .video_store import VideoStore
+from .library_snapshot import (
+    LibrarySnapshot, chunk_hash, read_snapshot, write_snapshot)
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import bisect
+import copy
 import csv
+import hashlib
+import heapq
+import io
+import itertools
+import os
+import sys
+import threading
+
+
+_DEFAULT_VIDEOS_PATH = Path(__file__).parent / "videos.txt"
+
+# Longest substring length kept in the title index. Every substring of a
+# title up to this length is indexed, so a query no longer than this is a
+# single lookup and a longer one only has to verify the candidates of its
+# rarest substring of this length.
+_GRAM_SIZE = 3
+
+_NOT_PLAYABLE = -1
+
+# Relevance of a ranked search result: a title containing the search term
+# scores _TITLE_WEIGHT, less the later in the title the term first occurs.
+# A tag equal to the term adds _TAG_WEIGHT, and the average rating up to
+# _RATING_WEIGHT.
+_TITLE_WEIGHT = 2.0
+_OFFSET_DECAY = 0.9
+_TAG_WEIGHT = 1.0
+_RATING_WEIGHT = 1.0
+_MAX_RATING = 5
+
+# Number of results of a ranked search, unless asked for another number.
+_RANKED_LIMIT = 20
+
+# Library files at least this large are parsed by a pool of processes,
+# one per CPU, unless told otherwise. Smaller ones are parsed sooner than
+# the pool starts.
+_PARALLEL_MIN_BYTES = 32 << 20
+
+# Chunks the file is split into per process of the pool, so that the
+# processes done first take on the remaining chunks.
+_CHUNKS_PER_WORKER = 4
+
+# Number of locks the videos of a library are spread over for ratings
+# and flags.
+_LOCK_STRIPES = 64
+
+# What a session takes from the successor of its library when reloading.
+_INDEX_ATTRIBUTES = ("_folded_titles", "_title_index", "_title_order",
+                     "_title_rank", "_tag_index", "_tag_names", "_word_index",
+                     "_removed", "_source_stamp")
+
+LibraryChanges = namedtuple("LibraryChanges", ["added", "removed", "changed"])
+LibraryChanges.__doc__ = """What reloading a library changed.
+
+added: The ids of the videos added to the library file, in file order.
+removed: The ids of the videos no longer in it, in library order.
+changed: The ids of the videos given another title or other tags, in
+    library order.
+"""
+
+# Libraries returned by VideoLibrary.shared(), by library file.
+_shared_libraries = {}
+_shared_libraries_lock = threading.Lock()
 
 
 # Helper Wrapper around CSV reader to strip whitespace from around
@@ -11,26 +83,982 @@ def _csv_reader_with_strip(reader):
     yield from ((item.strip() for item in line) for line in reader)
 
 
+def _read_videos(videos_path):
+    """Yields the title, video id and tags of every video of a library file.
+
+    Repeated video_ids are merged as by _parse_videos().
+    """
+    with open(videos_path) as video_file:
+        yield from _parse_videos(video_file)
+
+
+class _HashingReader(io.RawIOBase):
+    """Reads a binary file, hashing the bytes read as chunk_hash() does."""
+
+    def __init__(self, raw_file):
+        self._file = raw_file
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self._file.readinto(buffer)
+        self.digest.update(memoryview(buffer)[:count])
+        self.size += count
+        return count
+
+
+def _parse_videos(video_file):
+    """Returns the title, video id and tags of every video of a text file.
+
+    A video_id given on several lines is one video: it keeps the place of
+    its first line and takes the title and tags of its last.
+    """
+    reader = _csv_reader_with_strip(csv.reader(video_file, delimiter="|"))
+    videos = {}
+    for video_info in reader:
+        title, url, tags = video_info
+        videos[url] = (
+            title, url, [tag.strip() for tag in tags.split(",")] if tags else [])
+    return videos.values()
+
+
+def _add_to_indexes(title_index, tag_index, position, folded_title, tags):
+    """Adds a video to title and tag indexes that are not yet sorted.
+
+    Until they are sorted, the title postings hold the offset of the gram
+    in the title and the position in a single sortable integer.
+    """
+    for gram, offset in _title_grams(folded_title).items():
+        title_index.setdefault(gram, []).append(offset << 32 | position)
+    for tag in {tag.lower() for tag in tags}:
+        tag_index.setdefault(tag, []).append(position)
+
+
+def _low_halves(postings):
+    """Returns the positions held by sorted title postings, as array("I")."""
+    low_half = 1 if sys.byteorder == "big" else 0
+    positions = array("I")
+    positions.frombytes(memoryview(array("Q", postings)).cast("B")
+                        .cast("I")[low_half::2].tobytes())
+    return positions
+
+
+# What a worker process parsed of a chunk of a library file. Positions are
+# those of the whole file.
+_Chunk = namedtuple("_Chunk", [
+    "titles", "video_ids", "tags", "tag_offsets", "tag_refs", "title_index",
+    "tag_index", "title_order", "end", "source_hash"])
+
+
+def _chunk_bounds(videos_path, count):
+    """Splits a file into at most count chunks of whole lines.
+
+    Returns:
+        A list of (start, end) byte offsets.
+    """
+    size = os.path.getsize(videos_path)
+    starts = [0]
+    with open(videos_path, "rb") as video_file:
+        for index in range(1, count):
+            video_file.seek(max(size * index // count, starts[-1]))
+            # Move on to the start of the next line.
+            video_file.readline()
+            if video_file.tell() >= size:
+                break
+            if video_file.tell() > starts[-1]:
+                starts.append(video_file.tell())
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _read_chunk(videos_path, start, end):
+    with open(videos_path, "rb") as video_file:
+        video_file.seek(start)
+        return video_file.read(end - start)
+
+
+def _count_videos(videos_path, start, end):
+    """Returns the number of lines between two offsets of a file."""
+    data = _read_chunk(videos_path, start, end)
+    return data.count(b"\n") + (bool(data) and not data.endswith(b"\n"))
+
+
+def _parse_chunk(videos_path, start, end, first_position):
+    """Parses the lines between two offsets of a library file.
+
+    Runs in a worker process of a parallel load. The chunk is decoded and
+    split into lines like open() would, and parsed and indexed like the
+    serial load does.
+
+    Returns:
+        A _Chunk, its title postings sorted.
+    """
+    data = _read_chunk(videos_path, start, end)
+    store = VideoStore()
+    title_index = {}
+    tag_index = {}
+    for title, video_id, tags in _parse_videos(
+            io.TextIOWrapper(io.BytesIO(data))):
+        position = first_position + store.append(title, video_id, tags)
+        _add_to_indexes(title_index, tag_index, position, title.lower(), tags)
+    for gram, postings in title_index.items():
+        postings.sort()
+        title_index[gram] = array("Q", postings)
+    tags, tag_offsets, tag_refs = store.tag_columns()
+    positions = range(len(store))
+    return _Chunk(
+        titles=[store.title(position) for position in positions],
+        video_ids=[store.video_id(position) for position in positions],
+        tags=tags, tag_offsets=tag_offsets, tag_refs=tag_refs,
+        title_index=title_index,
+        tag_index={tag: array("I", tag_positions)
+                   for tag, tag_positions in tag_index.items()},
+        title_order=array("I", (
+            first_position + position for position in
+            sorted(positions, key=store.title))),
+        end=end, source_hash=chunk_hash(data))
+
+
+def _merge_postings(gram_runs):
+    """Merges the sorted title postings of the chunks, in a worker process.
+
+    Args:
+        gram_runs: (gram, list of the postings of every chunk having it)
+            pairs.
+
+    Returns:
+        A list of (gram, positions) pairs, positions as in a title index.
+    """
+    # Each run is sorted, and the sort merges them.
+    return [(gram, _low_halves(
+                runs[0] if len(runs) == 1
+                else sorted(itertools.chain.from_iterable(runs))))
+            for gram, runs in gram_runs]
+
+
+def _batches(items, sizes, count):
+    """Splits items into about count consecutive batches of similar size."""
+    batch_size = sum(sizes) / count
+    batch = []
+    batch_total = 0
+    for item, size in zip(items, sizes):
+        batch.append(item)
+        batch_total += size
+        if batch_total >= batch_size:
+            yield batch
+            batch = []
+            batch_total = 0
+    if batch:
+        yield batch
+
+
+def _parse_in_parallel(videos_path, workers):
+    """Parses chunks of a library file in a pool of worker processes.
+
+    The lines of each chunk are counted first, so that every worker knows
+    the position of its first video. Once the chunks are parsed, the pool
+    also merges their title postings, gram by gram.
+
+    Returns:
+        The _Chunk of every chunk in file order and the title index, or
+        None if the lines do not match the videos parsed, e.g. if a quoted
+        title spans lines or a video_id is repeated.
+    """
+    chunk_count = workers * _CHUNKS_PER_WORKER
+    bounds = _chunk_bounds(videos_path, chunk_count)
+    starts = [start for start, _ in bounds]
+    ends = [end for _, end in bounds]
+    paths = [videos_path] * len(bounds)
+    with ProcessPoolExecutor(workers) as pool:
+        counts = list(pool.map(_count_videos, paths, starts, ends))
+        first_positions = [0] + list(itertools.accumulate(counts))[:-1]
+        chunks = list(pool.map(
+            _parse_chunk, paths, starts, ends, first_positions))
+        if any(len(chunk.titles) != count
+               for chunk, count in zip(chunks, counts)):
+            return None
+        # An id repeated within a chunk fails the count above, one repeated
+        # across chunks fails here: both are merged by the serial parse.
+        if len(set(itertools.chain.from_iterable(
+                chunk.video_ids for chunk in chunks))) != sum(counts):
+            return None
+        # Grams are kept in order of first occurrence, as when parsed here.
+        runs = {}
+        for chunk in chunks:
+            for gram, postings in chunk.title_index.items():
+                runs.setdefault(gram, []).append(postings)
+        title_index = {}
+        for merged in pool.map(_merge_postings, _batches(
+                list(runs.items()),
+                [sum(map(len, gram_runs)) for gram_runs in runs.values()],
+                chunk_count)):
+            title_index.update(merged)
+    return chunks, title_index
+
+
+def _source_stamp(videos_path):
+    """Returns the size and modification time of a library file."""
+    stat = os.stat(videos_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _copy_positions(positions):
+    """Returns an array("I") copy of an array or view of positions."""
+    copied = array("I")
+    copied.frombytes(memoryview(positions).cast("B"))
+    return copied
+
+
+class _Keys:
+    """A read-only view of the keys of a sorted sequence, for bisect."""
+
+    def __init__(self, items, key):
+        self._items = items
+        self._key = key
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._key(self._items[index])
+
+
+def _without(items, indexes, result):
+    """Returns the items of a sequence but those at the given indexes.
+
+    Args:
+        items: An array or list.
+        indexes: The indexes to leave out, sorted.
+        result: An empty sequence of the type of items, to fill.
+    """
+    start = 0
+    for index in indexes:
+        result += items[start:index]
+        start = index + 1
+    result += items[start:]
+    return result
+
+
+def _with(items, new_items, key, result):
+    """Returns a sorted sequence with new items inserted in order.
+
+    Args:
+        items: An array or list sorted by key.
+        new_items: The items to insert, sorted by key.
+        key: The key items are sorted by, unique to each item.
+        result: An empty sequence of the type of items, to fill.
+    """
+    keys = _Keys(items, key)
+    start = 0
+    for item in new_items:
+        index = bisect.bisect_left(keys, key(item))
+        result += items[start:index]
+        result.append(item)
+        start = index
+    result += items[start:]
+    return result
+
+
+def _title_grams(title):
+    """Returns the substrings of a title up to _GRAM_SIZE long.
+
+    Returns:
+        A dict mapping every substring to where it first occurs.
+    """
+    # Later starts come first, so the first occurrence is the one kept.
+    return {title[start:start + size]: start
+            for size in range(1, _GRAM_SIZE + 1)
+            for start in range(len(title) - size, -1, -1)}
+
+
+def _title_score(offset):
+    return _TITLE_WEIGHT * _OFFSET_DECAY ** offset
+
+
+def _rating_score(average_rating):
+    return _RATING_WEIGHT * average_rating / _MAX_RATING
+
+
+class _LazyIndex:
+    """An index built on first use, then shared by a library's sessions."""
+
+    def __init__(self, build):
+        self._build = build
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the index, building it if this is the first call."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build()
+        return self._index
+
+    def built(self):
+        """Returns the index if it has been built, else None."""
+        return self._index
+
+
 class VideoLibrary:
-    """A class used to represent a Video Library."""
-
-    def __init__(self):
-        """The VideoLibrary class is initialized."""
-        self._videos = {}
-        with open(Path(__file__).parent / "videos.txt") as video_file:
-            reader = _csv_reader_with_strip(
-                csv.reader(video_file, delimiter="|"))
-            for video_info in reader:
-                title, url, tags = video_info
-                self._videos[url] = Video(
-                    title,
-                    url,
-                    [tag.strip() for tag in tags.split(",")] if tags else [],
-                )
+    """A class used to represent a Video Library.
+
+    The library is parsed from a '|' separated file of titles, video ids
+    and tags. The parsed videos and their indexes are compiled into a
+    snapshot next to that file, which later instances load instead of
+    parsing the file again as long as it has not changed.
+
+    The videos are kept in a columnar VideoStore and handed out as Video
+    views of it. The indexes refer to videos by their position in the
+    store, which is library order.
+
+    A library can hand out sessions: libraries sharing its videos and
+    indexes, but with flags and ratings of their own. A session only takes
+    memory for what is flagged or rated through it.
+
+    Flagging, allowing and rating are safe to call from several threads.
+    Each video is guarded by one of a set of striped locks, so changes to
+    different videos mostly run in parallel. The playable arrays and the
+    rating order have a lock each, which is only held while they are
+    updated.
+
+    reload() applies the changes made to the library file since it was
+    loaded, updating only the videos that changed. Sessions reload by
+    moving to a successor of their library, built once for every change
+    of the file and shared by the sessions reloading after it.
+    """
+
+    # Positions of the videos removed by reloads.
+    _removed = frozenset()
+    # The library a session was made from, None if not a session.
+    _parent = None
+    # The library with the next change of the file applied, once a
+    # session has reloaded, and the positions of the videos that change
+    # removed, changed and added.
+    _successor = None
+    _reloaded_positions = ((), (), ())
+
+    def __init__(self, videos_path=None, workers=None):
+        """The VideoLibrary class is initialized.
+
+        Args:
+            videos_path: The library file, videos.txt next to this module
+                by default.
+            workers: How many processes parse the library file when it has
+                no up-to-date snapshot. By default one per CPU for large
+                files, and only this one for small files.
+        """
+        videos_path = Path(
+            _DEFAULT_VIDEOS_PATH if videos_path is None else videos_path)
+        # The file is stamped before it is read, so that a change made
+        # meanwhile is picked up by the next reload.
+        self._videos_path = videos_path
+        self._source_stamp = _source_stamp(videos_path)
+        self._store = VideoStore()
+        # Lowercased title of every video, computed once at load time.
+        self._folded_titles = []
+        # Maps every short substring of a lowercased title to the positions
+        # of the videos containing it, ordered by where it first occurs in
+        # their title, then library order.
+        self._title_index = {}
+        # Every video position sorted by title, and each video's rank in it.
+        self._title_order = []
+        self._title_rank = []
+        # Maps every lowercased tag to the positions of the videos carrying
+        # it, in title order, plus the sorted list of those tags.
+        self._tag_index = {}
+        self._tag_names = []
+        # Keys of the rated videos, best average rating first and videos
+        # with the same average in library order: (-average, position).
+        # Being immutable, it is shared with sessions and read without
+        # copying while ratings replace it.
+        self._rating_order = SortedTree()
+        # The words of the titles, for typo-tolerant search. Few searches
+        # need it, so it is built by the first one rather than at load.
+        self._word_index = _LazyIndex(self._build_word_index)
+
+        snapshot = read_snapshot(videos_path)
+        if snapshot is not None:
+            self._load_snapshot(snapshot)
+        else:
+            source_chunks = self._load_file(videos_path, workers)
+            write_snapshot(videos_path, self._snapshot(), self._source_stamp,
+                           source_chunks)
+
+        # Positions of the videos that are not flagged, in no particular
+        # order, and where each video is in that array (_NOT_PLAYABLE if
+        # it is flagged).
+        self._playable = array("I", range(len(self._store)))
+        self._playable_slots = array("q", range(len(self._store)))
+        # Whether the playable arrays and the rating order are still those
+        # of the library this session was made from: the arrays are copied
+        # before any change, and both follow that library through reloads.
+        self._shares_playable = False
+        self._shares_rating_order = False
+        # Whether the store and indexes are those of the library this
+        # session was made from, to copy before a reload changes them.
+        self._shares_indexes = False
+        self._successor_lock = threading.Lock()
+        self._create_locks()
+
+    def _create_locks(self):
+        """Creates the locks guarding the flags and ratings."""
+        self._video_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        # Always taken after the lock of a video, never before it.
+        self._playable_lock = threading.Lock()
+        self._rating_order_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, videos_path=None):
+        """Returns a library of the given file shared by the whole process.
+
+        The library is loaded on the first call for a file and returned
+        again by later calls, or its latest successor once a session has
+        reloaded it. It is meant to be used through sessions and must not
+        be changed itself.
+        """
+        key = Path(_DEFAULT_VIDEOS_PATH if videos_path is None
+                   else videos_path).resolve()
+        with _shared_libraries_lock:
+            library = _shared_libraries.get(key)
+            if library is None:
+                library = cls(key)
+            library = _shared_libraries[key] = library._latest()
+            return library
+
+    def session(self):
+        """Returns a library with the videos and indexes of this one.
+
+        Flags and ratings start as this library's and are then kept apart:
+        changing them in the session does not change them here, nor in
+        other sessions. This library must not be changed any more while
+        it has sessions. Once a session has reloaded it, new sessions are
+        made from its latest successor instead.
+        """
+        library = self._latest() if self._parent is None else self
+        session = copy.copy(library)
+        session._parent = library
+        session._store = library._store.overlay()
+        session._shares_playable = True
+        session._shares_rating_order = True
+        session._shares_indexes = True
+        session._create_locks()
+        return session
+
+    def _load_file(self, videos_path, workers=None):
+        """Parses the library file and builds the indexes.
+
+        Large files are split into chunks of lines, parsed and indexed by a
+        pool of processes. Their videos and sorted index fragments are then
+        merged into a library equal to the one parsed here line by line.
+
+        Returns:
+            (end, hash) of every chunk of the file parsed, as taken by
+            write_snapshot().
+        """
+        if workers is None:
+            workers = 1
+            if os.path.getsize(videos_path) >= _PARALLEL_MIN_BYTES:
+                workers = os.cpu_count() or 1
+        if workers > 1:
+            parsed = _parse_in_parallel(videos_path, workers)
+            if parsed is not None:
+                self._merge_chunks(*parsed)
+                return [(chunk.end, chunk.source_hash) for chunk in parsed[0]]
+        with open(videos_path, "rb") as video_file:
+            reader = _HashingReader(video_file)
+            for title, video_id, tags in _parse_videos(
+                    io.TextIOWrapper(io.BufferedReader(reader))):
+                self._add_video(title, video_id, tags)
+        self._sort_indexes()
+        return [(reader.size, reader.digest.digest())]
+
+    def _merge_chunks(self, chunks, title_index):
+        """Builds the videos and indexes from the _Chunk of every chunk.
+
+        Args:
+            chunks: The _Chunk of every chunk of the file, in order.
+            title_index: The title index, already merged.
+        """
+        titles = []
+        video_ids = []
+        tags = []
+        refs_by_tag = {}
+        tag_offsets = array("Q", [0])
+        tag_refs = array("I")
+        for chunk in chunks:
+            titles += chunk.titles
+            video_ids += chunk.video_ids
+            # Tags get their refs in order of first use, as when appended.
+            refs = []
+            for tag in chunk.tags:
+                ref = refs_by_tag.get(tag)
+                if ref is None:
+                    ref = refs_by_tag[tag] = len(tags)
+                    tags.append(tag)
+                refs.append(ref)
+            first_ref = len(tag_refs)
+            tag_offsets.extend(first_ref + offset
+                               for offset in chunk.tag_offsets[1:])
+            tag_refs.extend(map(refs.__getitem__, chunk.tag_refs))
+        self._store = VideoStore.from_columns(
+            titles, video_ids, tags, tag_offsets, tag_refs)
+        self._folded_titles = [title.lower() for title in titles]
+
+        self._title_index = title_index
+        self._title_order = sorted(
+            itertools.chain.from_iterable(
+                chunk.title_order for chunk in chunks),
+            key=self._store.title)
+        self._rank_titles()
+        for chunk in chunks:
+            for tag, positions in chunk.tag_index.items():
+                self._tag_index.setdefault(tag, []).extend(positions)
+        self._sort_tags()
+
+    def _load_snapshot(self, snapshot):
+        """Restores the videos and the prebuilt indexes of a snapshot."""
+        self._store = VideoStore.from_columns(
+            snapshot.titles, snapshot.video_ids, snapshot.tags,
+            *snapshot.video_tags)
+        self._folded_titles = [title.lower() for title in snapshot.titles]
+        self._title_index = dict(zip(snapshot.grams, snapshot.gram_postings))
+        self._title_order = snapshot.title_order
+        self._rank_titles()
+        self._tag_names = snapshot.tag_names
+        self._tag_index = dict(zip(snapshot.tag_names, snapshot.tag_postings))
+
+    def _snapshot(self):
+        """Returns the videos and indexes as a LibrarySnapshot."""
+        tags, tag_offsets, tag_refs = self._store.tag_columns()
+        return LibrarySnapshot(
+            titles=[self._store.title(position)
+                    for position in range(len(self._store))],
+            video_ids=[self._store.video_id(position)
+                       for position in range(len(self._store))],
+            tags=tags,
+            video_tags=(tag_offsets, tag_refs),
+            title_order=self._title_order,
+            tag_names=self._tag_names,
+            tag_postings=[self._tag_index[tag] for tag in self._tag_names],
+            grams=list(self._title_index),
+            gram_postings=list(self._title_index.values()),
+        )
+
+    def _add_video(self, title, video_id, tags):
+        """Adds a video to the library and to its title and tag indexes."""
+        position = self._store.append(title, video_id, tags)
+        folded_title = title.lower()
+        self._folded_titles.append(folded_title)
+        _add_to_indexes(self._title_index, self._tag_index, position,
+                        folded_title, tags)
+
+    def _sort_indexes(self):
+        """Builds the title order and sorts the title and tag indexes."""
+        for gram, postings in self._title_index.items():
+            postings.sort()
+            self._title_index[gram] = _low_halves(postings)
+        self._title_order = sorted(range(len(self._store)),
+                                   key=self._store.title)
+        self._rank_titles()
+        self._sort_tags()
+
+    def _sort_tags(self):
+        """Sorts the tags and the videos carrying each by title."""
+        self._tag_names = sorted(self._tag_index)
+        for positions in self._tag_index.values():
+            positions.sort(key=self._title_rank.__getitem__)
+
+    def _rank_titles(self):
+        """Records the rank of every video in the title order."""
+        self._title_rank = [0] * len(self._title_order)
+        for rank, position in enumerate(self._title_order):
+            self._title_rank[position] = rank
+
+    def reload(self):
+        """Applies the changes made to the library file since it was loaded.
+
+        The file is only read again if its size or modification time has
+        changed. Its videos are then matched to the library's by video_id,
+        and only the videos added, removed or given another title or tags
+        are updated in the store and the indexes. Every other video keeps
+        its position, so its flag, ratings and place in playlists are kept,
+        and so do changed videos. Added videos come last in library order.
+
+        A session leaves its library as it is for the other sessions, and
+        moves to the library's successor instead: the first session to
+        reload builds it, the others share it. A session of a session
+        copies the videos and indexes it shares the first time it reloads.
+        The library must not be used from other threads during a reload.
+
+        Returns:
+            The LibraryChanges, or None if the file has not changed.
+        """
+        parent = self._parent
+        if parent is None or parent._parent is not None:
+            positions = self._apply_file_changes()
+            if positions is None:
+                return None
+            return self._changes(*positions)
+        successor = parent._reloaded()
+        if successor is parent:
+            return None
+        return self._rebase(successor)
+
+    def _changes(self, removed, changed, added):
+        """Returns the LibraryChanges of the videos at the given positions."""
+        video_id = self._store.video_id
+        return LibraryChanges(
+            added=[video_id(position) for position in added],
+            removed=[video_id(position) for position in removed],
+            changed=[video_id(position) for position in changed])
+
+    def _apply_file_changes(self):
+        """Updates the library in place to the library file.
+
+        Returns:
+            The sorted positions of the videos removed, changed and added,
+            or None if the file has not changed.
+        """
+        stamp = _source_stamp(self._videos_path)
+        if stamp == self._source_stamp:
+            return None
+        videos = {video_id: (title, tuple(tags)) for title, video_id, tags
+                  in _read_videos(self._videos_path)}
+        removed = []
+        # The new title and tags of the changed videos, by position.
+        updates = {}
+        for video_id, position in self._store.video_positions():
+            video = videos.pop(video_id, None)
+            if video is None:
+                removed.append(position)
+            elif video != (self._store.title(position),
+                           self._store.tags(position)):
+                updates[position] = video
+        # What is left of videos was added to the file.
+        removed.sort()
+        changed = sorted(updates)
+
+        self._own_indexes()
+        stale = sorted(removed + changed)
+        stale_ranks = sorted(self._title_rank[position] for position in stale)
+        self._unindex(stale)
+        for position in removed:
+            self._store.remove(position)
+        for position in changed:
+            title, tags = updates[position]
+            self._store.replace(position, title, tags)
+            self._folded_titles[position] = title.lower()
+        self._removed = self._removed.union(removed)
+        added = []
+        for video_id, (title, tags) in videos.items():
+            added.append(self._store.append(title, video_id, tags))
+            self._folded_titles.append(title.lower())
+        self._reorder_titles(stale_ranks, changed + added)
+        self._index(changed + added)
+        self._update_playable(removed, added)
+        self._unrate(removed)
+        self._source_stamp = stamp
+        return removed, changed, added
+
+    def _latest(self):
+        """Returns the latest successor of the library, or the library."""
+        library = self
+        while library._successor is not None:
+            library = library._successor
+        return library
+
+    def _reloaded(self):
+        """Returns the latest library of the library file as it is now.
+
+        The library itself is left as it is for its sessions. Its
+        successor is a copy with the changes made to the file applied,
+        built the first time this is called after they were made, and
+        reloaded in turn for later changes.
+        """
+        with self._successor_lock:
+            if self._successor is None:
+                if _source_stamp(self._videos_path) == self._source_stamp:
+                    return self
+                successor = copy.copy(self)
+                successor._store = self._store.copy()
+                successor._shares_playable = True
+                successor._shares_rating_order = True
+                successor._shares_indexes = True
+                successor._successor_lock = threading.Lock()
+                successor._create_locks()
+                successor._reloaded_positions = (
+                    successor._apply_file_changes() or ((), (), ()))
+                self._successor = successor
+        return self._successor._reloaded()
+
+    def _rebase(self, library):
+        """Makes the session a session of a successor of its library.
+
+        Positions are kept by reloads, so the flags and ratings of the
+        session stay valid; only its own playable arrays and rating order
+        are updated, for every reload between the two libraries.
+
+        Args:
+            library: A successor of the library of the session.
+
+        Returns:
+            The LibraryChanges between the two libraries.
+        """
+        self._store.rebase(library._store)
+        removed, changed, added = set(), set(), set()
+        step = self._parent
+        while step is not library:
+            step = step._successor
+            step_removed, step_changed, step_added = step._reloaded_positions
+            if not self._shares_playable:
+                self._update_playable(step_removed, step_added)
+            if not self._shares_rating_order:
+                self._unrate(step_removed)
+            for position in step_removed:
+                if position in added:
+                    added.discard(position)
+                else:
+                    changed.discard(position)
+                    removed.add(position)
+            changed.update(position for position in step_changed
+                           if position not in added)
+            added.update(step_added)
+        for name in _INDEX_ATTRIBUTES:
+            setattr(self, name, getattr(library, name))
+        if self._shares_playable:
+            self._playable = library._playable
+            self._playable_slots = library._playable_slots
+        if self._shares_rating_order:
+            self._rating_order = library._rating_order
+        self._parent = library
+        return self._changes(sorted(removed), sorted(changed), sorted(added))
+
+    def _own_indexes(self):
+        """Copies the store and indexes shared with the parent library.
+
+        Postings are never changed in place but replaced, so the dicts
+        holding them only need a shallow copy.
+        """
+        if not self._shares_indexes:
+            return
+        if self._parent is not None:
+            # A session reads the videos of its parent through an overlay,
+            # where a successor already has a copy of its own.
+            self._store.detach()
+        self._folded_titles = list(self._folded_titles)
+        self._title_index = dict(self._title_index)
+        self._title_rank = list(self._title_rank)
+        self._tag_index = dict(self._tag_index)
+        self._tag_names = list(self._tag_names)
+        # The word index is cheaper to build again, on the next fuzzy
+        # search, than to copy.
+        self._word_index = _LazyIndex(self._build_word_index)
+        self._shares_indexes = False
+
+    def _gram_key(self, gram):
+        """Returns the key the postings of a gram are sorted by."""
+        folded_titles = self._folded_titles
+        return lambda position: (folded_titles[position].find(gram), position)
+
+    def _group_by_term(self, positions):
+        """Returns the grams, tags and words of the videos at positions.
+
+        Returns:
+            Three dicts, mapping every gram, lowercased tag and title word
+            to the positions among the given ones that have it, in order.
+        """
+        grams, tags, words = {}, {}, {}
+        for position in positions:
+            folded_title = self._folded_titles[position]
+            for gram in _title_grams(folded_title):
+                grams.setdefault(gram, []).append(position)
+            for tag in {tag.lower() for tag in self._store.tags(position)}:
+                tags.setdefault(tag, []).append(position)
+            for word in set(title_words(folded_title)):
+                words.setdefault(word, []).append(position)
+        return grams, tags, words
+
+    def _unindex(self, positions):
+        """Takes videos out of the title, tag and word indexes.
+
+        Args:
+            positions: The sorted positions of the videos, whose titles and
+                tags must still be the indexed ones.
+        """
+        grams, tags, words = self._group_by_term(positions)
+        for gram, gram_positions in grams.items():
+            postings = _copy_positions(self._title_index[gram])
+            key = self._gram_key(gram)
+            keys = _Keys(postings, key)
+            postings = _without(postings, sorted(
+                bisect.bisect_left(keys, key(position))
+                for position in gram_positions), array("I"))
+            if postings:
+                self._title_index[gram] = postings
+            else:
+                del self._title_index[gram]
+        rank = self._title_rank.__getitem__
+        for tag, tag_positions in tags.items():
+            postings = self._tag_index[tag]
+            keys = _Keys(postings, rank)
+            postings = _without(postings, sorted(
+                bisect.bisect_left(keys, rank(position))
+                for position in tag_positions), [])
+            if postings:
+                self._tag_index[tag] = postings
+            else:
+                del self._tag_index[tag]
+                del self._tag_names[bisect.bisect_left(self._tag_names, tag)]
+        word_index = self._word_index.built()
+        if word_index is not None and word_index.postings is not None:
+            # Words left without videos stay in the tree, with no postings.
+            for word, word_positions in words.items():
+                postings = word_index.postings[word]
+                word_index.postings[word] = _without(postings, [
+                    bisect.bisect_left(postings, position)
+                    for position in word_positions], [])
+
+    def _index(self, positions):
+        """Adds videos to the title, tag and word indexes.
+
+        Args:
+            positions: The positions of the videos, already ranked in the
+                title order.
+        """
+        grams, tags, words = self._group_by_term(sorted(positions))
+        for gram, gram_positions in grams.items():
+            postings = self._title_index.get(gram)
+            if postings is None:
+                postings = array("I")
+            key = self._gram_key(gram)
+            self._title_index[gram] = _with(
+                _copy_positions(postings), sorted(gram_positions, key=key),
+                key, array("I"))
+        rank = self._title_rank.__getitem__
+        for tag, tag_positions in tags.items():
+            postings = self._tag_index.get(tag)
+            if postings is None:
+                bisect.insort(self._tag_names, tag)
+                postings = []
+            self._tag_index[tag] = _with(
+                postings, sorted(tag_positions, key=rank), rank, [])
+        word_index = self._word_index.built()
+        if word_index is not None and word_index.postings is not None:
+            for word, word_positions in words.items():
+                postings = word_index.postings.get(word)
+                if postings is None:
+                    word_index.tree.add(word)
+                    postings = []
+                word_index.postings[word] = _with(
+                    postings, word_positions, int, [])
+
+    def _reorder_titles(self, stale_ranks, positions):
+        """Updates the title order after some videos were changed.
+
+        Args:
+            stale_ranks: The ranks the removed and changed videos had.
+            positions: The positions of the changed and added videos, to
+                rank by their new title.
+        """
+        def key(position):
+            return self._store.title(position), position
+
+        order = _without(self._title_order, stale_ranks, [])
+        fresh = sorted(positions, key=key)
+        keys = _Keys(order, key)
+        first = min(stale_ranks[:1]
+                    + [bisect.bisect_left(keys, key(position))
+                       for position in fresh[:1]],
+                    default=len(order))
+        self._title_order = _with(order, fresh, key, [])
+        self._title_rank.extend(
+            [0] * (len(self._store) - len(self._title_rank)))
+        # Videos before the first removal or insertion keep their rank.
+        for rank in range(first, len(self._title_order)):
+            self._title_rank[self._title_order[rank]] = rank
+
+    def _update_playable(self, removed, added):
+        """Updates the playable arrays after a reload.
+
+        Args:
+            removed: The positions of the removed videos.
+            added: The positions of the added videos.
+        """
+        with self._playable_lock:
+            self._own_playable()
+            for position in removed:
+                if self._playable_slots[position] != _NOT_PLAYABLE:
+                    self._remove_playable(position)
+            for position in added:
+                self._playable_slots.append(_NOT_PLAYABLE)
+                self._add_playable(position)
+
+    def _unrate(self, removed):
+        """Takes the videos removed by a reload out of the rating order."""
+        with self._rating_order_lock:
+            for position in removed:
+                average = self._store.average_rating(position)
+                if not average:
+                    continue
+                self._rating_order = self._rating_order.remove(
+                    (-average, position))
+                self._shares_rating_order = False
+
+    def _live_positions(self):
+        """Returns the positions of the videos not removed, in order."""
+        if not self._removed:
+            return range(len(self._store))
+        return (position for position in range(len(self._store))
+                if position not in self._removed)
+
+    def _build_word_index(self):
+        """Returns the WordIndex of the titles."""
+        postings = {}
+        for position in self._live_positions():
+            folded_title = self._folded_titles[position]
+            for word in set(title_words(folded_title)):
+                postings.setdefault(word, []).append(position)
+        return WordIndex(BKTree(postings), postings)
+
+    def _word_positions(self, word_index, word):
+        """Returns the positions of the videos whose titles have the word."""
+        return word_index.postings[word]
+
+    def _in_title_order(self, positions):
+        """Returns the given video positions sorted by title.
+
+        Few positions are sorted by their rank; when they make up a large
+        part of the library it is cheaper to walk the title order and keep
+        them.
+        """
+        if len(positions) * 8 < len(self._title_order):
+            return sorted(positions, key=self._title_rank.__getitem__)
+        wanted = set(positions)
+        return [position for position in self._title_order
+                if position in wanted]
+
+    def _videos(self, positions):
+        """Returns the videos at the given positions."""
+        return [Video.view(self._store, position) for position in positions]
 
     def get_all_videos(self):
         """Returns all available video information from the video library."""
-        return list(self._videos.values())
+        return self._videos(self._live_positions())
+
+    def get_videos_by_title(self, offset=0, limit=None):
+        """Returns videos from the video library sorted by title.
+
+        Args:
+            offset: How many videos to skip from the start of the order.
+            limit: The most videos to return, all of them if None.
+        """
+        if offset == 0 and limit is None:
+            return self._videos(self._title_order)
+        stop = None if limit is None else offset + limit
+        return self._videos(self._title_order[offset:stop])
 
     def get_video(self, video_id):
         """Returns the video object (title, url, tags) from the video library.
@@ -42,4 +1070,377 @@ class VideoLibrary:
             The Video object for the requested video_id. None if the video
             does not exist.
         """
-        return self._videos.get(video_id, None)
+        position = self._store.position(video_id)
+        if position is None:
+            return None
+        return Video.view(self._store, position)
+
+    def get_videos_by_rating(self, limit=None):
+        """Returns videos from the best to the worst average rating.
+
+        Videos with the same average rating keep their library order, and
+        unrated videos come last.
+
+        Args:
+            limit: The number of videos to return, all of them if None.
+
+        Returns:
+            A list of Video objects.
+        """
+        with self._rating_order_lock:
+            rating_order = self._rating_order
+        positions = [position for _, position
+                     in itertools.islice(rating_order, limit)]
+        if limit is None or len(positions) < limit:
+            unrated = (position for position in self._live_positions()
+                       if not self._store.average_rating(position))
+            positions.extend(itertools.islice(
+                unrated, None if limit is None else limit - len(positions)))
+        return self._videos(positions)
+
+    def rate_video(self, video_id, rating):
+        """Adds a rating to a video and updates its place in the rating order.
+
+        Args:
+            video_id: The video_id of an existing video.
+            rating: The rating, from 1 to 5.
+        """
+        self._change_rating(video_id, self._store.add_rating, rating)
+
+    def restore_rating(self, video_id, record):
+        """Gives a video the aggregated ratings saved from another library.
+
+        Args:
+            video_id: The video_id of an existing video.
+            record: The ratings of the video, as returned by the
+                rating_record() method of the store it was rated in.
+        """
+        self._change_rating(video_id, self._store.set_rating_record, record)
+
+    def _change_rating(self, video_id, change, argument):
+        """Changes the ratings of a video and moves it in the rating order.
+
+        Args:
+            video_id: The video_id of an existing video.
+            change: The store method changing the ratings, called with the
+                position of the video and argument.
+            argument: The second argument of change.
+        """
+        position = self._store.position(video_id)
+        with self._video_locks[position % _LOCK_STRIPES]:
+            average = self._store.average_rating(position)
+            change(position, argument)
+            key = (-self._store.average_rating(position), position)
+            with self._rating_order_lock:
+                rating_order = self._rating_order
+                if average:
+                    rating_order = rating_order.remove((-average, position))
+                self._rating_order = rating_order.add(key)
+                self._shares_rating_order = False
+
+    def get_random_playable_video(self, rng):
+        """Returns a random video that is not flagged.
+
+        Args:
+            rng: The random.Random instance to draw from.
+
+        Returns:
+            A Video object, or None if every video is flagged.
+        """
+        with self._playable_lock:
+            if not self._playable:
+                return None
+            position = self._playable[rng.randrange(len(self._playable))]
+        return Video.view(self._store, position)
+
+    def flag_video(self, video_id, flag_reason):
+        """Flags a video unless it is flagged already.
+
+        The video is swapped with the last playable video and dropped from
+        the end of the playable array.
+
+        Args:
+            video_id: The video_id of an existing video.
+            flag_reason: Why the video is flagged.
+
+        Returns:
+            Whether the video was flagged by this call.
+        """
+        position = self._store.position(video_id)
+        with self._video_locks[position % _LOCK_STRIPES]:
+            if self._store.flag_reason(position) is not None:
+                return False
+            self._store.set_flag(position, flag_reason)
+            with self._playable_lock:
+                self._remove_playable(position)
+            return True
+
+    def allow_video(self, video_id):
+        """Removes the flag from a video if it is flagged.
+
+        Args:
+            video_id: The video_id of an existing video.
+
+        Returns:
+            Whether the flag was removed by this call.
+        """
+        position = self._store.position(video_id)
+        with self._video_locks[position % _LOCK_STRIPES]:
+            if self._store.flag_reason(position) is None:
+                return False
+            self._store.clear_flag(position)
+            with self._playable_lock:
+                self._add_playable(position)
+            return True
+
+    def _remove_playable(self, position):
+        """Takes a video that has just been flagged out of the playable ones."""
+        self._own_playable()
+        slot = self._playable_slots[position]
+        last = self._playable.pop()
+        if last != position:
+            self._playable[slot] = last
+            self._playable_slots[last] = slot
+        self._playable_slots[position] = _NOT_PLAYABLE
+
+    def _add_playable(self, position):
+        """Adds a video that has just been allowed to the playable ones."""
+        self._own_playable()
+        self._playable_slots[position] = len(self._playable)
+        self._playable.append(position)
+
+    def _own_playable(self):
+        """Copies the playable arrays shared with the parent library."""
+        if self._shares_playable:
+            self._playable = array("I", self._playable)
+            self._playable_slots = array("q", self._playable_slots)
+            self._shares_playable = False
+
+    def search_titles(self, search_term):
+        """Returns the videos whose titles contain the search_term.
+
+        The match is case-insensitive and the videos are sorted by title,
+        videos with the same title keeping their library order.
+
+        Args:
+            search_term: The substring to look for.
+
+        Returns:
+            A list of the matching Video objects.
+        """
+        term = search_term.lower()
+        if not term:
+            return self.get_videos_by_title()
+        return self._videos(self._in_title_order(self._title_matches(term)))
+
+    def _title_matches(self, term):
+        """Returns the positions of the videos whose titles contain term.
+
+        Args:
+            term: A non-empty lowercased search term.
+        """
+        if len(term) <= _GRAM_SIZE:
+            return self._title_index.get(term, ())
+        # Every match contains all of the term's grams, so the shortest
+        # postings list holds every match; verify each candidate.
+        candidates = min(
+            (self._title_index.get(term[start:start + _GRAM_SIZE], ())
+             for start in range(len(term) - _GRAM_SIZE + 1)),
+            key=len)
+        return [position for position in candidates
+                if term in self._folded_titles[position]]
+
+    def search_titles_fuzzy(self, search_term):
+        """Returns the videos whose titles match the search_term, with typos.
+
+        A title matches if it contains the search_term, or if every word
+        of the search_term matches a word of the title with a few typos,
+        see max_typos(). Similar words are looked up in a BK-tree of the
+        title words, so only a small part of them is compared to the
+        search_term. The match is case-insensitive and the videos are
+        sorted by title.
+
+        Args:
+            search_term: The words to look for.
+
+        Returns:
+            A list of the matching Video objects.
+        """
+        term = search_term.lower()
+        words = set(title_words(term))
+        if not words:
+            return self.search_titles(search_term)
+        word_index = self._word_index.get()
+        matches = None
+        for word in words:
+            positions = set()
+            for similar_word, distance in word_index.tree.search(
+                    word, max_typos(word)):
+                if distance <= max_typos(similar_word):
+                    positions.update(
+                        self._word_positions(word_index, similar_word))
+            matches = positions if matches is None else matches & positions
+        matches.update(self._title_matches(term))
+        return self._videos(self._in_title_order(matches))
+
+    def search_titles_ranked(self, search_term, limit=None):
+        """Returns the videos most relevant to the search_term, best first.
+
+        A video is relevant if its title contains the search_term or one
+        of its tags is the search_term, with or without a leading "#". Its
+        score grows the earlier the term occurs in the title, if a tag
+        matches and with its average rating.
+
+        The best videos are found with the threshold algorithm. The title
+        matches, by where the term can first occur, the videos tagged with
+        the term and the rated videos, best first, are read in turn, while
+        a heap keeps the best videos read so far. Reading stops once no
+        video left unread can score as much as the worst of those, so the
+        work depends on limit rather than on the number of matches. Videos
+        with the same score keep their library order.
+        Flagged videos are left out.
+
+        Args:
+            search_term: The substring to look for.
+            limit: The most videos to return, 20 by default.
+
+        Returns:
+            A list of at most limit matching Video objects, best first.
+        """
+        if limit is None:
+            limit = _RANKED_LIMIT
+        if limit < 1:
+            return []
+        term = search_term.lower()
+        tag_names = {term, "#" + term}
+        # The rating order is immutable, so it is walked as it was here
+        # without copying it.
+        with self._rating_order_lock:
+            rating_order = self._rating_order
+        # Every stream yields (bound, position): the bound is the most its
+        # part of the score can be for that video and every later one.
+        streams = [
+            ((_title_score(offset), position)
+             for offset, position in self._title_offsets(term)),
+            ((_TAG_WEIGHT, position)
+             for position in self._tag_positions(tag_names)),
+            ((_rating_score(-key), position) for key, position in rating_order),
+        ]
+        bounds = [_TITLE_WEIGHT, _TAG_WEIGHT, _RATING_WEIGHT]
+        # The best videos read so far as (score, -position), worst first.
+        best = []
+        read = set()
+        unfinished = list(range(len(streams)))
+        while unfinished:
+            for stream_index in list(unfinished):
+                item = next(streams[stream_index], None)
+                if item is None:
+                    bounds[stream_index] = 0
+                    unfinished.remove(stream_index)
+                    continue
+                bounds[stream_index], position = item
+                if position in read:
+                    continue
+                read.add(position)
+                score = self._relevance(position, term, tag_names)
+                if score is None:
+                    continue
+                entry = (score, -position)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            # An unread video scoring as much as the worst one kept could
+            # still come before it in library order.
+            if len(best) == limit and best[0][0] > sum(bounds):
+                break
+        return self._videos(-negated_position for _, negated_position
+                            in sorted(best, reverse=True))
+
+    def _relevance(self, position, term, tag_names):
+        """Returns the score of a video in a ranked search.
+
+        Args:
+            position: The position of the video.
+            term: The lowercased search term.
+            tag_names: The lowercased tags matching the search term.
+
+        Returns:
+            The score, or None if the video does not match or is flagged,
+            so that flagged videos take no place among the results.
+        """
+        if self._store.flag_reason(position) is not None:
+            return None
+        offset = self._folded_title(position).find(term)
+        tagged = any(tag.lower() in tag_names
+                     for tag in self._store.tags(position))
+        if offset < 0 and not tagged:
+            return None
+        score = _rating_score(self._store.average_rating(position))
+        if offset >= 0:
+            score += _title_score(offset)
+        if tagged:
+            score += _TAG_WEIGHT
+        return score
+
+    def _folded_title(self, position):
+        return self._folded_titles[position]
+
+    def _title_offsets(self, term):
+        """Yields the videos whose titles may contain a lowercased term.
+
+        Yields:
+            (offset, position) pairs by increasing offset, offset being at
+            most where term first occurs in the title of the video. Every
+            video whose title contains term is yielded.
+        """
+        if not term:
+            yield from ((0, position) for position in self._live_positions())
+            return
+        # The postings of any gram of the term hold every match, ordered
+        # by where the gram first occurs: the term cannot occur before
+        # that less the gram's place in the term.
+        start, postings = min(
+            ((start, self._title_index.get(term[start:start + _GRAM_SIZE], ()))
+             for start in range(max(1, len(term) - _GRAM_SIZE + 1))),
+            key=lambda gram_postings: len(gram_postings[1]))
+        gram = term[start:start + _GRAM_SIZE]
+        for position in postings:
+            offset = self._folded_titles[position].find(gram) - start
+            yield max(offset, 0), position
+
+    def _tag_positions(self, tag_names):
+        """Returns the positions of the videos carrying any of the tags."""
+        return itertools.chain.from_iterable(
+            self._tag_index.get(tag, ()) for tag in tag_names)
+
+    def search_tags(self, video_tag, prefix=False):
+        """Returns the videos carrying the given tag, sorted by title.
+
+        Args:
+            video_tag: The tag to look for, matched case-insensitively.
+            prefix: Match every tag starting with video_tag instead of
+                only the tag itself.
+
+        Returns:
+            A list of the matching Video objects.
+        """
+        tag = video_tag.lower()
+        if not prefix:
+            positions = self._tag_index.get(tag, ())
+        else:
+            start = bisect.bisect_left(self._tag_names, tag)
+            end = start
+            while (end < len(self._tag_names)
+                   and self._tag_names[end].startswith(tag)):
+                end += 1
+            # A video carrying several matching tags shows up once per
+            # tag in the merged postings, one after the other.
+            merged = heapq.merge(
+                *(self._tag_index[name] for name in self._tag_names[start:end]),
+                key=self._title_rank.__getitem__)
+            positions = []
+            for position in merged:
+                if not positions or positions[-1] != position:
+                    positions.append(position)
+        return self._videos(positions)
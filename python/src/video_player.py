@@ -3,42 +3,324 @@
 from .video_library import VideoLibrary
 from .video_playlist import Playlist
 from .command_parser import CommandException
-import operator
-import random, copy
+from .output_sink import TextSink
+from .state_log import PlayerState, StateLog
+from collections import deque, namedtuple
+import functools
+import itertools
+import random
+import threading
 
 
-class VideoPlayer:
-    """A class used to represent a Video Player."""
+# How many commands UNDO can go back.
+_JOURNAL_LIMIT = 100
+
+# How many records the state log may hold before it is compacted.
+_COMPACT_EVERY = 10000
+
+# One undoable change: the player method and arguments that revert it, and
+# the ones that make it again.
+_Change = namedtuple("_Change", ["undo", "redo"])
+
+# What is playing: the video_id, whether it is paused, the name of the
+# playlist being played and the index of its cursor.
+_Playback = namedtuple(
+    "_Playback", ["video_id", "paused", "playlist_name", "playlist_index"])
+
+
+class _CommandState(threading.local):
+    """The journal state of the command running on a thread.
+
+    changes: The changes made by the command so far, None if no journaled
+        command is running.
+    replaying: Whether the command is an undo or redo replaying changes.
+    """
+    changes = None
+    replaying = False
+
+
+class _StateLock:
+    """A lock the commands of a player hold together, or one holds alone.
+
+    Commands hold it shared, so they run in parallel under finer locks.
+    Compacting the state log and reloading the library hold it alone, so
+    they never see a command half done, nor a change whose state log
+    record is still to be written. A thread already holding the lock takes
+    it again at once; otherwise a thread waiting to hold it alone holds
+    off new commands, so it is never starved.
+    """
 
     def __init__(self):
-        self._video_library = VideoLibrary()
+        self._condition = threading.Condition(threading.Lock())
+        self._holders = 0
+        self._alone = False
+        self._waiting = 0
+        # How many times the current thread holds the lock.
+        self._depth = threading.local()
+
+    def held(self):
+        """Returns whether the current thread holds the lock."""
+        return getattr(self._depth, "count", 0) > 0
+
+    def acquire_shared(self):
+        depth = getattr(self._depth, "count", 0)
+        if not depth:
+            with self._condition:
+                while self._alone or self._waiting:
+                    self._condition.wait()
+                self._holders += 1
+        self._depth.count = depth + 1
+
+    def release_shared(self):
+        self._depth.count -= 1
+        if not self._depth.count:
+            with self._condition:
+                self._holders -= 1
+                if not self._holders:
+                    self._condition.notify_all()
+
+    def acquire_alone(self):
+        if self.held():
+            raise RuntimeError("the state lock is already held")
+        with self._condition:
+            self._waiting += 1
+            while self._alone or self._holders:
+                self._condition.wait()
+            self._waiting -= 1
+            self._alone = True
+        self._depth.count = 1
+
+    def release_alone(self):
+        self._depth.count = 0
+        with self._condition:
+            self._alone = False
+            self._condition.notify_all()
+
+
+def _journaled(method):
+    """Records the changes a player command makes for UNDO and REDO.
+
+    The changes made by one command, including the commands it calls, are
+    grouped into one journal entry. A change of what is playing is recorded
+    as a change of its own, reverted after all the others.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        command = self._command
+        if command.changes is not None or command.replaying:
+            return method(self, *args, **kwargs)
+        command.changes = []
+        playback = self._playback()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            changes, command.changes = command.changes, None
+            new_playback = self._playback()
+            if new_playback != playback:
+                changes.insert(0, _Change(("_restore_playback", playback),
+                                          ("_restore_playback", new_playback)))
+            if changes:
+                with self._journal_lock:
+                    self._undo_log.append(changes)
+                    self._redo_log.clear()
+    return wrapper
+
+
+def _sharing_state(method):
+    """Runs a player command holding the state lock shared.
+
+    A compaction of the state log the command makes due runs once the
+    thread no longer holds the lock.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._state_lock.acquire_shared()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._state_lock.release_shared()
+            if self._compaction_due and not self._state_lock.held():
+                self.compact_state()
+    return wrapper
+
+
+def _owning_state(method):
+    """Runs a player method holding the state lock alone."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._state_lock.acquire_alone()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._state_lock.release_alone()
+            if self._compaction_due:
+                self.compact_state()
+    return wrapper
+
+
+def _playing(method):
+    """Runs a player method holding the lock of what is playing."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._playback_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class VideoPlayer:
+    """A class used to represent a Video Player.
+
+    A player can be driven from several threads. What is playing is
+    guarded by one lock, the set of playlists by another, and each
+    playlist by its own. Flags and ratings are left to the library's
+    per-video locks, so commands on different playlists or videos run in
+    parallel. Every thread journals its own commands for UNDO, but the
+    order of commands run at the same time is up to the threads. Commands
+    share a state lock that compacting the state log and reloading the
+    library hold alone.
+    """
+
+    def __init__(self, seed=None, ask=None, output=None, library=None,
+                 state_path=None, compact_every=_COMPACT_EVERY):
+        """VideoPlayer constructor.
+
+        Args:
+            seed: Seeds the random number generator behind PLAY_RANDOM, so
+                that a sequence of commands can be replayed exactly.
+            ask: Called with a prompt to read the user's answer to it,
+                input() by default. It may return None to leave the prompt
+                open, to be answered later by calling answer().
+            output: The OutputSink everything is written to, a TextSink
+                writing to standard output by default.
+            library: The VideoLibrary to play from, the library shared by
+                the process by default. The player plays from a session of
+                it, so its flags and ratings are its own.
+            state_path: A StateLog file to keep the playlists, flags and
+                ratings in, so that they survive restarts. The state it
+                holds is restored right away.
+            compact_every: How many records the state log may hold before
+                it is compacted into a snapshot, None to only compact it
+                when compact_state() is called.
+        """
+        self._output = TextSink() if output is None else output
+        if library is None:
+            library = VideoLibrary.shared()
+        self._video_library = library.session()
+        self._random = random.Random(seed)
+        self._ask = ask
         self._currentVideo = None
         self._paused = False
         self._allPlaylists = {}
         self._currentPlaylist = None
-        self._undo = False
-        self._lastCommand = None
+        # The numbered search results of a prompt left open by ask.
+        self._pending_choices = None
+        # Changes made by the command being run on each thread, and the
+        # journal of the changes made by earlier commands.
+        self._command = _CommandState()
+        self._undo_log = deque(maxlen=_JOURNAL_LIMIT)
+        self._redo_log = deque(maxlen=_JOURNAL_LIMIT)
+        # Locks are taken in this order: state, journal, playback,
+        # playlists, then a playlist's own.
+        self._state_lock = _StateLock()
+        self._journal_lock = threading.RLock()
+        self._playback_lock = threading.RLock()
+        self._playlists_lock = threading.Lock()
+        self._compact_every = compact_every
+        self._compaction_due = False
+        self._state_log = None
+        if state_path is not None:
+            state_log = StateLog(state_path)
+            self._restore_state(*state_log.recovered())
+            self._state_log = state_log
+
+    @property
+    def output(self):
+        """Returns the OutputSink the player writes to."""
+        return self._output
 
+    @_sharing_state
     def number_of_videos(self):
         num_videos = len(self._video_library.get_all_videos())
-        print(f"{num_videos} videos in the library")
-
-        if self._undo:
-                self._undo = False
-
-    def show_all_videos(self):
-        """Returns all videos."""
-        all_videos = self._video_library.get_all_videos()
-        print("Here's a list of all available videos:")
-        for video in sorted(all_videos, key=operator.attrgetter('_title')):
-            tags = " ".join(video._tags)
-            if video._flag is False:
-                print(f"  {video._title} ({video._video_id}) [{tags}]")
+        self._output.message(f"{num_videos} videos in the library")
+
+    @_owning_state
+    def reload_library(self):
+        """Applies the changes made to the library file since it was loaded.
+
+        Flags, ratings and playlists are kept for the videos still in it.
+        Removed videos are taken out of the playlists, and stopped if
+        playing. Commands run by other threads wait until the reload is
+        done.
+        """
+        # Videos are read before the reload: the database they were read
+        # from may be closed by it.
+        current = self._currentVideo
+        playing = (None if current is None
+                   else (current.video_id, current.title))
+        changes = self._video_library.reload()
+        if changes is None:
+            self._output.message("Library is up to date")
+        else:
+            self._output.message(
+                f"Reloaded library: {len(changes.added)} added, "
+                f"{len(changes.removed)} removed, "
+                f"{len(changes.changed)} changed")
+            self._refresh_videos(playing)
+
+    def _refresh_videos(self, playing):
+        """Looks the videos of the playlists and playback up again.
+
+        Videos removed from the library are taken out of the playlists, and
+        stopped if playing; the others may have moved in the library.
+
+        Args:
+            playing: The video_id and title of the playing video, read
+                before the reload, or None.
+        """
+        get_video = self._video_library.get_video
+        if playing is not None:
+            video_id, title = playing
+            self._currentVideo = get_video(video_id)
+            if self._currentVideo is None:
+                self._output.message(f"Stopping video: {title}")
+                self._paused, self._currentPlaylist = False, None
+        for playlist in list(self._allPlaylists.values()):
+            for video_id in playlist._refresh(get_video):
+                self._log("remove", playlist._playlist_name, video_id)
+
+    @_sharing_state
+    def show_all_videos(self, page=None):
+        """Returns all videos.
+
+        Args:
+            page: The Page of the videos to show, all of them if None.
+        """
+        offset, limit = (0, None) if page is None else page
+        # One video past the page tells whether more follow.
+        videos = self._video_library.get_videos_by_title(
+            offset, None if limit is None else limit + 1)
+        more = limit is not None and len(videos) > limit
+        videos = videos[:limit]
+        lines = []
+        for video in videos:
+            tags = " ".join(video.tags)
+            if not video.flagged:
+                lines.append(f"  {video.title} ({video.video_id}) [{tags}]")
             else:
-                print(f"  {video._title} ({video._video_id}) [{tags}] - FLAGGED (reason: {video._flagreason})")
-        if self._undo:
-                self._undo = False
-            
+                lines.append(f"  {video.title} ({video.video_id}) [{tags}] - FLAGGED (reason: {video.flag_reason})")
+        self._output.listing("Here's a list of all available videos:", lines, videos)
+        if more:
+            self._show_more(offset + len(videos))
+
+    def _show_more(self, next_offset):
+        """Tells how to see the page following a listing."""
+        self._output.message(
+            f"More results follow: repeat the command with OFFSET "
+            f"{next_offset} to see them")
+
+    @_sharing_state
+    @_journaled
+    @_playing
     def play_video(self, video_id):
         """Plays the respective video.
         Args:
@@ -46,115 +328,103 @@ class VideoPlayer:
         """
         video = self._video_library.get_video(video_id)
         if video == None:
-            print("Cannot play video: Video does not exist")
+            self._output.message("Cannot play video: Video does not exist")
         else:
-            if video._flag is True:
-                print(f"Cannot play video: Video is currently flagged (reason: {video._flagreason})")
+            if video.flagged:
+                self._output.message(f"Cannot play video: Video is currently flagged (reason: {video.flag_reason})")
             else:
                 if self._currentVideo is not None:
-                    print("Stopping video:", self._currentVideo._title)
+                    self._output.message(f"Stopping video: {self._currentVideo.title}")
 
-                print("Playing video:", video._title)
+                self._output.message(f"Playing video: {video.title}")
                 self._currentVideo, self._paused = video, False
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 1 
-                else:
-                    self._undo = False
 
+    @_sharing_state
+    @_journaled
+    @_playing
     def stop_video(self):
         """Stops the current video."""
         if self._currentVideo is not None:
-            print("Stopping video:", self._currentVideo._title)
-            self._previousVideo, self._previousPlaylist = self._currentVideo, self._currentPlaylist # For undo command
+            self._output.message(f"Stopping video: {self._currentVideo.title}")
             self._currentVideo, self._paused, self._currentPlaylist = None, False, None
-            if not self._undo:
-                """For undo command"""
-                self._lastCommand = 2 
-            else:
-                self._undo = False
         else:
-            print("Cannot stop video: No video is currently playing")
+            self._output.message("Cannot stop video: No video is currently playing")
 
+    @_sharing_state
+    @_journaled
+    @_playing
     def play_random_video(self):
         """Plays a random video from the video library."""
-        all_videos = self._video_library.get_all_videos()
-        filtered_videos = list(filter(lambda video: video._flag is False, all_videos))
-        num_videos = len(filtered_videos)
-        if num_videos is 0:
-            print("No videos available")
+        video = self._video_library.get_random_playable_video(self._random)
+        if video is None:
+            self._output.message("No videos available")
         else:
-            self.play_video(filtered_videos[random.choice(range(num_videos))]._video_id)
-
-            if not self._undo:
-                """For undo command"""
-                self._lastCommand = 3 
-            else:
-                self._undo = False
+            self.play_video(video.video_id)
 
+    @_sharing_state
+    @_journaled
+    @_playing
     def pause_video(self):
         """Pauses the current video."""
         if self._currentVideo is None:
-            print("Cannot pause video: No video is currently playing")
+            self._output.message("Cannot pause video: No video is currently playing")
         else:
             if not self._paused:
-                print("Pausing video:", self._currentVideo._title)
+                self._output.message(f"Pausing video: {self._currentVideo.title}")
                 self._paused = True
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 4 
-                else:
-                    self._undo = False
             else:
-                print("Video already paused:", self._currentVideo._title)
+                self._output.message(f"Video already paused: {self._currentVideo.title}")
         
+    @_sharing_state
+    @_journaled
+    @_playing
     def continue_video(self):
         """Resumes playing the current video."""
         if self._currentVideo is None:
-            print("Cannot continue video: No video is currently playing")
+            self._output.message("Cannot continue video: No video is currently playing")
         else:
             if self._paused:
-                print("Continuing video:", self._currentVideo._title)
+                self._output.message(f"Continuing video: {self._currentVideo.title}")
                 self._paused = False
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 5 
-                else:
-                    self._undo = False
             else:
-                print("Cannot continue video: Video is not paused")
+                self._output.message("Cannot continue video: Video is not paused")
 
+    @_sharing_state
+    @_playing
     def show_playing(self):
         """Displays video currently playing."""
         if self._currentVideo is None:
-            print("No video is currently playing")
+            self._output.message("No video is currently playing")
         else:
-            tags = " ".join(self._currentVideo._tags) 
-            video_info = f"{self._currentVideo._title} ({self._currentVideo._video_id}) [{tags}]"
+            tags = " ".join(self._currentVideo.tags) 
+            video_info = f"{self._currentVideo.title} ({self._currentVideo.video_id}) [{tags}]"
             if not self._paused:
-                print("Currently playing:", video_info)
+                self._output.message(f"Currently playing: {video_info}")
             else:
-                print("Currently playing:", video_info, "- PAUSED")
-        if self._undo:
-                self._undo = False
+                self._output.message(f"Currently playing: {video_info} - PAUSED")
 
+    @_sharing_state
+    @_journaled
     def create_playlist(self, playlist_name):
         """Creates a playlist with a given name.
 
         Args:
             playlist_name: The playlist name.
         """
-        if playlist_name.lower() not in self._allPlaylists.keys():
-            print("Successfully created new playlist:", playlist_name)
-            self._allPlaylists[playlist_name.lower()] = Playlist(playlist_name)
-            if not self._undo:
-                """For undo command"""
-                self._lastCommand = 6 
-            else:
-                self._undo = False
+        with self._playlists_lock:
+            created = playlist_name.lower() not in self._allPlaylists
+            if created:
+                self._allPlaylists[playlist_name.lower()] = Playlist(playlist_name, self._output)
+        if created:
+            self._output.message(f"Successfully created new playlist: {playlist_name}")
+            self._log("create", playlist_name)
+            self._record(("delete_playlist", (playlist_name,)),
+                         ("create_playlist", (playlist_name,)))
         else:
-            print("Cannot create playlist: A playlist with the same name already exists")
+            self._output.message("Cannot create playlist: A playlist with the same name already exists")
 
+    @_sharing_state
+    @_journaled
     def add_to_playlist(self, playlist_name, video_id):
         """Adds a video to a playlist with a given name.
 
@@ -162,54 +432,53 @@ class VideoPlayer:
             playlist_name: The playlist name.
             video_id: The video_id to be added.
         """
-        if playlist_name.lower() not in self._allPlaylists.keys():
+        playlist = self._allPlaylists.get(playlist_name.lower(), None)
+        if playlist is None:
             """ Check if playlist exists"""
-            print(f"Cannot add video to {playlist_name}: Playlist does not exist")
+            self._output.message(f"Cannot add video to {playlist_name}: Playlist does not exist")
         else:
             video = self._video_library.get_video(video_id)
             if video is None:
                 """ Check if video exists in the library"""
-                print(f"Cannot add video to {playlist_name}: Video does not exist")
+                self._output.message(f"Cannot add video to {playlist_name}: Video does not exist")
             else:
-                if video._flag is True:
-                    print(f"Cannot add video to {playlist_name}: Video is currently flagged (reason: {video._flagreason})")
+                if video.flagged:
+                    self._output.message(f"Cannot add video to {playlist_name}: Video is currently flagged (reason: {video.flag_reason})")
                 else: 
-                    playlist = self._allPlaylists[playlist_name.lower()]
-                    playlist.add_video(playlist_name, video)
-                    self._latest_video_added_to_playlist = [playlist_name, video_id] # For undo Command
-                    if not self._undo:
-                        """For undo command"""
-                        self._lastCommand = 7 
-                    else:
-                        self._undo = False
+                    if playlist.add_video(playlist_name, video):
+                        self._log("add", playlist_name, video_id)
+                        self._record(("remove_from_playlist", (playlist_name, video_id)),
+                                     ("add_to_playlist", (playlist_name, video_id)))
             
+    @_sharing_state
     def show_all_playlists(self):
         """Display all playlists."""
         if not self._allPlaylists:
-            print("No playlists exist yet")
+            self._output.message("No playlists exist yet")
         else:
-            print("Showing all playlists:")
-            for playlist in sorted(self._allPlaylists):
-                print(f"  {self._allPlaylists[playlist]._playlist_name}")
+            self._output.listing(
+                "Showing all playlists:",
+                [f"  {self._allPlaylists[playlist]._playlist_name}"
+                 for playlist in sorted(self._allPlaylists)])
 
-        if self._undo:
-                self._undo = False
-
-    def show_playlist(self, playlist_name):
+    @_sharing_state
+    def show_playlist(self, playlist_name, page=None):
         """Display all videos in a playlist with a given name.
 
         Args:
             playlist_name: The playlist name.
+            page: The Page of the videos to show, all of them if None.
         """
         playlist = self._allPlaylists.get(playlist_name.lower(), None)
         if playlist is None:
-            print(f"Cannot show playlist {playlist_name}: Playlist does not exist")
+            self._output.message(f"Cannot show playlist {playlist_name}: Playlist does not exist")
         else:
-            playlist.show_videos(playlist_name)
-
-        if self._undo:
-                self._undo = False
+            offset, limit = (0, None) if page is None else page
+            if playlist.show_videos(playlist_name, offset, limit):
+                self._show_more(offset + limit)
 
+    @_sharing_state
+    @_journaled
     def remove_from_playlist(self, playlist_name, video_id):
         """Removes a video to a playlist with a given name.
 
@@ -219,20 +488,20 @@ class VideoPlayer:
         """
         playlist = self._allPlaylists.get(playlist_name.lower(), None)
         if playlist is None:
-            print(f"Cannot remove video from {playlist_name}: Playlist does not exist")
+            self._output.message(f"Cannot remove video from {playlist_name}: Playlist does not exist")
         else:
             video = self._video_library.get_video(video_id)
             if video is None: 
-                print(f"Cannot remove video from {playlist_name}: Video does not exist")
+                self._output.message(f"Cannot remove video from {playlist_name}: Video does not exist")
             else:
-                playlist.remove_video(playlist_name, video_id)
-                self._latest_video_removed_from_playlist = [playlist_name, video_id] # For undo command
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 8 
-                else:
-                    self._undo = False
+                index = playlist.remove_video(playlist_name, video_id)
+                if index is not None:
+                    self._log("remove", playlist_name, video_id)
+                    self._record(("_insert_into_playlist", (playlist_name, video_id, index)),
+                                 ("remove_from_playlist", (playlist_name, video_id)))
 
+    @_sharing_state
+    @_journaled
     def clear_playlist(self, playlist_name):
         """Removes all videos from a playlist with a given name.
 
@@ -241,92 +510,163 @@ class VideoPlayer:
         """
         playlist = self._allPlaylists.get(playlist_name.lower(), None)
         if playlist is None:
-            print(f"Cannot clear playlist {playlist_name}: Playlist does not exist")
+            self._output.message(f"Cannot clear playlist {playlist_name}: Playlist does not exist")
         else:
-            self._latest_clearedPlaylist = copy.deepcopy(playlist) # For undo command
-            playlist.clear_playlist(playlist_name)
-            if not self._undo:
-                """For undo command"""
-                self._lastCommand = 9
-            else:
-                self._undo = False
+            video_ids = playlist.clear_playlist(playlist_name)
+            self._log("clear", playlist_name)
+            self._record(("_refill_playlist", (playlist_name, video_ids)),
+                         ("clear_playlist", (playlist_name,)))
 
+    @_sharing_state
+    @_journaled
     def delete_playlist(self, playlist_name):
         """Deletes a playlist with a given name.
 
         Args:
             playlist_name: The playlist name.
         """
-        playlist = self._allPlaylists.get(playlist_name.lower(), None)
+        with self._playlists_lock:
+            playlist = self._allPlaylists.pop(playlist_name.lower(), None)
         if playlist is None:
-            print(f"Cannot delete playlist {playlist_name}: Playlist does not exist")
+            self._output.message(f"Cannot delete playlist {playlist_name}: Playlist does not exist")
         else:
-            self._latest_deletedPlaylist = copy.deepcopy(playlist)  # For undo command
-            del self._allPlaylists[playlist_name.lower()]
-            print(f"Deleted playlist: {playlist_name}")
+            video_ids = tuple(video.video_id for video in playlist.videos())
+            self._output.message(f"Deleted playlist: {playlist_name}")
+            self._log("delete", playlist_name)
+            self._record(("_recreate_playlist", (playlist._playlist_name, video_ids)),
+                         ("delete_playlist", (playlist_name,)))
 
-            if not self._undo:
-                """For undo command"""
-                self._lastCommand = 10 
-            else:
-                self._undo = False
 
-    def show_filtered_videos(self, filtered_videos):
-        count = 0
+    @_sharing_state
+    def show_filtered_videos(self, filtered_videos, header=None, page=None):
+        """Numbers search results and offers to play one of them.
+
+        Flagged videos are left out. The results of a page are numbered
+        from one more than its offset, so every result keeps its number
+        whichever page it is shown on.
+
+        Args:
+            filtered_videos: The matching videos, already sorted by title.
+            header: The line to show before the results, if any.
+            page: The Page of the results to show, all of them if None.
+        """
+        offset, limit = (0, None) if page is None else page
+        playable = (video for video in filtered_videos if not video.flagged)
+        lines = []
+        videos = []
         searched_videos = {}
-        for video in sorted(filtered_videos, key=operator.attrgetter('_title')):
-            if video._flag is True:
-                continue
-            count += 1
-            tags = " ".join(video._tags)
-            print(f"  {count}) {video._title} ({video._video_id}) [{tags}]")
-            searched_videos[str(count)] = video._video_id
-
-        print("Would you like to play any of the above? If yes, specify the number of the video.")
-        print("If your answer is not a valid number, we will assume it's a no.")
-        number = input("")
-        if number in searched_videos:
+        more = False
+        for number, video in enumerate(
+                itertools.islice(playable, offset, None), offset + 1):
+            if len(videos) == limit:
+                more = True
+                break
+            videos.append(video)
+            tags = " ".join(video.tags)
+            lines.append(f"  {number}) {video.title} ({video.video_id}) [{tags}]")
+            searched_videos[str(number)] = video.video_id
+
+        self._output.listing(header, lines, videos)
+        if more:
+            self._show_more(offset + len(videos))
+        self._output.message("Would you like to play any of the above? If yes, specify the number of the video.")
+        self._output.message("If your answer is not a valid number, we will assume it's a no.")
+        # Whatever is buffered has to be seen before the answer is read.
+        self._output.flush()
+        number = input("") if self._ask is None else self._ask("")
+        if number is None:
+            self._pending_choices = searched_videos
+        elif number in searched_videos:
             self.play_video(searched_videos[number])
-        
-        if self._undo:
-                self._undo = False
 
-    def search_videos(self, search_term):
+    @property
+    def awaiting_answer(self):
+        """Returns whether a prompt is waiting for answer() to be called."""
+        return self._pending_choices is not None
+
+    @_sharing_state
+    def answer(self, number):
+        """Answers the prompt the ask hook left open.
+
+        Args:
+            number: The user's answer, the number of the search result to
+                play or anything else to play nothing.
+        """
+        choices, self._pending_choices = self._pending_choices, None
+        if choices is not None and number in choices:
+            self.play_video(choices[number])
+
+    @_sharing_state
+    def search_videos(self, search_term, page=None):
         """Display all the videos whose titles contain the search_term.
 
         Args:
             search_term: The query to be used in search.
+            page: The Page of the results to show, all of them if None.
         """
-        all_videos = self._video_library.get_all_videos()
-        filtered_videos = list(filter(lambda video: search_term.lower() in video._title.lower(), all_videos))
+        filtered_videos = self._video_library.search_titles(search_term)
 
         if len(filtered_videos) > 0:
-            print(f"Here are the results for {search_term}:")
-            self.show_filtered_videos(filtered_videos)
+            self.show_filtered_videos(
+                filtered_videos, f"Here are the results for {search_term}:",
+                page)
         else:
-            print(f"No search results for {search_term}")
-        
-        if self._undo:
-                self._undo = False
+            self._output.message(f"No search results for {search_term}")
+
+    @_sharing_state
+    def search_videos_fuzzy(self, search_term, page=None):
+        """Display the videos whose titles match the search_term, with typos.
+
+        Args:
+            search_term: The query to be used in search.
+            page: The Page of the results to show, all of them if None.
+        """
+        filtered_videos = self._video_library.search_titles_fuzzy(search_term)
+
+        if len(filtered_videos) > 0:
+            self.show_filtered_videos(
+                filtered_videos, f"Here are the results for {search_term}:",
+                page)
+        else:
+            self._output.message(f"No search results for {search_term}")
+
+    @_sharing_state
+    def search_videos_ranked(self, search_term, limit=None):
+        """Display the videos most relevant to the search_term, best first.
+
+        Args:
+            search_term: The query to be used in search.
+            limit: The most videos to display, 20 by default.
+        """
+        filtered_videos = self._video_library.search_titles_ranked(
+            search_term, limit)
+
+        if len(filtered_videos) > 0:
+            self.show_filtered_videos(
+                filtered_videos, f"Here are the results for {search_term}:")
+        else:
+            self._output.message(f"No search results for {search_term}")
 
-    def search_videos_tag(self, video_tag):
-        """Display all videos whose tags contains the provided tag.
+    @_sharing_state
+    def search_videos_tag(self, video_tag, prefix=False, page=None):
+        """Display all videos that have the provided tag.
 
         Args:
             video_tag: The video tag to be used in search.
+            prefix: Also match tags that merely start with video_tag.
+            page: The Page of the results to show, all of them if None.
         """
-        all_videos = self._video_library.get_all_videos()
-        filtered_videos = list(filter(lambda video: video_tag.lower() in " ".join(video._tags).lower(), all_videos))
+        filtered_videos = self._video_library.search_tags(video_tag, prefix)
 
         if len(filtered_videos) > 0:
-            print(f"Here are the results for {video_tag}:")
-            self.show_filtered_videos(filtered_videos)
+            self.show_filtered_videos(
+                filtered_videos, f"Here are the results for {video_tag}:",
+                page)
         else:
-            print(f"No search results for {video_tag}")
-        
-        if self._undo:
-                self._undo = False
+            self._output.message(f"No search results for {video_tag}")
 
+    @_sharing_state
+    @_journaled
     def flag_video(self, video_id, flag_reason=""):
         """Mark a video as flagged.
 
@@ -336,23 +676,28 @@ class VideoPlayer:
         """
         video_to_be_flag = self._video_library.get_video(video_id)
         if video_to_be_flag == None:
-            print("Cannot flag video: Video does not exist")
+            self._output.message("Cannot flag video: Video does not exist")
         else:
-            if video_to_be_flag._flag is True:
-                print("Cannot flag video: Video is already flagged")
+            if video_to_be_flag.flagged:
+                self._output.message("Cannot flag video: Video is already flagged")
             else:
-                if self._currentVideo is not None and self._currentVideo._video_id is video_to_be_flag._video_id:
-                    self.stop_video()
                 reason = flag_reason if flag_reason != "" else "Not supplied"
-                print(f"Successfully flagged video: {video_to_be_flag._title} (reason: {reason})")
-                video_to_be_flag._flag, video_to_be_flag._flagreason = True, reason
-                self.latest_flagged_video = [video_id, reason]
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 11 
+                # Holding the playback lock, so that the video cannot start
+                # playing again before it is flagged.
+                with self._playback_lock:
+                    if self._currentVideo is not None and self._currentVideo == video_to_be_flag:
+                        self.stop_video()
+                    flagged = self._video_library.flag_video(video_id, reason)
+                if not flagged:
+                    self._output.message("Cannot flag video: Video is already flagged")
                 else:
-                    self._undo = False
+                    self._output.message(f"Successfully flagged video: {video_to_be_flag.title} (reason: {reason})")
+                    self._log("flag", video_id, reason)
+                    self._record(("allow_video", (video_id,)),
+                                 ("flag_video", (video_id, reason)))
 
+    @_sharing_state
+    @_journaled
     def allow_video(self, video_id):
         """Removes a flag from a video.
 
@@ -361,21 +706,21 @@ class VideoPlayer:
         """
         video_to_be_unflag = self._video_library.get_video(video_id)
         if video_to_be_unflag == None:
-            print("Cannot remove flag from video: Video does not exist")
+            self._output.message("Cannot remove flag from video: Video does not exist")
         else:
-            if video_to_be_unflag._flag is False:
-                print("Cannot remove flag from video: Video is not flagged")
+            flag_reason = video_to_be_unflag.flag_reason
+            if flag_reason is None or not self._video_library.allow_video(video_id):
+                self._output.message("Cannot remove flag from video: Video is not flagged")
             else:
-                print(f"Successfully removed flag from video: {video_to_be_unflag._title}")
-                video_to_be_unflag._flag, video_to_be_unflag._flagreason = False, None
-                self.latest_allowed_video = video_id
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 12 
-                else:
-                    self._undo = False
+                self._output.message(f"Successfully removed flag from video: {video_to_be_unflag.title}")
+                self._log("allow", video_id)
+                self._record(("flag_video", (video_id, flag_reason)),
+                             ("allow_video", (video_id,)))
     
     """Extra features"""
+    @_sharing_state
+    @_journaled
+    @_playing
     def play_playlist(self, playlist_name):
         """Play playlist"""
         playlist = self._allPlaylists.get(playlist_name.lower(), None)
@@ -383,22 +728,20 @@ class VideoPlayer:
             """Check if playlist exists"""
             raise CommandException(f"Cannot play playlist {playlist_name}: Playlist does not exist")
         else:
-            if not playlist._allVideos:
+            if not len(playlist):
                 """Check if playlist is empty"""
                 raise CommandException(f"Cannot play playlist {playlist_name}: Playlist is empty")
             else:
                 # if self._currentPlaylist is not None:
                 #     print(f"Stop playing current playlist: {self._currentPlaylist._playlist_name}")
 
-                print(f"Start playing playlist: {playlist_name}")
+                self._output.message(f"Start playing playlist: {playlist_name}")
                 self._currentPlaylist = playlist
-                self.play_video(playlist._allVideos_id[0])
-                if not self._undo:
-                    """For undo command"""
-                    self._lastCommand = 13 
-                else:
-                    self._undo = False
+                self.play_video(playlist.start())
                 
+    @_sharing_state
+    @_journaled
+    @_playing
     def next_video(self):
         """Skip to next video in the playlist"""
         curent_playlist = self._currentPlaylist
@@ -406,50 +749,63 @@ class VideoPlayer:
             """Check if any playlist is currently playing""" 
             raise CommandException("Cannot skip to next video: No playlist is currently playing")
         else:
-            if curent_playlist._playlist_position + 1 == len(curent_playlist._allVideos_id):
+            video_id = curent_playlist.next_video_id()
+            if video_id is None:
                 """Check current position in the playlist"""
                 raise CommandException("Cannot skip to next video: No next video available")
             else:
-                position = curent_playlist._playlist_position + 1
-                video_id = curent_playlist._allVideos_id[position]
                 self.play_video(video_id)
-                curent_playlist._playlist_position = position
 
+    @_sharing_state
+    @_playing
     def show_current_playlist(self):
         """Show the name of the current playlist"""
         current_Playlist = self._currentPlaylist
         if current_Playlist is None:
-            print("No playlist is currently playing")
+            self._output.message("No playlist is currently playing")
         else:
-            position = current_Playlist._playlist_position + 1
-            print(f"Current playlist: {current_Playlist._playlist_name} - {position}/{len(current_Playlist._allVideos_id)}")
+            index, removed, total = current_Playlist.cursor()
+            if removed:
+                # The cursor is on no video, after the index videos played.
+                self._output.message(f"Current playlist: {current_Playlist._playlist_name} - {index}/{total} played, current video removed")
+            else:
+                self._output.message(f"Current playlist: {current_Playlist._playlist_name} - {index + 1}/{total}")
             self.show_playing()
 
+    @_sharing_state
     def show_video_rating(self, video_id):
         video = self._video_library.get_video(video_id)
         if video == None:
             raise CommandException("Cannot show video rating: Video does not exist")
         else:
-            tags = " ".join(video._tags)
-            video_info = f"{video._title} ({video._video_id}) [{tags}]"
-            if video._flag is False and video._avg_rating != 0:
-                print(f"  {video_info}, Rating: {video._avg_rating}")
-            elif video._flag is False and video._avg_rating == 0:
-                print(f"  {video_info} - Video is not yet rated.")
+            self._show_rating(video)
+
+    def _show_rating(self, video):
+        self._output.message(self._rating_line(video))
+
+    def _rating_line(self, video):
+        """Returns the line describing a video and its rating."""
+        tags = " ".join(video.tags)
+        video_info = f"{video.title} ({video.video_id}) [{tags}]"
+        if not video.flagged and video.avg_rating != 0:
+            return f"  {video_info}, Rating: {video.avg_rating}"
+        elif not video.flagged and video.avg_rating == 0:
+            return f"  {video_info} - Video is not yet rated."
+        else:
+            if video.avg_rating == 0:
+                return f"  {video_info} - Video is not yet rated and FLAGGED (reason: {video.flag_reason})"
             else:
-                if video._avg_rating == 0:
-                    print(f"  {video_info} - Video is not yet rated and FLAGGED (reason: {video._flagreason})")
-                else:
-                    print(f"  {video_info}, Rating: {video._avg_rating} and FLAGGED (reason: {video._flagreason})")
+                return f"  {video_info}, Rating: {video.avg_rating} and FLAGGED (reason: {video.flag_reason})"
 
+    @_sharing_state
     def rate_video(self, video_id, rating):
         """Rate specified video"""
         video = self._video_library.get_video(video_id)
         if video == None:
             raise CommandException("Cannot rate video: Video does not exist")
         else:
-            if video._flag is True:
-                raise CommandException(f"Cannot rate video: Video is currently flagged (reason: {video._flagreason})")
+            if video.flagged:
+                raise CommandException(f"Cannot rate video: Video is currently flagged (reason: {video.flag_reason})")
             else:
                 try:
                     if not (1 <= float(rating) <= 5):
@@ -457,73 +813,221 @@ class VideoPlayer:
                 except ValueError:
                     raise CommandException("Video rating can only be a number")
 
-                video._rating.append(float(rating))
-                print(f"Successfully rated video: {video._title}, Current average rating: {video.rating()}")
+                self._video_library.rate_video(video_id, float(rating))
+                self._log("rate", video_id, float(rating))
+                self._output.message(f"Successfully rated video: {video.title}, Current average rating: {video.rating()}")
 
-    def show_videos_by_rating(self):
-        all_videos = self._video_library.get_all_videos()
-        print("Here's a list of all available videos:")
-        for video in sorted(all_videos, key=operator.attrgetter('_avg_rating'), reverse=True):
-            self.show_video_rating(video._video_id)
+    @_sharing_state
+    def show_videos_by_rating(self, limit=None):
+        """Show videos from the best to the worst rated.
 
-    def undo(self):
-        lastCommand = self._lastCommand
-        if lastCommand is None:
-            print("You have just started YT, there is no command to undo")
-        elif lastCommand == 0:
-            print("Cannot undo command consecutively and one has already been undone, please purchase YT premium to undo consecutively")
+        Args:
+            limit: Only show this many of the best rated videos.
+        """
+        videos = self._video_library.get_videos_by_rating(limit)
+        self._output.listing("Here's a list of all available videos:",
+                             [self._rating_line(video) for video in videos],
+                             videos)
+
+    def _record(self, undo, redo):
+        """Adds an undoable change to the command being run."""
+        changes = self._command.changes
+        if changes is not None:
+            changes.append(_Change(undo, redo))
+
+    def _log(self, *record):
+        """Appends a change to the state log, if the player has one."""
+        if self._state_log is None:
+            return
+        self._state_log.append(*record)
+        if (self._compact_every is not None
+                and len(self._state_log) >= self._compact_every):
+            self._compaction_due = True
+
+    def _restore_state(self, state, records):
+        """Restores the state recovered from a state log, silently.
+
+        Args:
+            state: The PlayerState of the snapshot, or None.
+            records: The records logged after the snapshot.
+        """
+        if state is not None:
+            for name, video_ids in state.playlists:
+                self._apply("create", name)
+                self._apply("refill", name, video_ids)
+            for video_id, reason in state.flags:
+                self._apply("flag", video_id, reason)
+            for video_id, record in state.ratings:
+                if self._video_library.get_video(video_id) is not None:
+                    self._video_library.restore_rating(video_id, record)
+        for record in records:
+            self._apply(*record)
+
+    def _apply(self, operation, *args):
+        """Makes a change read from the state log, without any output.
+
+        Changes to videos no longer in the library file are left out.
+        """
+        if operation in ("flag", "allow", "rate"):
+            if self._video_library.get_video(args[0]) is None:
+                return
+        if operation == "create":
+            name, = args
+            self._allPlaylists[name.lower()] = Playlist(name, self._output)
+        elif operation == "delete":
+            name, = args
+            del self._allPlaylists[name.lower()]
+        elif operation == "add":
+            name, video_id = args
+            video = self._video_library.get_video(video_id)
+            if video is not None:
+                self._allPlaylists[name.lower()]._append(video)
+        elif operation == "insert":
+            name, video_id, index = args
+            video = self._video_library.get_video(video_id)
+            if video is not None:
+                self._allPlaylists[name.lower()]._insert(index, video)
+        elif operation == "refill":
+            name, video_ids = args
+            for video_id in video_ids:
+                self._apply("add", name, video_id)
+        elif operation == "remove":
+            name, video_id = args
+            self._allPlaylists[name.lower()]._remove(video_id)
+        elif operation == "clear":
+            name, = args
+            self._allPlaylists[name.lower()]._clear()
+        elif operation == "flag":
+            self._video_library.flag_video(*args)
+        elif operation == "allow":
+            self._video_library.allow_video(*args)
+        elif operation == "rate":
+            self._video_library.rate_video(*args)
         else:
-            self._undo, self._lastCommand = True, 0
-            if lastCommand == 1:
-                self.stop_video()
-            elif lastCommand == 2:
-                if self._previousPlaylist is not None:
-                    self.play_playlist(self._previousPlaylist._playlist_name)
-                else:
-                    self.play_video(self._previousVideo._video_id)
+            raise ValueError(f"Unknown state log record: {operation}")
 
-            elif lastCommand == 3:
-                self.stop_video()
+    def _durable_state(self):
+        """Returns the playlists, flags and ratings as a PlayerState."""
+        with self._playlists_lock:
+            playlists = list(self._allPlaylists.values())
+        flags = []
+        ratings = []
+        for video in self._video_library.get_all_videos():
+            if video.flagged:
+                flags.append((video.video_id, video.flag_reason))
+            record = video.rating_record
+            if record is not None:
+                ratings.append((video.video_id, list(record)))
+        return PlayerState(
+            playlists=[(playlist._playlist_name,
+                        [video.video_id for video in playlist.videos()])
+                       for playlist in playlists],
+            flags=flags,
+            ratings=ratings)
 
-            elif lastCommand == 4:
-                self.continue_video()
+    @_owning_state
+    def compact_state(self):
+        """Compacts the state log into a snapshot of the current state.
+
+        It is done automatically every compact_every records. Commands
+        run by other threads wait until it is done, and it must not be
+        called from a command.
+        """
+        self._compaction_due = False
+        if self._state_log is not None:
+            self._state_log.compact(self._durable_state())
+
+    @_owning_state
+    def close(self):
+        """Makes sure every change is on disk and closes the state log."""
+        if self._state_log is not None:
+            self._state_log.close()
+            self._state_log = None
 
-            elif lastCommand == 5:
+    @_playing
+    def _playback(self):
+        """Returns what is playing as a _Playback."""
+        playlist = self._currentPlaylist
+        return _Playback(
+            None if self._currentVideo is None else self._currentVideo.video_id,
+            self._paused,
+            None if playlist is None else playlist._playlist_name,
+            None if playlist is None else playlist.cursor_index())
+
+    @_playing
+    def _restore_playback(self, video_id, paused, playlist_name, playlist_index):
+        """Goes back to playing what a _Playback describes."""
+        if video_id is None:
+            if self._currentVideo is not None:
+                self.stop_video()
+        else:
+            if self._currentVideo is None or self._currentVideo.video_id != video_id:
+                self.play_video(video_id)
+            if paused and not self._paused:
                 self.pause_video()
+            elif not paused and self._paused:
+                self.continue_video()
+        playlist = None
+        if playlist_name is not None:
+            playlist = self._allPlaylists.get(playlist_name.lower(), None)
+        if playlist is not None:
+            playlist.seek(playlist_index)
+        self._currentPlaylist = playlist
 
-            elif lastCommand == 6:
-                self.delete_playlist(list(self._allPlaylists.keys())[-1])
-
-            elif lastCommand == 7:
-                self.remove_from_playlist(self._latest_video_added_to_playlist[0], self._latest_video_added_to_playlist[1])
-
-            elif lastCommand == 8:
-                self.add_to_playlist(self._latest_video_removed_from_playlist[0], self._latest_video_removed_from_playlist[1])
-
-            elif lastCommand == 9:
-                playlist = self._latest_clearedPlaylist
-                playlist2 = self._allPlaylists[playlist._playlist_name.lower()]
-                playlist2._allVideos = playlist._allVideos
-                playlist2._allVideos_id = playlist._allVideos_id
-                self._latest_clearedPlaylist = None
-                print(f"Videos have been added back to playlist: {playlist2._playlist_name}")
-
-            elif lastCommand == 10:
-                playlist = self._latest_deletedPlaylist
-                self.create_playlist(playlist._playlist_name)
-                if playlist._allVideos_id:
-                    playlist2 = self._allPlaylists[playlist._playlist_name.lower()]
-                    playlist2._allVideos = playlist._allVideos
-                    playlist2._allVideos_id = playlist._allVideos_id
-                    print(f"Videos has been added back to playlist: {playlist2._playlist_name}")
-    
-                self._latest_deletedPlaylist = None
+    def _refill_playlist(self, playlist_name, video_ids):
+        """Adds the videos of a cleared playlist back to it."""
+        playlist = self._allPlaylists[playlist_name.lower()]
+        # Videos removed from the library since are left out.
+        videos = [video for video in map(self._video_library.get_video, video_ids)
+                  if video is not None]
+        for video in videos:
+            playlist._append(video)
+        self._log("refill", playlist_name, [video.video_id for video in videos])
+        self._output.message(f"Videos have been added back to playlist: {playlist._playlist_name}")
+
+    def _insert_into_playlist(self, playlist_name, video_id, index):
+        """Adds a removed video back at the index it was removed from."""
+        playlist = self._allPlaylists[playlist_name.lower()]
+        video = self._video_library.get_video(video_id)
+        if video is None:
+            self._output.message(f"Cannot add video to {playlist_name}: Video does not exist")
+            return
+        playlist._insert(index, video)
+        self._log("insert", playlist_name, video_id, index)
+        self._output.message(f"Added video to {playlist_name}: {video.title}")
 
-            elif lastCommand == 11:
-                self.allow_video(self._latest_flagged_video[0])
+    def _recreate_playlist(self, playlist_name, video_ids):
+        """Creates a deleted playlist again, with its videos."""
+        self.create_playlist(playlist_name)
+        if video_ids:
+            self._refill_playlist(playlist_name, video_ids)
 
-            elif lastCommand == 12:
-                self.flag_video(self.latest_allowed_video)
+    def _replay(self, source, target, action):
+        """Applies the undo or redo actions of the latest entry of a log."""
+        changes = source.pop()
+        self._command.replaying = True
+        try:
+            for change in (reversed(changes) if action == "undo" else changes):
+                method, args = getattr(change, action)
+                getattr(self, method)(*args)
+        finally:
+            self._command.replaying = False
+        target.append(changes)
 
-            elif lastCommand == 13:
-                self.stop_video()
\ No newline at end of file
+    @_sharing_state
+    def undo(self):
+        """Reverts the latest command that changed something."""
+        with self._journal_lock:
+            if not self._undo_log:
+                self._output.message("Cannot undo: No command to undo")
+            else:
+                self._replay(self._undo_log, self._redo_log, "undo")
+
+    @_sharing_state
+    def redo(self):
+        """Makes a command reverted by UNDO again."""
+        with self._journal_lock:
+            if not self._redo_log:
+                self._output.message("Cannot redo: No command to redo")
+            else:
+                self._replay(self._redo_log, self._undo_log, "redo")
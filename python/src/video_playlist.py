@@ -1,48 +1,346 @@
 """A video playlist class."""
 
+from .output_sink import TextSink
+import functools
+import threading
+
+# Playlists compact their slots once fewer than this share of them is in use.
+_MIN_LIVE_SHARE = 0.5
+
+
+def _synchronized(method):
+    """Runs a playlist method holding the lock of the playlist."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Playlist:
-    """A class used to represent a Playlist."""
-    def __init__(self, playlist_name):
-        """Playlist constructor."""
+    """A class used to represent a Playlist.
+
+    Videos are appended to an array of slots, and removing one only empties
+    its slot. A Fenwick tree counts the filled slots, so the index of a
+    video and the video at an index are found in O(log n). The cursor of a
+    playing playlist is a slot rather than an index, so it keeps pointing
+    at the same video when videos before it are added or removed.
+
+    Every public method holds the lock of the playlist, so a playlist can
+    be used from several threads, and different playlists in parallel.
+    """
+    def __init__(self, playlist_name, output=None):
+        """Playlist constructor.
+
+        Args:
+            playlist_name: The name of the playlist.
+            output: The OutputSink messages are written to, a TextSink
+                writing to standard output by default.
+        """
         self._playlist_name = playlist_name
+        self._output = TextSink() if output is None else output
         self._allVideos = {}
-        self._allVideos_id = []
-        self._playlist_position = 0
+        self._slots = []
+        self._slot_of = {}
+        # Fenwick tree over the slots, _tree[i] counting the filled slots
+        # in (i - lowbit(i), i]. Its size is one more than a power of two.
+        self._tree = [0, 0]
+        self._cursor = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._allVideos)
+
+    def __contains__(self, video_id):
+        return video_id in self._allVideos
+
+    def _grow(self):
+        """Doubles the capacity of the tree and rebuilds it."""
+        self._rebuild(2 * (len(self._tree) - 1))
+
+    def _rebuild(self, capacity):
+        """Rebuilds the tree over the current slots in O(capacity)."""
+        tree = [0] * (capacity + 1)
+        for slot, video_id in enumerate(self._slots, 1):
+            if video_id is not None:
+                tree[slot] = 1
+        for index in range(1, capacity + 1):
+            parent = index + (index & -index)
+            if parent <= capacity:
+                tree[parent] += tree[index]
+        self._tree = tree
+
+    def _update(self, slot, delta):
+        index = slot + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _count_before(self, slot):
+        """Returns how many filled slots come before the given slot."""
+        count = 0
+        while slot > 0:
+            count += self._tree[slot]
+            slot -= slot & -slot
+        return count
+
+    def _find(self, index):
+        """Returns the slot of the video at the given index."""
+        slot = 0
+        step = len(self._tree) - 1
+        while step:
+            if slot + step < len(self._tree) and self._tree[slot + step] <= index:
+                slot += step
+                index -= self._tree[slot]
+            step //= 2
+        return slot
+
+    def _compact(self):
+        """Drops the empty slots, keeping the one the cursor is at."""
+        slots = [video_id for slot, video_id in enumerate(self._slots)
+                 if video_id is not None or slot == self._cursor]
+        if self._cursor is not None:
+            self._cursor = self._count_before(self._cursor)
+        self._slots = slots
+        self._slot_of = {video_id: slot for slot, video_id in enumerate(slots)
+                         if video_id is not None}
+        capacity = 1
+        while capacity < len(slots):
+            capacity *= 2
+        self._rebuild(capacity)
+
+    @_synchronized
+    def _append(self, video):
+        """Adds a video at the end of the playlist."""
+        if len(self._slots) == len(self._tree) - 1:
+            self._grow()
+        slot = len(self._slots)
+        self._slots.append(video.video_id)
+        self._slot_of[video.video_id] = slot
+        self._allVideos[video.video_id] = video
+        self._update(slot, 1)
+
+    @_synchronized
+    def _insert(self, index, video):
+        """Adds a video at the given index of the playlist, in O(n).
+
+        The video is appended if the index is past the end.
+        """
+        if index >= len(self._allVideos):
+            self._append(video)
+            return
+        slot = self._find(index)
+        self._slots.insert(slot, video.video_id)
+        if self._cursor is not None and self._cursor >= slot:
+            self._cursor += 1
+        self._allVideos[video.video_id] = video
+        self._slot_of = {video_id: slot for slot, video_id
+                         in enumerate(self._slots) if video_id is not None}
+        # Keep the dict in playlist order.
+        self._allVideos = {video_id: self._allVideos[video_id]
+                           for video_id in self._slot_of}
+        capacity = len(self._tree) - 1
+        while capacity < len(self._slots):
+            capacity *= 2
+        self._rebuild(capacity)
+
+    @_synchronized
+    def index_of(self, video_id):
+        """Returns the index of a video in the playlist, or None."""
+        slot = self._slot_of.get(video_id)
+        return None if slot is None else self._count_before(slot)
+
+    @_synchronized
+    def video_at(self, index):
+        """Returns the video at the given index of the playlist."""
+        return self._allVideos[self._slots[self._find(index)]]
 
+    @_synchronized
+    def videos(self, offset=0, limit=None):
+        """Returns the videos of the playlist in order.
+
+        Args:
+            offset: How many videos to skip from the start.
+            limit: The most videos to return, all of them if None.
+        """
+        if offset == 0 and limit is None:
+            # Videos are added to and removed from the dict and the slots
+            # together, so the dict is in playlist order too.
+            return list(self._allVideos.values())
+        videos = []
+        if offset >= len(self._allVideos) or limit == 0:
+            return videos
+        # At least half of the slots are filled, so this reads at most
+        # about twice as many slots as it returns videos.
+        for slot in range(self._find(offset), len(self._slots)):
+            video_id = self._slots[slot]
+            if video_id is not None:
+                videos.append(self._allVideos[video_id])
+                if len(videos) == limit:
+                    break
+        return videos
+
+    @_synchronized
+    def start(self):
+        """Moves the cursor to the first video and returns its video_id."""
+        if not self._allVideos:
+            self._cursor = None
+            return None
+        self._cursor = self._find(0)
+        return self._slots[self._cursor]
+
+    @_synchronized
+    def next_video_id(self):
+        """Moves the cursor to the next video and returns its video_id.
+
+        Returns None, leaving the cursor in place, at the end of the
+        playlist.
+        """
+        if self._cursor is None:
+            return None
+        following = self._count_before(self._cursor + 1)
+        if following == len(self._allVideos):
+            return None
+        self._cursor = self._find(following)
+        return self._slots[self._cursor]
+
+    @_synchronized
+    def previous_video_id(self):
+        """Moves the cursor to the previous video and returns its video_id.
+
+        Returns None, leaving the cursor in place, at the start of the
+        playlist.
+        """
+        if self._cursor is None:
+            return None
+        preceding = self._count_before(self._cursor)
+        if preceding == 0:
+            return None
+        self._cursor = self._find(preceding - 1)
+        return self._slots[self._cursor]
+
+    @_synchronized
+    def seek(self, index):
+        """Moves the cursor to the video at the given index, if there is one."""
+        if index is not None and index < len(self._allVideos):
+            self._cursor = self._find(index)
+
+    @_synchronized
+    def cursor_index(self):
+        """Returns the index of the video the cursor is at.
+
+        If that video has been removed, this is the index of the video
+        that followed it, and 0 if the playlist has not been started.
+        """
+        if self._cursor is None:
+            return 0
+        return self._count_before(self._cursor)
+
+    @_synchronized
+    def cursor(self):
+        """Returns where the cursor is, read at once.
+
+        Returns:
+            The cursor_index(), whether the video the cursor is at has been
+            removed, and the number of videos in the playlist.
+        """
+        removed = self._cursor is not None and self._slots[self._cursor] is None
+        return self.cursor_index(), removed, len(self._allVideos)
+
+    @_synchronized
     def add_video(self, playlist_name, video):
-        if video._video_id in self._allVideos:
+        """Adds a video and returns whether it was not in the playlist yet."""
+        if video.video_id in self._allVideos:
             """ Check if video exists in the playlist"""
-            print(f"Cannot add video to {playlist_name}: Video already added")
+            self._output.message(f"Cannot add video to {playlist_name}: Video already added")
+            return False
         else:
-            self._allVideos[video._video_id] = video
-            self._allVideos_id.append(video._video_id)
-            print(f"Added video to {playlist_name}: {video._title}")
-    
-    def show_videos(self, playlist_name):
-        print(f"Showing playlist: {playlist_name}")
+            self._append(video)
+            self._output.message(f"Added video to {playlist_name}: {video.title}")
+            return True
+
+    @_synchronized
+    def show_videos(self, playlist_name, offset=0, limit=None):
+        """Lists the videos of the playlist, or limit of them from offset.
+
+        Returns:
+            Whether more videos follow the ones listed.
+        """
+        header = f"Showing playlist: {playlist_name}"
         if len(self._allVideos) == 0:
-            print("  No videos here yet")
+            self._output.listing(header, ["  No videos here yet"])
+            return False
         else:
-            for _, video in self._allVideos.items():
-                tags = " ".join(video._tags) 
-                video_info = f"{video._title} ({video._video_id}) [{tags}]"
-                if video._flag is False:
-                    print(f"  {video_info}")
+            videos = self.videos(offset, limit)
+            lines = []
+            for video in videos:
+                tags = " ".join(video.tags)
+                video_info = f"{video.title} ({video.video_id}) [{tags}]"
+                if not video.flagged:
+                    lines.append(f"  {video_info}")
                 else:
-                    print(f"  {video_info} - FLAGGED (reason: {video._flagreason})")
-    
+                    lines.append(f"  {video_info} - FLAGGED (reason: {video.flag_reason})")
+            self._output.listing(header, lines, videos)
+            return offset + len(videos) < len(self._allVideos)
+
+    @_synchronized
     def remove_video(self,  playlist_name, video_id):
-        video = self._allVideos.get(video_id, None)
+        """Removes a video and returns the index it was at, or None."""
+        index = self.index_of(video_id)
+        video = self._remove(video_id)
         if video is None:
-            print(f"Cannot remove video from {playlist_name}: Video is not in playlist")
+            self._output.message(f"Cannot remove video from {playlist_name}: Video is not in playlist")
+            return None
         else:
-            del self._allVideos[video._video_id]
-            self._allVideos_id.remove(video._video_id)
-            print(f"Removed video from {playlist_name}: {video._title}")
+            self._output.message(f"Removed video from {playlist_name}: {video.title}")
+            return index
 
+    @_synchronized
+    def _remove(self, video_id):
+        """Removes a video and returns it, or None if it was not there."""
+        video = self._allVideos.pop(video_id, None)
+        if video is not None:
+            slot = self._slot_of.pop(video_id)
+            self._slots[slot] = None
+            self._update(slot, -1)
+            if len(self._allVideos) < _MIN_LIVE_SHARE * len(self._slots):
+                self._compact()
+        return video
+
+    @_synchronized
+    def _refresh(self, get_video):
+        """Looks every video up again, removing those no longer found.
+
+        Args:
+            get_video: Returns the Video of a video_id, or None.
+
+        Returns:
+            The video_ids of the removed videos.
+        """
+        removed = []
+        for video_id in list(self._allVideos):
+            video = get_video(video_id)
+            if video is None:
+                self._remove(video_id)
+                removed.append(video_id)
+            else:
+                self._allVideos[video_id] = video
+        return removed
+
+    @_synchronized
     def clear_playlist(self, playlist_name):
-        """Remove all videos from playlist"""
+        """Remove all videos from playlist, returning their video_ids."""
+        video_ids = self._clear()
+        self._output.message(f"Successfully removed all videos from {playlist_name}")
+        return video_ids
+
+    @_synchronized
+    def _clear(self):
+        """Removes all videos and returns their video_ids."""
+        video_ids = tuple(self._allVideos)
         self._allVideos.clear()
-        self._allVideos_id.clear()
-        self._playlist_position = 0
-        print(f"Successfully removed all videos from {playlist_name}")
\ No newline at end of file
+        self._slots.clear()
+        self._slot_of.clear()
+        self._tree = [0, 0]
+        self._cursor = None
+        return video_ids
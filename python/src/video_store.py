@@ -0,0 +1,400 @@
+"""A columnar video store class."""
+
+from array import array
+from collections import namedtuple
+
+
+RatingSummary = namedtuple(
+    "RatingSummary",
+    ["count", "average", "variance", "minimum", "maximum", "histogram"])
+RatingSummary.__doc__ = """The ratings of a video, aggregated.
+
+histogram: How many ratings fell in [1, 2), [2, 3), [3, 4), [4, 5) and 5.
+"""
+
+# Sum of squares, minimum and maximum of a video's ratings, followed by
+# its histogram.
+_SQUARES, _MINIMUM, _MAXIMUM, _HISTOGRAM = 0, 1, 2, 3
+_HISTOGRAM_BUCKETS = 5
+
+# A rating record is the rating count and sum followed by the details.
+_COUNT, _SUM, _DETAILS = 0, 1, 2
+
+
+class VideoStore:
+    """A class used to store the videos of a library column by column.
+
+    Every video is identified by its position, the order in which it was
+    appended. Titles and ids are kept in plain lists, tags as references
+    into a table of distinct tags, and flags as one byte per video. Flag
+    reasons are only stored for the videos that have them.
+
+    Ratings are not kept, only aggregated as they come in: every video has
+    a rating count and sum, and rated videos also a fixed-size array with
+    the sum of squares, minimum, maximum and histogram of their ratings.
+
+    Videos can be removed and replaced, e.g. when their library file
+    changes. A removed video keeps its position, but can no longer be
+    looked up by id.
+    """
+
+    def __init__(self):
+        """VideoStore constructor."""
+        self._titles = []
+        self._video_ids = []
+        self._positions = {}
+        # Distinct tags and their references. The tags of the video at
+        # position p are the refs between tag_offsets[p] and [p + 1].
+        self._tags = []
+        self._tag_refs_by_tag = {}
+        self._tag_offsets = array("Q", [0])
+        self._tag_refs = array("I")
+        self._flags = bytearray()
+        self._flag_reasons = {}
+        self._rating_counts = array("I")
+        self._rating_sums = array("d")
+        self._rating_details = {}
+        # Tags of the videos replaced with other tags than they had, which
+        # the tag columns cannot hold without moving every later video.
+        self._replaced_tags = {}
+
+    @classmethod
+    def from_columns(cls, titles, video_ids, tags, tag_offsets, tag_refs):
+        """Builds a store from already parsed columns.
+
+        Args:
+            titles: The title of every video, in store order.
+            video_ids: The id of every video, in store order.
+            tags: The table of distinct tags.
+            tag_offsets: For every video, where its refs start in tag_refs,
+                followed by the total number of refs.
+            tag_refs: The positions in tags of the tags of every video.
+        """
+        store = cls()
+        store._titles = list(titles)
+        store._video_ids = list(video_ids)
+        store._positions = dict(zip(store._video_ids,
+                                    range(len(store._video_ids))))
+        store._tags = list(tags)
+        store._tag_refs_by_tag = dict(zip(store._tags,
+                                          range(len(store._tags))))
+        store._tag_offsets = array("Q")
+        store._tag_offsets.frombytes(memoryview(tag_offsets).cast("B"))
+        store._tag_refs = array("I")
+        store._tag_refs.frombytes(memoryview(tag_refs).cast("B"))
+        store._flags = bytearray(len(store._titles))
+        store._rating_counts = array("I", bytes(4 * len(store._titles)))
+        store._rating_sums = array("d", bytes(8 * len(store._titles)))
+        return store
+
+    def __len__(self):
+        return len(self._titles)
+
+    def append(self, title, video_id, tags):
+        """Adds a video and returns its position."""
+        position = len(self._titles)
+        self._titles.append(title)
+        self._video_ids.append(video_id)
+        self._positions[video_id] = position
+        for tag in tags:
+            ref = self._tag_refs_by_tag.get(tag)
+            if ref is None:
+                ref = self._tag_refs_by_tag[tag] = len(self._tags)
+                self._tags.append(tag)
+            self._tag_refs.append(ref)
+        self._tag_offsets.append(len(self._tag_refs))
+        self._flags.append(False)
+        self._rating_counts.append(0)
+        self._rating_sums.append(0)
+        return position
+
+    def remove(self, position):
+        """Removes a video, so that it can no longer be looked up by id."""
+        video_id = self._video_ids[position]
+        if self._positions.get(video_id) == position:
+            del self._positions[video_id]
+
+    def replace(self, position, title, tags):
+        """Gives a video another title and tags."""
+        self._titles[position] = title
+        tags = tuple(tags)
+        if tags != self.tags(position):
+            self._replaced_tags[position] = tags
+
+    def copy(self):
+        """Returns a store with the same videos, flags and ratings."""
+        store = VideoStore()
+        store._titles = list(self._titles)
+        store._video_ids = list(self._video_ids)
+        store._positions = dict(self._positions)
+        store._tags = list(self._tags)
+        store._tag_refs_by_tag = dict(self._tag_refs_by_tag)
+        store._tag_offsets = array("Q", self._tag_offsets)
+        store._tag_refs = array("I", self._tag_refs)
+        store._flags = bytearray(self._flags)
+        store._flag_reasons = dict(self._flag_reasons)
+        store._rating_counts = array("I", self._rating_counts)
+        store._rating_sums = array("d", self._rating_sums)
+        store._rating_details = {position: array("d", details)
+                                 for position, details
+                                 in self._rating_details.items()}
+        store._replaced_tags = dict(self._replaced_tags)
+        return store
+
+    def position(self, video_id):
+        """Returns the position of a video, or None if it is not stored."""
+        return self._positions.get(video_id)
+
+    def video_positions(self):
+        """Returns the (video_id, position) pairs of the stored videos."""
+        return self._positions.items()
+
+    def title(self, position):
+        return self._titles[position]
+
+    def video_id(self, position):
+        return self._video_ids[position]
+
+    def tags(self, position):
+        if self._replaced_tags and position in self._replaced_tags:
+            return self._replaced_tags[position]
+        start, end = self._tag_offsets[position], self._tag_offsets[position + 1]
+        return tuple(self._tags[ref] for ref in self._tag_refs[start:end])
+
+    def tag_columns(self):
+        """Returns the tag table, the tag offsets and the tag refs.
+
+        The tags given by replace() are not in the columns.
+        """
+        return self._tags, self._tag_offsets, self._tag_refs
+
+    def flag_reason(self, position):
+        """Returns why a video is flagged, or None if it is not flagged."""
+        if not self._flags[position]:
+            return None
+        return self._flag_reasons[position]
+
+    def set_flag(self, position, reason):
+        self._flags[position] = True
+        self._flag_reasons[position] = reason
+
+    def clear_flag(self, position):
+        self._flags[position] = False
+        del self._flag_reasons[position]
+
+    def average_rating(self, position):
+        """Returns the average rating of a video, 0 if not yet rated."""
+        count = self._rating_counts[position]
+        return self._rating_sums[position]/count if count else 0
+
+    def add_rating(self, position, rating):
+        """Adds a rating from 1 to 5 to the aggregates of a video."""
+        self._rating_counts[position] += 1
+        self._rating_sums[position] += rating
+        details = self._rating_details.get(position)
+        if details is None:
+            details = self._rating_details[position] = _new_details(rating)
+        _add_to_details(details, rating)
+
+    def rating_summary(self, position):
+        """Returns the RatingSummary of a video, or None if not yet rated."""
+        count = self._rating_counts[position]
+        if not count:
+            return None
+        return _summarize(count, self._rating_sums[position],
+                          self._rating_details[position])
+
+    def rating_record(self, position):
+        """Returns a copy of the aggregated ratings of a video.
+
+        The copy is the rating count and sum followed by the details array,
+        or None if the video is not yet rated.
+        """
+        count = self._rating_counts[position]
+        if not count:
+            return None
+        return array("d", [count, self._rating_sums[position]]) \
+            + self._rating_details[position]
+
+    def set_rating_record(self, position, record):
+        """Replaces the aggregated ratings of a video by a saved record."""
+        self._rating_counts[position] = int(record[_COUNT])
+        self._rating_sums[position] = record[_SUM]
+        self._rating_details[position] = array("d", record[_DETAILS:])
+
+    def overlay(self):
+        """Returns a VideoStoreOverlay of this store."""
+        return VideoStoreOverlay(self)
+
+
+def _summarize(count, total, details):
+    """Returns the RatingSummary of a video's aggregated ratings."""
+    average = total/count
+    return RatingSummary(
+        count=count,
+        average=average,
+        variance=max(details[_SQUARES]/count - average * average, 0),
+        minimum=details[_MINIMUM],
+        maximum=details[_MAXIMUM],
+        histogram=tuple(int(bucket) for bucket in details[_HISTOGRAM:]),
+    )
+
+
+def _new_details(rating):
+    """Returns the details array of a video before its first rating."""
+    return array("d", [0, rating, rating] + [0] * _HISTOGRAM_BUCKETS)
+
+
+def _add_to_details(details, rating, start=0):
+    """Adds a rating to the details array starting at details[start]."""
+    details[start + _SQUARES] += rating * rating
+    details[start + _MINIMUM] = min(details[start + _MINIMUM], rating)
+    details[start + _MAXIMUM] = max(details[start + _MAXIMUM], rating)
+    details[start + _HISTOGRAM + min(int(rating), _HISTOGRAM_BUCKETS) - 1] += 1
+
+
+class VideoStoreOverlay:
+    """A class used to give flags and ratings of its own to a shared store.
+
+    The overlay reads the videos from the store below it, which it never
+    changes. Flags and ratings are copied on write: only the videos
+    flagged, allowed or rated through the overlay take memory in it, the
+    others read through to the store below. That store must not itself
+    be changed while it has overlays.
+
+    Videos can only be added, removed or replaced through the overlay once
+    detach() has given it a copy of the store below.
+    """
+
+    def __init__(self, base):
+        """VideoStoreOverlay constructor.
+
+        Args:
+            base: The VideoStore, or VideoStoreOverlay, below the overlay.
+        """
+        self._bind(base)
+        # Flag reasons set through the overlay, None for a cleared flag.
+        self._flag_reasons = {}
+        # Rating records of the videos rated through the overlay.
+        self._ratings = {}
+
+    def _bind(self, base):
+        self._base = base
+        # The videos themselves are the base's; its methods are bound here
+        # so reading them costs no more than reading the base.
+        self.position = base.position
+        self.video_positions = base.video_positions
+        self.title = base.title
+        self.video_id = base.video_id
+        self.tags = base.tags
+
+    def __len__(self):
+        return len(self._base)
+
+    def tag_columns(self):
+        return self._base.tag_columns()
+
+    def overlaid_positions(self):
+        """Returns the positions flagged, allowed or rated through the overlay.
+
+        The overlays below it count too.
+        """
+        positions = self._flag_reasons.keys() | self._ratings.keys()
+        if isinstance(self._base, VideoStoreOverlay):
+            positions |= self._base.overlaid_positions()
+        return positions
+
+    def detach(self):
+        """Puts a copy of the store below under the overlay.
+
+        Views of the overlay's videos stay valid, and the store it was
+        made from is no longer read nor changed through it.
+        """
+        self._bind(self._base.copy())
+
+    def rebase(self, base):
+        """Puts another store below the overlay.
+
+        Args:
+            base: A store with the same videos at the same positions as
+                the one below, and maybe more.
+        """
+        self._bind(base)
+
+    def append(self, title, video_id, tags):
+        """Adds a video to the detached store and returns its position."""
+        return self._base.append(title, video_id, tags)
+
+    def remove(self, position):
+        """Removes a video of the detached store."""
+        self._base.remove(position)
+
+    def replace(self, position, title, tags):
+        """Gives a video of the detached store another title and tags."""
+        self._base.replace(position, title, tags)
+
+    def copy(self):
+        """Returns a VideoStore with the videos, flags and ratings seen here."""
+        store = self._base.copy()
+        for position, reason in self._flag_reasons.items():
+            if reason is not None:
+                store.set_flag(position, reason)
+            elif store.flag_reason(position) is not None:
+                store.clear_flag(position)
+        for position, record in self._ratings.items():
+            store.set_rating_record(position, record)
+        return store
+
+    def flag_reason(self, position):
+        """Returns why a video is flagged, or None if it is not flagged."""
+        if position in self._flag_reasons:
+            return self._flag_reasons[position]
+        return self._base.flag_reason(position)
+
+    def set_flag(self, position, reason):
+        self._flag_reasons[position] = reason
+
+    def clear_flag(self, position):
+        self._flag_reasons[position] = None
+
+    def average_rating(self, position):
+        """Returns the average rating of a video, 0 if not yet rated."""
+        record = self._ratings.get(position)
+        if record is None:
+            return self._base.average_rating(position)
+        return record[_SUM]/record[_COUNT]
+
+    def add_rating(self, position, rating):
+        """Adds a rating from 1 to 5 to the aggregates of a video."""
+        record = self._ratings.get(position)
+        if record is None:
+            record = self._base.rating_record(position)
+            if record is None:
+                record = array("d", [0, 0]) + _new_details(rating)
+            self._ratings[position] = record
+        record[_COUNT] += 1
+        record[_SUM] += rating
+        _add_to_details(record, rating, _DETAILS)
+
+    def rating_summary(self, position):
+        """Returns the RatingSummary of a video, or None if not yet rated."""
+        record = self._ratings.get(position)
+        if record is None:
+            return self._base.rating_summary(position)
+        return _summarize(int(record[_COUNT]), record[_SUM],
+                          record[_DETAILS:])
+
+    def rating_record(self, position):
+        """Returns a copy of the aggregated ratings of a video, or None."""
+        record = self._ratings.get(position)
+        if record is None:
+            return self._base.rating_record(position)
+        return array("d", record)
+
+    def set_rating_record(self, position, record):
+        """Replaces the aggregated ratings of a video by a saved record."""
+        self._ratings[position] = array("d", record)
+
+    def overlay(self):
+        """Returns a VideoStoreOverlay of this overlay."""
+        return VideoStoreOverlay(self)
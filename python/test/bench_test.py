@@ -0,0 +1,31 @@
+import json
+
+from bench import catalogue, harness
+from src.command_parser import _COMMANDS
+from src.video_library import VideoLibrary
+
+
+def test_generated_catalogue_loads(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    catalogue.generate(videos_path, 300, seed=1)
+    library = VideoLibrary(videos_path)
+    videos = library.get_all_videos()
+    assert len(videos) == 300
+    assert len({video.video_id for video in videos}) == 300
+    assert all(2 <= len(video.title.split()) <= 8 for video in videos)
+    assert all(len(set(video.tags)) == len(video.tags) <= 6
+               for video in videos)
+    catalogue.generate(tmp_path / "again.txt", 300, seed=1)
+    assert (tmp_path / "again.txt").read_text() == videos_path.read_text()
+
+
+def test_every_command_is_timed(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    harness.main(["200", "--repeat", "2", "--data-dir", str(tmp_path),
+                  "--output", str(output_path)])
+    results = [json.loads(line)
+               for line in output_path.read_text().splitlines()]
+    benchmarks = {result["benchmark"].split()[0] for result in results}
+    assert set(_COMMANDS) | {"load"} == benchmarks
+    assert all(result["size"] == 200 and result["min_us"] > 0
+               for result in results)
@@ -0,0 +1,175 @@
+import os
+
+import pytest
+
+from src.command_parser import CommandException, CommandParser
+from src.video_library import VideoLibrary
+from src.video_player import VideoPlayer
+
+
+def test_commands_are_case_insensitive(capfd):
+    parser = CommandParser(VideoPlayer())
+    parser.execute_command(["number_of_videos"])
+    out, err = capfd.readouterr()
+    assert "5 videos in the library" in out
+
+
+def test_wrong_number_of_arguments_raises_usage():
+    parser = CommandParser(VideoPlayer())
+    with pytest.raises(CommandException,
+                       match="Please enter PLAY command followed by video_id."):
+        parser.execute_command(["PLAY"])
+    with pytest.raises(CommandException, match="RATE_VIDEO command"):
+        parser.execute_command(["RATE_VIDEO", "a", "1", "2"])
+
+
+def test_commands_without_arguments_ignore_extra_ones(capfd):
+    parser = CommandParser(VideoPlayer())
+    parser.execute_command(["NUMBER_OF_VIDEOS", "please"])
+    out, err = capfd.readouterr()
+    assert "5 videos in the library" in out
+
+
+def test_added_command_is_executed_and_listed_in_help(capfd):
+    parser = CommandParser(VideoPlayer())
+    parser.add_command(
+        "ECHO", lambda player, text: player.output.message(text),
+        "ECHO <text>", "Shows the text.", 1, 1,
+        "Please enter ECHO command followed by a text.")
+    parser.execute_command(["ECHO", "hello"])
+    parser.execute_command(["HELP"])
+    out, err = capfd.readouterr()
+    lines = out.strip().splitlines()
+    assert lines[0] == "hello"
+    assert "    ECHO <text> - Shows the text." in lines
+    assert lines[-1] == "    EXIT - Terminates the program execution."
+    assert lines[-2] == "    HELP - Displays help."
+
+
+def test_limit_of_rating_order_must_be_decimal():
+    parser = CommandParser(VideoPlayer())
+    for limit in ("0", "x", "\u00b3"):
+        with pytest.raises(CommandException, match="SHOW_VIDEOS_BY_RATING"):
+            parser.execute_command(["SHOW_VIDEOS_BY_RATING", limit])
+
+
+def test_ranked_search_takes_a_limit(capfd):
+    parser = CommandParser(VideoPlayer(ask=lambda prompt: "No"))
+    parser.execute_command(["SEARCH_VIDEOS_RANKED", "a", "2"])
+    out, err = capfd.readouterr()
+    assert out.splitlines()[:3] == [
+        "Here are the results for a:",
+        "  1) Amazing Cats (amazing_cats_video_id) [#cat #animal]",
+        "  2) Another Cat Video (another_cat_video_id) [#cat #animal]"]
+    for limit in ("none", "\u00b2"):
+        with pytest.raises(CommandException, match="SEARCH_VIDEOS_RANKED"):
+            parser.execute_command(["SEARCH_VIDEOS_RANKED", "a", limit])
+
+
+def test_search_pages_keep_their_numbers(capfd):
+    answers = ["No", "4"]
+    player = VideoPlayer(ask=lambda prompt: answers.pop(0))
+    parser = CommandParser(player)
+    parser.execute_command(["SEARCH_VIDEOS", "o", "LIMIT", "2"])
+    parser.execute_command(["SEARCH_VIDEOS", "o", "LIMIT", "2", "OFFSET", "2"])
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert lines[1:4] == [
+        "  1) Another Cat Video (another_cat_video_id) [#cat #animal]",
+        "  2) Funny Dogs (funny_dogs_video_id) [#dog #animal]",
+        "More results follow: repeat the command with OFFSET 2 to see them"]
+    assert "  3) Life at Google (life_at_google_video_id) [#google #career]" \
+        in lines
+    assert "  4) Video about nothing (nothing_video_id) []" in lines
+    assert not lines[-2].startswith("More results follow")
+    assert lines[-1] == "Playing video: Video about nothing"
+
+
+def test_show_all_videos_pages(capfd):
+    parser = CommandParser(VideoPlayer())
+    parser.execute_command(["SHOW_ALL_VIDEOS", "LIMIT", "2", "OFFSET", "3"])
+    out, err = capfd.readouterr()
+    assert out.splitlines() == [
+        "Here's a list of all available videos:",
+        "  Life at Google (life_at_google_video_id) [#google #career]",
+        "  Video about nothing (nothing_video_id) []"]
+
+
+def test_bad_pages_raise_usage():
+    parser = CommandParser(VideoPlayer())
+    for args in (["LIMIT", "0"], ["LIMIT", "x"], ["OFFSET", "-1"],
+                 ["LIMIT", "\u00b2"], ["LIMIT", "2", "LIMIT", "3"],
+                 ["OFFSET", "1", "LIMIT", "2", "offset", "3"]):
+        with pytest.raises(CommandException, match="LIMIT"):
+            parser.execute_command(["SHOW_ALL_VIDEOS"] + args)
+
+
+def test_reload_library_keeps_playlists_and_flags(tmp_path, capfd):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("First | first_id | #a\nSecond | second_id |\n"
+                           "Third | third_id | #b\n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+    parser = CommandParser(VideoPlayer(library=VideoLibrary(videos_path)))
+    parser.execute_command(["CREATE_PLAYLIST", "mine"])
+    parser.execute_command(["ADD_TO_PLAYLIST", "mine", "first_id"])
+    parser.execute_command(["FLAG_VIDEO", "third_id", "old"])
+    videos_path.write_text("First again | first_id | #a,#c\n"
+                           "Third | third_id | #b\nFourth | fourth_id |\n")
+    os.utime(videos_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+    capfd.readouterr()
+    parser.execute_command(["RELOAD_LIBRARY"])
+    parser.execute_command(["RELOAD_LIBRARY"])
+    parser.execute_command(["SHOW_PLAYLIST", "mine"])
+    parser.execute_command(["SHOW_ALL_VIDEOS"])
+    out, err = capfd.readouterr()
+    assert out.splitlines() == [
+        "Reloaded library: 1 added, 1 removed, 1 changed",
+        "Library is up to date",
+        "Showing playlist: mine",
+        "  First again (first_id) [#a #c]",
+        "Here's a list of all available videos:",
+        "  First again (first_id) [#a #c]",
+        "  Fourth (fourth_id) []",
+        "  Third (third_id) [#b] - FLAGGED (reason: old)"]
+
+
+def test_reload_library_drops_removed_videos(tmp_path, capfd):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("First | first_id |\nSecond | second_id |\n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+    state_path = tmp_path / "state.log"
+    player = VideoPlayer(library=VideoLibrary(videos_path),
+                         state_path=state_path)
+    parser = CommandParser(player)
+    parser.execute_command(["CREATE_PLAYLIST", "mine"])
+    parser.execute_command(["ADD_TO_PLAYLIST", "mine", "first_id"])
+    parser.execute_command(["ADD_TO_PLAYLIST", "mine", "second_id"])
+    parser.execute_command(["REMOVE_FROM_PLAYLIST", "mine", "first_id"])
+    parser.execute_command(["PLAY_PLAYLIST", "mine"])
+    videos_path.write_text("First | first_id |\n")
+    os.utime(videos_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+    capfd.readouterr()
+    parser.execute_command(["RELOAD_LIBRARY"])
+    parser.execute_command(["SHOW_PLAYING"])
+    parser.execute_command(["SHOW_PLAYLIST", "mine"])
+    parser.execute_command(["UNDO"])
+    parser.execute_command(["UNDO"])
+    parser.execute_command(["SHOW_PLAYLIST", "mine"])
+    player.close()
+    out, err = capfd.readouterr()
+    assert out.splitlines() == [
+        "Reloaded library: 0 added, 1 removed, 0 changed",
+        "Stopping video: Second",
+        "No video is currently playing",
+        "Showing playlist: mine",
+        "  No videos here yet",
+        "Added video to mine: First",
+        "Showing playlist: mine",
+        "  First (first_id) []"]
+
+    restarted = VideoPlayer(library=VideoLibrary(videos_path),
+                            state_path=state_path)
+    assert [video.video_id
+            for video in restarted._allPlaylists["mine"].videos()] == [
+        "first_id"]
+    restarted.close()
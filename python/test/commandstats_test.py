@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from src.command_parser import CommandException, CommandParser
+from src.command_stats import CommandStats, CommandTimings, bucket_bound
+from src.video_player import VideoPlayer
+
+
+def test_commands_are_counted_and_timed(capfd):
+    stats = CommandStats()
+    parser = CommandParser(VideoPlayer(), stats)
+    parser.execute_command(["play", "amazing_cats_video_id"])
+    parser.execute_command(["PLAY", "funny_dogs_video_id"])
+    with pytest.raises(CommandException):
+        parser.execute_command(["RATE_VIDEO", "does_not_exist", "5"])
+    parser.execute_command(["NOT_A_COMMAND"])
+    timings = stats.timings()
+    assert set(timings) == {"PLAY", "RATE_VIDEO"}
+    assert timings["PLAY"].count == 2
+    assert sum(timings["PLAY"].histogram) == 2
+    assert 0 < timings["PLAY"].max_ns <= timings["PLAY"].total_ns
+
+    parser.execute_command(["STATS"])
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert lines[-3] == "Command statistics:"
+    assert lines[-2].startswith("  PLAY: 2 calls, mean ")
+    assert lines[-1].startswith("  RATE_VIDEO: 1 calls, mean ")
+
+
+def test_stats_without_instrumentation(capfd):
+    parser = CommandParser(VideoPlayer())
+    parser.execute_command(["PLAY", "amazing_cats_video_id"])
+    parser.execute_command(["STATS"])
+    out, err = capfd.readouterr()
+    assert out.splitlines()[-1] == "Command statistics are not being collected"
+
+
+def test_histogram_buckets_and_percentiles():
+    stats = CommandStats()
+    for elapsed_ns in [500, 1500, 2500, 3000, 10 ** 13]:
+        stats.record("PLAY", elapsed_ns)
+    timings = stats.timings()["PLAY"]
+    assert timings.histogram[:3] == (1, 1, 2)
+    assert timings.histogram[-1] == 1
+    assert CommandStats.percentile(timings, 0.5) == bucket_bound(2) == 4096
+    assert CommandStats.percentile(timings, 1) == 10 ** 13
+    assert CommandStats.percentile(
+        CommandTimings(1, 700, 700, timings.histogram), 0.1) == 700
+
+
+def test_dump_writes_json(tmp_path):
+    dump_path = tmp_path / "stats.json"
+    stats = CommandStats(dump_path)
+    stats.record("SHOW_ALL_VIDEOS", 2000)
+    stats.dump()
+    dumped = json.loads(dump_path.read_text())
+    assert dumped["commands"]["SHOW_ALL_VIDEOS"]["count"] == 1
+    assert dumped["commands"]["SHOW_ALL_VIDEOS"]["histogram"][1] == 1
+    assert dumped["bucket_bounds_ns"][:2] == [1024, 2048]
+    stats.reset()
+    stats.dump(tmp_path / "other.json")
+    assert json.loads((tmp_path / "other.json").read_text())["commands"] == {}
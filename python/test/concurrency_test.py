@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from src.output_sink import ListSink
+from src.video_library import VideoLibrary
+from src.video_player import VideoPlayer
+
+_THREADS = 8
+
+
+@pytest.fixture(autouse=True)
+def switch_often():
+    """Makes threads switch as often as possible to expose races."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture
+def library(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("".join(
+        f"Video {number} | video_{number} | #tag{number % 7}\n"
+        for number in range(200)))
+    return VideoLibrary(videos_path)
+
+
+def _run_threads(target):
+    threads = [threading.Thread(target=target, args=(index,))
+               for index in range(_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_ratings_are_not_lost(library):
+    session = library.session()
+
+    def rate(index):
+        for number in range(500):
+            session.rate_video(f"video_{number % 10}", 1 + (index + number) % 5)
+
+    _run_threads(rate)
+    total = 0
+    for number in range(10):
+        summary = session.get_video(f"video_{number}").rating_summary
+        total += summary.count
+        assert sum(summary.histogram) == summary.count
+    assert total == _THREADS * 500
+    rated = session.get_videos_by_rating(10)
+    assert {video.video_id for video in rated} == {
+        f"video_{number}" for number in range(10)}
+    averages = [video.avg_rating for video in rated]
+    assert averages == sorted(averages, reverse=True)
+
+
+def test_concurrent_flags_keep_playable_videos_consistent(library):
+    session = library.session()
+
+    def flag_and_allow(index):
+        for round in range(50):
+            for number in range(index, 200, _THREADS):
+                session.flag_video(f"video_{number}", "reason")
+            for number in range(index, 200, 2 * _THREADS):
+                session.allow_video(f"video_{number}")
+
+    _run_threads(flag_and_allow)
+    playable = {video.video_id for video in session.get_all_videos()
+                if not video.flagged}
+    assert len(playable) == len(session._playable)
+    assert {session.get_video(video_id)._position
+            for video_id in playable} == set(session._playable)
+
+
+def test_concurrent_playlist_edits_are_not_lost(library):
+    player = VideoPlayer(output=ListSink(), library=library)
+    player.create_playlist("shared")
+
+    def edit(index):
+        player.create_playlist(f"own_{index}")
+        for number in range(index, 200, _THREADS):
+            player.add_to_playlist("shared", f"video_{number}")
+            player.add_to_playlist(f"own_{index}", f"video_{number}")
+        for number in range(index, 200, 2 * _THREADS):
+            player.remove_from_playlist("shared", f"video_{number}")
+
+    _run_threads(edit)
+    shared = player._allPlaylists["shared"]
+    removed = sum(len(range(index, 200, 2 * _THREADS))
+                  for index in range(_THREADS))
+    assert len(shared) == 200 - removed
+    for index, video in enumerate(shared.videos()):
+        assert shared.video_at(index) == video
+        assert shared.index_of(video.video_id) == index
+    for index in range(_THREADS):
+        assert len(player._allPlaylists[f"own_{index}"]) == 200 // _THREADS
+
+
+def test_concurrent_changes_survive_compaction(library, tmp_path):
+    state_path = tmp_path / "state.log"
+    player = VideoPlayer(output=ListSink(), library=library,
+                         state_path=state_path, compact_every=7)
+
+    def edit(index):
+        player.create_playlist(f"own_{index}")
+        for number in range(200):
+            player.add_to_playlist(f"own_{index}", f"video_{number}")
+
+    _run_threads(edit)
+    player.close()
+    restarted = VideoPlayer(output=ListSink(), library=library,
+                            state_path=state_path)
+    for index in range(_THREADS):
+        assert [video.video_id for video in
+                restarted._allPlaylists[f"own_{index}"].videos()] == [
+            f"video_{number}" for number in range(200)]
+    restarted.close()
+
+
+def test_commands_wait_for_a_reload(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("First | first_id |\n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+    sink = ListSink()
+    player = VideoPlayer(output=sink, library=VideoLibrary(videos_path))
+    library = player._video_library
+    reload = library.reload
+    reloading = threading.Event()
+
+    def slow_reload():
+        reloading.set()
+        time.sleep(0.2)
+        return reload()
+
+    library.reload = slow_reload
+    videos_path.write_text("First | first_id |\nSecond | second_id |\n")
+    os.utime(videos_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+    reloader = threading.Thread(target=player.reload_library)
+    reloader.start()
+    reloading.wait()
+    player.number_of_videos()
+    reloader.join()
+    assert sink.lines == ["Reloaded library: 1 added, 0 removed, 0 changed",
+                          "2 videos in the library"]
@@ -0,0 +1,48 @@
+import random
+
+from src.fuzzy_index import BKTree, edit_distance, max_typos, title_words
+
+
+def _plain_edit_distance(first, second):
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1,
+                               previous[column - 1]
+                               + (first_char != second_char)))
+        previous = current
+    return previous[-1]
+
+
+def test_edit_distance_matches_dynamic_programming():
+    rng = random.Random(5)
+    assert edit_distance("", "") == 0
+    assert edit_distance("kitten", "sitting") == 3
+    assert edit_distance("dogs", "dgos") == 2
+    for _ in range(2000):
+        first = "".join(rng.choice("abc") for _ in range(rng.randint(0, 12)))
+        second = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 70)))
+        assert edit_distance(first, second) == \
+               _plain_edit_distance(first, second)
+
+
+def test_bk_tree_finds_every_close_word():
+    rng = random.Random(6)
+    words = {"".join(rng.choice("abcde") for _ in range(rng.randint(1, 8)))
+             for _ in range(500)}
+    tree = BKTree(words)
+    tree.add(next(iter(words)))
+    assert len(tree) == len(words)
+    for query in ["abc", "eeee", "a", "abcdeabc", ""]:
+        for max_distance in range(3):
+            expected = {(word, edit_distance(query, word)) for word in words
+                        if edit_distance(query, word) <= max_distance}
+            assert set(tree.search(query, max_distance)) == expected
+    assert BKTree().search("abc", 2) == []
+
+
+def test_title_words_and_typos():
+    assert title_words("life at google's") == ["life", "at", "google", "s"]
+    assert [max_typos(word) for word in ["at", "cat", "cats", "amazing"]] == \
+           [0, 1, 1, 2]
@@ -0,0 +1,89 @@
+import os
+
+from src.library_snapshot import read_snapshot, snapshot_path
+from src.video_library import VideoLibrary
+
+
+VIDEOS = ("Funny Dogs | funny_dogs_video_id |  #dog , #animal\n"
+          "Amazing Cats | amazing_cats_video_id |  #cat , #animal\n"
+          "Video about nothing | nothing_video_id |\n")
+
+
+def _describe(videos):
+    return [(video.title, video.video_id, tuple(video.tags))
+            for video in videos]
+
+
+def test_snapshot_is_written_and_reused(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text(VIDEOS)
+    parsed = VideoLibrary(videos_path)
+    assert snapshot_path(videos_path).exists()
+    assert read_snapshot(videos_path) is not None
+
+    loaded = VideoLibrary(videos_path)
+    assert (_describe(loaded.get_videos_by_title())
+            == _describe(parsed.get_videos_by_title()))
+    assert (_describe(loaded.search_titles("a"))
+            == _describe(parsed.search_titles("a")))
+    assert (_describe(loaded.search_tags("#animal"))
+            == _describe(parsed.search_tags("#animal")))
+    assert loaded.get_video("nothing_video_id").tags == ()
+
+
+def test_snapshot_is_ignored_once_the_file_changes(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text(VIDEOS)
+    VideoLibrary(videos_path)
+    videos_path.write_text(VIDEOS + "Life at Google | life_at_google_video_id "
+                                    "|  #google , #career\n")
+    assert read_snapshot(videos_path) is None
+
+    library = VideoLibrary(videos_path)
+    assert len(library.get_all_videos()) == 4
+    assert read_snapshot(videos_path) is not None
+
+
+def test_snapshot_survives_touching_the_file(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text(VIDEOS)
+    VideoLibrary(videos_path)
+    stat = videos_path.stat()
+    os.utime(videos_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert read_snapshot(videos_path) is not None
+
+
+def test_corrupt_snapshot_is_ignored(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text(VIDEOS)
+    snapshot_path(videos_path).write_bytes(b"not a snapshot")
+    assert read_snapshot(videos_path) is None
+    assert len(VideoLibrary(videos_path).get_all_videos()) == 3
+
+
+def test_snapshot_of_a_file_changed_while_parsed_is_ignored(tmp_path,
+                                                            monkeypatch):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text(VIDEOS)
+    load_file = VideoLibrary._load_file
+
+    def load_and_change(library, path, workers=None):
+        source_chunks = load_file(library, path, workers)
+        path.write_text(VIDEOS.replace("Dogs", "Pigs"))
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        return source_chunks
+
+    monkeypatch.setattr(VideoLibrary, "_load_file", load_and_change)
+    VideoLibrary(videos_path)
+    assert snapshot_path(videos_path).exists()
+    assert read_snapshot(videos_path) is None
+
+
+def test_snapshot_of_a_parallel_load_survives_touching_the_file(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text(VIDEOS * 50)
+    VideoLibrary(videos_path, workers=2)
+    stat = videos_path.stat()
+    os.utime(videos_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert read_snapshot(videos_path) is not None
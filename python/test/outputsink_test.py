@@ -0,0 +1,72 @@
+import io
+
+from src.command_parser import CommandParser
+from src.output_sink import BufferedSink, Listing, ListSink, RecordingSink
+from src.video_player import VideoPlayer
+
+
+def test_list_sink_collects_lines(capfd):
+    sink = ListSink()
+    player = VideoPlayer(output=sink)
+    player.create_playlist("my_playlist")
+    player.add_to_playlist("my_playlist", "amazing_cats_video_id")
+    player.show_playlist("my_playlist")
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert sink.lines == [
+        "Successfully created new playlist: my_playlist",
+        "Added video to my_playlist: Amazing Cats",
+        "Showing playlist: my_playlist",
+        "  Amazing Cats (amazing_cats_video_id) [#cat #animal]",
+    ]
+
+
+def test_recording_sink_returns_listings_with_videos():
+    sink = RecordingSink()
+    player = VideoPlayer(output=sink)
+    player.flag_video("funny_dogs_video_id", "dont_like_dogs")
+    player.show_all_videos()
+    assert sink.results[0] == (
+        "Successfully flagged video: Funny Dogs (reason: dont_like_dogs)")
+    listing = sink.results[1]
+    assert isinstance(listing, Listing)
+    assert listing.header == "Here's a list of all available videos:"
+    assert len(listing.lines) == 5
+    assert [video.video_id for video in listing.videos] == [
+        "amazing_cats_video_id", "another_cat_video_id",
+        "funny_dogs_video_id", "life_at_google_video_id",
+        "nothing_video_id"]
+    assert listing.videos[2].flagged
+
+
+def test_recording_sink_keeps_search_results():
+    sink = RecordingSink()
+    player = VideoPlayer(ask=lambda prompt: "No", output=sink)
+    player.search_videos("cat")
+    listing = sink.results[0]
+    assert listing.header == "Here are the results for cat:"
+    assert [video.title for video in listing.videos] == [
+        "Amazing Cats", "Another Cat Video"]
+
+
+def test_buffered_sink_writes_when_flushed():
+    stream = io.StringIO()
+    sink = BufferedSink(stream)
+    parser = CommandParser(VideoPlayer(output=sink))
+    parser.execute_command(["NUMBER_OF_VIDEOS"])
+    parser.execute_command(["NOT_A_COMMAND"])
+    assert stream.getvalue() == ""
+    sink.flush()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "5 videos in the library" in lines[0]
+    assert "Please enter a valid command" in lines[1]
+
+
+def test_buffered_sink_flushes_when_full():
+    stream = io.StringIO()
+    sink = BufferedSink(stream, buffer_size=10)
+    sink.message("short")
+    assert stream.getvalue() == ""
+    sink.message("long enough")
+    assert stream.getvalue() == "short\nlong enough\n"
@@ -0,0 +1,38 @@
+import io
+
+from src.run import run_batch
+
+
+def test_run_batch_writes_all_output_to_the_stream(capfd):
+    output = io.StringIO()
+    count = run_batch(["NUMBER_OF_VIDEOS\n", "PLAY does_not_exist\n",
+                       "NO_SUCH_COMMAND\n", "NEXT\n"], output)
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert count == 4
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 4
+    assert "5 videos in the library" in lines[0]
+    assert "Cannot play video: Video does not exist" in lines[1]
+    assert "Please enter a valid command" in lines[2]
+    assert "Cannot skip to next video: No playlist is currently playing" \
+           in lines[3]
+
+
+def test_run_batch_skips_blank_and_comment_lines():
+    output = io.StringIO()
+    count = run_batch(["# Count the videos.\n", "\n", "   \n",
+                       "NUMBER_OF_VIDEOS\n", "  # Done.\n"], output)
+    assert count == 1
+    assert output.getvalue().splitlines() == ["5 videos in the library"]
+
+
+def test_run_batch_answers_prompts_from_the_script():
+    output = io.StringIO()
+    count = run_batch(["SEARCH_VIDEOS cat\n", "1\n", "SHOW_PLAYING\n",
+                       "EXIT\n", "NUMBER_OF_VIDEOS\n"], output)
+    assert count == 2
+    lines = output.getvalue().splitlines()
+    assert "Playing video: Amazing Cats" in lines[5]
+    assert "Currently playing: Amazing Cats" in lines[6]
+    assert len(lines) == 7
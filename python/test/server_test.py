@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+
+from src.server import start_server
+from src.video_library import VideoLibrary
+
+
+async def _talk(port, lines):
+    """Sends command lines to the server and returns the lines it sent."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write("".join(line + "\n" for line in lines).encode())
+    await writer.drain()
+    output = (await reader.read()).decode().splitlines()
+    writer.close()
+    return output
+
+
+def _run(*clients):
+    async def main():
+        server = await start_server(VideoLibrary(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(
+                *(_talk(port, lines) for lines in clients))
+    return asyncio.run(main())
+
+
+def test_server_runs_commands_until_exit():
+    output, = _run(["NUMBER_OF_VIDEOS", "PLAY", "EXIT", "NUMBER_OF_VIDEOS"])
+    assert output[0].startswith("Hello and welcome to YouTube")
+    assert output[2] == "5 videos in the library"
+    assert output[3] == "Please enter PLAY command followed by video_id."
+    assert output[4].startswith("YouTube has now terminated its execution.")
+    assert len(output) == 5
+
+
+def test_server_keeps_a_player_per_connection():
+    first, second = _run(
+        ["PLAY amazing_cats_video_id", "PAUSE", "SHOW_PLAYING", "EXIT"],
+        ["CREATE_PLAYLIST mine", "SHOW_PLAYING", "UNDO", "UNDO", "EXIT"])
+    assert first[-2] == ("Currently playing: Amazing Cats "
+                         "(amazing_cats_video_id) [#cat #animal] - PAUSED")
+    assert second[2:6] == [
+        "Successfully created new playlist: mine",
+        "No video is currently playing",
+        "Deleted playlist: mine",
+        "Cannot undo: No command to undo",
+    ]
+
+
+def test_server_answers_prompts_with_the_next_line():
+    output, = _run(["SEARCH_VIDEOS dog", "1", "SHOW_PLAYING", "EXIT"])
+    assert output[2] == "Here are the results for dog:"
+    assert output[6] == "Playing video: Funny Dogs"
+    assert output[7].startswith("Currently playing: Funny Dogs")
+
+
+def test_server_hands_the_reloaded_library_to_new_connections(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("First | first_id |\n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+
+    async def main():
+        server = await start_server(VideoLibrary(videos_path), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            before = await _talk(port, ["NUMBER_OF_VIDEOS", "EXIT"])
+            videos_path.write_text("First | first_id |\nSecond | second_id |\n")
+            os.utime(videos_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+            reloading = await _talk(
+                port, ["RELOAD_LIBRARY", "NUMBER_OF_VIDEOS", "EXIT"])
+            after = await _talk(port, ["NUMBER_OF_VIDEOS", "EXIT"])
+            return before, reloading, after
+
+    before, reloading, after = asyncio.run(main())
+    assert before[2] == "1 videos in the library"
+    assert reloading[2:4] == ["Reloaded library: 1 added, 0 removed, 0 changed",
+                              "2 videos in the library"]
+    assert after[2] == "2 videos in the library"
+
+
+class _SlowReloadLibrary(VideoLibrary):
+    """A library whose reload waits until another client has been served."""
+
+    served = threading.Event()
+
+    def reload(self):
+        if not self.served.wait(5):
+            raise AssertionError("the other client was not served")
+        return None
+
+
+def test_server_serves_others_during_a_slow_command():
+    async def main():
+        server = await start_server(_SlowReloadLibrary(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def other_client():
+            output = await _talk(port, ["NUMBER_OF_VIDEOS", "EXIT"])
+            _SlowReloadLibrary.served.set()
+            return output
+
+        async with server:
+            return await asyncio.gather(
+                _talk(port, ["RELOAD_LIBRARY", "EXIT"]), other_client())
+
+    reloading, other = asyncio.run(main())
+    assert other[2] == "5 videos in the library"
+    assert reloading[2] == "Library is up to date"
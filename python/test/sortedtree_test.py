@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+from src.sorted_tree import SortedTree
+
+
+def test_sorted_tree_keeps_keys_sorted():
+    rng = random.Random(5)
+    tree = SortedTree(rng.sample(range(1000), 300))
+    expected = sorted(tree)
+    for _ in range(2000):
+        key = rng.randrange(1000)
+        if key in expected:
+            tree = tree.remove(key)
+            expected.remove(key)
+        else:
+            tree = tree.add(key)
+            expected.append(key)
+            expected.sort()
+        assert len(tree) == len(expected)
+    assert list(tree) == expected
+
+
+def test_sorted_tree_is_left_as_it_was():
+    tree = SortedTree([(-5, 2), (-3, 1)])
+    walk = iter(tree)
+    assert next(walk) == (-5, 2)
+    newer = tree.add((-4, 0)).remove((-5, 2))
+    assert list(walk) == [(-3, 1)]
+    assert list(tree) == [(-5, 2), (-3, 1)]
+    assert list(newer) == [(-4, 0), (-3, 1)]
+    with pytest.raises(KeyError):
+        newer.remove((-5, 2))
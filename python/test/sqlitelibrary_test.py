@@ -0,0 +1,171 @@
+import os
+import random
+import sqlite3
+
+import pytest
+
+from src.output_sink import ListSink
+from src.sqlite_library import SQLiteVideoLibrary
+from src.video_library import VideoLibrary
+from src.video_player import VideoPlayer
+
+_WORDS = ["Amazing", "cats", "DOGS", "funny", "life", "Über", "straße",
+          "déjà", "vu", "a", "b"]
+
+
+@pytest.fixture
+def videos_path(tmp_path):
+    rng = random.Random(3)
+    lines = []
+    for number in range(500):
+        title = " ".join(rng.choice(_WORDS)
+                         for _ in range(rng.randint(1, 4)))
+        tags = ",".join("#" + rng.choice(_WORDS)
+                        for _ in range(rng.randint(0, 3)))
+        lines.append(f"{title} | video_{number} | {tags}\n")
+    path = tmp_path / "videos.txt"
+    path.write_text("".join(lines))
+    return path
+
+
+def _describe(videos):
+    return [(video.title, video.video_id, video.tags, video.flag_reason,
+             video.avg_rating) for video in videos]
+
+
+def test_sqlite_library_answers_like_video_library(videos_path, tmp_path):
+    expected = VideoLibrary(videos_path)
+    library = SQLiteVideoLibrary(tmp_path / "videos.db", videos_path)
+    assert _describe(library.get_all_videos()) == \
+           _describe(expected.get_all_videos())
+    assert _describe(library.get_videos_by_title()) == \
+           _describe(expected.get_videos_by_title())
+    assert _describe(library.get_videos_by_title(490, 20)) == \
+           _describe(expected.get_videos_by_title()[490:])
+    assert library.get_video("video_7").title == \
+           expected.get_video("video_7").title
+    assert library.get_video("does_not_exist") is None
+    for term in ["", "a", "CA", "ats", "Über", "STRASSE", "straße d", "xyz"]:
+        assert _describe(library.search_titles(term)) == \
+               _describe(expected.search_titles(term))
+    for term in ["amazng", "dgs", "strase", "funy", "dejà", "a", "b", "xyz"]:
+        assert _describe(library.search_titles_fuzzy(term)) == \
+               _describe(expected.search_titles_fuzzy(term))
+    for tag in ["#cats", "#CATS", "#d", "#", "", "#missing"]:
+        for prefix in (False, True):
+            assert _describe(library.search_tags(tag, prefix)) == \
+                   _describe(expected.search_tags(tag, prefix))
+
+
+def test_sqlite_sessions_keep_flags_and_ratings(videos_path, tmp_path):
+    expected = VideoLibrary(videos_path).session()
+    library = SQLiteVideoLibrary(tmp_path / "videos.db", videos_path)
+    session = library.session()
+    other_session = library.session()
+    rng = random.Random(4)
+    for number in range(300):
+        video_id = f"video_{rng.randrange(500)}"
+        rating = rng.randint(1, 5)
+        expected.rate_video(video_id, rating)
+        session.rate_video(video_id, rating)
+        if number % 3 == 0:
+            expected.flag_video(video_id, "reason")
+            session.flag_video(video_id, "reason")
+    assert _describe(session.get_videos_by_rating()) == \
+           _describe(expected.get_videos_by_rating())
+    assert _describe(session.get_videos_by_rating(7)) == \
+           _describe(expected.get_videos_by_rating(7))
+    for term in ["a", "cats", "#dogs", "ü", "xyz"]:
+        tag_names = {term, "#" + term}
+        assert [session._relevance(video._position, term, tag_names)
+                for video in session.search_titles_ranked(term, 15)] == \
+               [expected._relevance(video._position, term, tag_names)
+                for video in expected.search_titles_ranked(term, 15)]
+    for _ in range(20):
+        assert not session.get_random_playable_video(rng).flagged
+    assert not any(video.flagged or video.avg_rating
+                   for video in other_session.get_all_videos())
+
+
+def test_sqlite_database_is_rebuilt_when_the_file_changes(videos_path,
+                                                          tmp_path):
+    database_path = tmp_path / "videos.db"
+    assert len(SQLiteVideoLibrary(database_path, videos_path)
+               .get_all_videos()) == 500
+    with open(videos_path, "a") as videos_file:
+        videos_file.write("New Video | new_video_id | #new\n")
+    os.utime(videos_path, ns=(0, 0))
+    library = SQLiteVideoLibrary(database_path, videos_path)
+    assert library.get_video("new_video_id").tags == ("#new",)
+
+
+def test_player_plays_from_sqlite_library(tmp_path):
+    sink = ListSink()
+    library = SQLiteVideoLibrary(tmp_path / "videos.db")
+    player = VideoPlayer(ask=lambda prompt: "No", output=sink, library=library)
+    player.play_video("amazing_cats_video_id")
+    player.search_videos_tag("#DOG")
+    assert sink.lines[0] == "Playing video: Amazing Cats"
+    assert sink.lines[1] == "Here are the results for #DOG:"
+    assert sink.lines[2] == "  1) Funny Dogs (funny_dogs_video_id) [#dog #animal]"
+
+
+def test_sqlite_library_reloads_the_changed_file(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("First | first_id | #a\nSecond | second_id |\n"
+                           "Third | third_id | #b\n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+    core = SQLiteVideoLibrary(tmp_path / "videos.db", videos_path)
+    sink = ListSink()
+    player = VideoPlayer(ask=lambda prompt: "No", output=sink,
+                         library=core)
+    player.create_playlist("mine")
+    player.add_to_playlist("mine", "second_id")
+    player.add_to_playlist("mine", "third_id")
+    player.flag_video("first_id", "old")
+    player.rate_video("third_id", 4)
+    player.play_video("third_id")
+    other_session = core.session()
+    videos_path.write_text("Zero | zero_id |\nFirst | first_id | #a\n"
+                           "Third again | third_id | #b,#c\n")
+    os.utime(videos_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+    sink.lines.clear()
+    player.reload_library()
+    player.reload_library()
+    player.show_playing()
+    player.show_playlist("mine")
+    player.show_all_videos()
+    assert sink.lines == [
+        "Reloaded library: 1 added, 1 removed, 1 changed",
+        "Library is up to date",
+        "Currently playing: Third again (third_id) [#b #c]",
+        "Showing playlist: mine",
+        "  Third again (third_id) [#b #c]",
+        "Here's a list of all available videos:",
+        "  First (first_id) [#a] - FLAGGED (reason: old)",
+        "  Third again (third_id) [#b #c]",
+        "  Zero (zero_id) []"]
+    assert player._video_library.get_video("third_id").avg_rating == 4
+    assert player._video_library.get_videos_by_rating(1)[0].video_id == \
+           "third_id"
+    assert other_session.get_video("zero_id") is None
+    assert core.session().get_video("zero_id").title == "Zero"
+    player.close()
+
+
+def test_sqlite_reload_closes_the_connection_left_unused(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("First | first_id |\n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+    core = SQLiteVideoLibrary(tmp_path / "videos.db", videos_path)
+    session = core.session()
+    old_connection = core._connection
+    videos_path.write_text("First | first_id |\nSecond | second_id |\n")
+    os.utime(videos_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+    assert session.reload() is not None
+    # The library itself still reads from it.
+    assert core.get_video("first_id").title == "First"
+    core.reload()
+    assert core.get_video("second_id").title == "Second"
+    with pytest.raises(sqlite3.ProgrammingError):
+        old_connection.execute("SELECT 1")
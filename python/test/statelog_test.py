@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+
+from src.output_sink import ListSink
+from src.state_log import PlayerState, StateLog
+from src.video_library import VideoLibrary
+from src.video_player import VideoPlayer
+
+
+def _change_state(player):
+    player.create_playlist("my_PLAYlist")
+    player.add_to_playlist("my_playlist", "amazing_cats_video_id")
+    player.add_to_playlist("my_playlist", "funny_dogs_video_id")
+    player.add_to_playlist("my_playlist", "life_at_google_video_id")
+    player.remove_from_playlist("my_playlist", "funny_dogs_video_id")
+    player.remove_from_playlist("my_playlist", "amazing_cats_video_id")
+    player.undo()
+    player.create_playlist("gone")
+    player.delete_playlist("gone")
+    player.flag_video("nothing_video_id", "dont_like")
+    player.flag_video("another_cat_video_id")
+    player.allow_video("another_cat_video_id")
+    player.rate_video("amazing_cats_video_id", "4")
+    player.rate_video("amazing_cats_video_id", "2.5")
+    player.rate_video("funny_dogs_video_id", "5")
+
+
+def _describe(player):
+    sink = ListSink()
+    player._output = sink
+    player.show_all_playlists()
+    player.show_videos_by_rating()
+    # Playlists keep writing to the sink they were created with.
+    playlists = {name: [video.video_id for video in playlist.videos()]
+                 for name, playlist in player._allPlaylists.items()}
+    return sink.lines, playlists
+
+
+def test_state_survives_restart(tmp_path):
+    state_path = tmp_path / "state.log"
+    player = VideoPlayer(output=ListSink(), state_path=state_path)
+    _change_state(player)
+    expected = _describe(player)
+    player.close()
+
+    restarted = VideoPlayer(output=ListSink(), state_path=state_path)
+    assert _describe(restarted) == expected
+    lines, playlists = expected
+    assert "  my_PLAYlist" in lines
+    assert any("nothing_video_id" in line and "FLAGGED" in line
+               for line in lines)
+    assert playlists == {"my_playlist": ["amazing_cats_video_id",
+                                         "life_at_google_video_id"]}
+    restarted.close()
+
+
+def test_videos_removed_from_the_library_are_left_out(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("A | a | \nB | b | \nC | c | \n")
+    state_path = tmp_path / "state.log"
+    player = VideoPlayer(output=ListSink(), state_path=state_path,
+                         library=VideoLibrary(videos_path))
+    player.create_playlist("list")
+    for video_id in "abc":
+        player.add_to_playlist("list", video_id)
+    player.rate_video("b", "4")
+    player.flag_video("b")
+    player.compact_state()
+    player.rate_video("c", "3")
+    player.add_to_playlist("list", "b")
+    player.rate_video("a", "5")
+    player.flag_video("c")
+    player.allow_video("c")
+    player.close()
+    videos_path.write_text("A | a | \n")
+    os.utime(videos_path, ns=(10 ** 9, 10 ** 9))
+
+    restarted = VideoPlayer(output=ListSink(), state_path=state_path,
+                            library=VideoLibrary(videos_path))
+    assert _describe(restarted) == (
+        ["Showing all playlists:", "  list",
+         "Here's a list of all available videos:",
+         "  A (a) [], Rating: 5.0"],
+        {"list": ["a"]})
+    restarted.close()
+
+
+def test_compaction_keeps_state(tmp_path):
+    state_path = tmp_path / "state.log"
+    player = VideoPlayer(output=ListSink(), state_path=state_path,
+                         compact_every=5)
+    _change_state(player)
+    player.clear_playlist("my_playlist")
+    player.undo()
+    expected = _describe(player)
+    player.close()
+    assert len(state_path.read_text().splitlines()) < 5
+
+    restarted = VideoPlayer(output=ListSink(), state_path=state_path)
+    assert _describe(restarted) == expected
+    restarted.close()
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    state_path = tmp_path / "state.log"
+    state_log = StateLog(state_path)
+    state_log.append("create", "kept")
+    state_log.close()
+    with open(state_path, "a") as log_file:
+        log_file.write('["create", "to')
+
+    state_log = StateLog(state_path)
+    assert state_log.recovered() == (None, [["create", "kept"]])
+    state_log.append("create", "next")
+    state_log.close()
+    assert state_path.read_text().splitlines()[1:] == [
+        '["create", "kept"]', '["create", "next"]']
+
+
+def test_log_older_than_snapshot_is_ignored(tmp_path):
+    state_path = tmp_path / "state.log"
+    state_log = StateLog(state_path)
+    state_log.append("create", "compacted")
+    state_log.sync()
+    old_log = state_path.read_text()
+    state_log.compact(PlayerState([("compacted", [])], [], []))
+    state_log.close()
+    # As if the process died between writing the snapshot and the new log.
+    state_path.write_text(old_log)
+
+    state_log = StateLog(state_path)
+    state, records = state_log.recovered()
+    assert state.playlists == [("compacted", [])]
+    assert records == []
+    state_log.close()
+    assert json.loads(state_path.read_text()) == {"generation": 1}
+
+
+def test_compaction_releases_sync_waiters(tmp_path):
+    state_path = tmp_path / "state.log"
+    # The background sync waits long enough for the compaction to run first.
+    state_log = StateLog(state_path, sync_interval=60)
+    state_log.append("create", "compacted")
+    waiter = threading.Thread(target=state_log.sync, daemon=True)
+    waiter.start()
+    state_log.compact(PlayerState([("compacted", [])], [], []))
+    waiter.join(timeout=5)
+    assert not waiter.is_alive()
+    assert len(state_log) == 0
+    state_log.append("create", "next")
+    assert len(state_log) == 1
+    state_log.close()
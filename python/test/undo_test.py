@@ -0,0 +1,161 @@
+from src.video_player import VideoPlayer
+
+
+def test_undo_nothing(capfd):
+    player = VideoPlayer()
+    player.undo()
+    player.redo()
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 2
+    assert "Cannot undo: No command to undo" in lines[0]
+    assert "Cannot redo: No command to redo" in lines[1]
+
+
+def test_undo_several_commands(capfd):
+    player = VideoPlayer()
+    player.play_video("amazing_cats_video_id")
+    player.pause_video()
+    player.play_video("funny_dogs_video_id")
+    capfd.readouterr()
+    player.undo()
+    player.undo()
+    player.undo()
+    player.undo()
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 6
+    assert "Stopping video: Funny Dogs" in lines[0]
+    assert "Playing video: Amazing Cats" in lines[1]
+    assert "Pausing video: Amazing Cats" in lines[2]
+    assert "Continuing video: Amazing Cats" in lines[3]
+    assert "Stopping video: Amazing Cats" in lines[4]
+    assert "Cannot undo: No command to undo" in lines[5]
+
+
+def test_undo_and_redo_clear_playlist(capfd):
+    player = VideoPlayer()
+    player.create_playlist("my_playlist")
+    player.add_to_playlist("my_playlist", "amazing_cats_video_id")
+    player.add_to_playlist("my_playlist", "funny_dogs_video_id")
+    player.clear_playlist("my_playlist")
+    player.undo()
+    player.show_playlist("my_playlist")
+    player.redo()
+    player.show_playlist("my_playlist")
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 11
+    assert "Videos have been added back to playlist: my_playlist" in lines[4]
+    assert "Amazing Cats (amazing_cats_video_id) [#cat #animal]" in lines[6]
+    assert "Funny Dogs (funny_dogs_video_id) [#dog #animal]" in lines[7]
+    assert "Successfully removed all videos from my_playlist" in lines[8]
+    assert "No videos here yet" in lines[10]
+
+
+def test_undo_delete_playlist(capfd):
+    player = VideoPlayer()
+    player.create_playlist("my_PLAYlist")
+    player.add_to_playlist("my_playlist", "amazing_cats_video_id")
+    player.delete_playlist("my_playlist")
+    player.undo()
+    player.show_playlist("my_playlist")
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 7
+    assert "Successfully created new playlist: my_PLAYlist" in lines[3]
+    assert "Videos have been added back to playlist: my_PLAYlist" in lines[4]
+    assert "Amazing Cats (amazing_cats_video_id) [#cat #animal]" in lines[6]
+
+
+def test_undo_flag_video_plays_it_again(capfd):
+    player = VideoPlayer()
+    player.play_video("amazing_cats_video_id")
+    player.flag_video("amazing_cats_video_id", "dont_like_cats")
+    player.undo()
+    player.show_playing()
+    player.redo()
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 8
+    assert "Successfully removed flag from video: Amazing Cats" in lines[3]
+    assert "Playing video: Amazing Cats" in lines[4]
+    assert "Currently playing: Amazing Cats" in lines[5]
+    assert "Stopping video: Amazing Cats" in lines[6]
+    assert ("Successfully flagged video: Amazing Cats "
+            "(reason: dont_like_cats)") in lines[7]
+
+
+def test_new_command_discards_redo(capfd):
+    player = VideoPlayer()
+    player.create_playlist("my_playlist")
+    player.undo()
+    player.create_playlist("other_playlist")
+    player.redo()
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert "Cannot redo: No command to redo" in lines[-1]
+
+
+def test_undo_next_restores_the_playlist_cursor(capfd):
+    player = VideoPlayer()
+    player.create_playlist("my_playlist")
+    player.add_to_playlist("my_playlist", "amazing_cats_video_id")
+    player.add_to_playlist("my_playlist", "funny_dogs_video_id")
+    player.play_playlist("my_playlist")
+    player.next_video()
+    player.undo()
+    player.show_current_playlist()
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert "Current playlist: my_playlist - 1/2" in lines[-2]
+    assert "Currently playing: Amazing Cats" in lines[-1]
+
+
+def test_current_playlist_reports_a_removed_video_at_the_cursor(capfd):
+    player = VideoPlayer()
+    player.create_playlist("my_playlist")
+    for video_id in ["amazing_cats_video_id", "funny_dogs_video_id",
+                     "nothing_video_id"]:
+        player.add_to_playlist("my_playlist", video_id)
+    player.play_playlist("my_playlist")
+    player.next_video()
+    player.next_video()
+    player.remove_from_playlist("my_playlist", "nothing_video_id")
+    player.show_current_playlist()
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert lines[-2] == \
+        "Current playlist: my_playlist - 2/2 played, current video removed"
+
+
+def test_players_do_not_share_flags(capfd):
+    player = VideoPlayer()
+    other_player = VideoPlayer()
+    player.flag_video("amazing_cats_video_id")
+    other_player.play_video("amazing_cats_video_id")
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert "Playing video: Amazing Cats" in lines[1]
+
+
+def test_undo_remove_puts_the_video_back_in_place(capfd):
+    player = VideoPlayer()
+    player.create_playlist("my_playlist")
+    for video_id in ["amazing_cats_video_id", "funny_dogs_video_id",
+                     "life_at_google_video_id"]:
+        player.add_to_playlist("my_playlist", video_id)
+    player.remove_from_playlist("my_playlist", "funny_dogs_video_id")
+    player.undo()
+    player.redo()
+    player.undo()
+    player.show_playlist("my_playlist")
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert "Added video to my_playlist: Funny Dogs" in lines[5]
+    assert "Removed video from my_playlist: Funny Dogs" in lines[6]
+    assert lines[8:] == [
+        "Showing playlist: my_playlist",
+        "  Amazing Cats (amazing_cats_video_id) [#cat #animal]",
+        "  Funny Dogs (funny_dogs_video_id) [#dog #animal]",
+        "  Life at Google (life_at_google_video_id) [#google #career]"]
@@ -1,4 +1,11 @@
-from src.video_library import VideoLibrary
+import array
+import os
+import random
+
+import pytest
+
+from src.library_snapshot import snapshot_path
+from src.video_library import LibraryChanges, VideoLibrary
 
 
 def test_library_has_all_videos():
@@ -24,3 +31,377 @@ def test_parses_video_correctly_without_tags():
     assert video.title == "Video about nothing"
     assert video.video_id == "nothing_video_id"
     assert video.tags == ()
+
+
+def test_videos_by_title():
+    library = VideoLibrary()
+    assert [video.title for video in library.get_videos_by_title()] == [
+        "Amazing Cats", "Another Cat Video", "Funny Dogs", "Life at Google",
+        "Video about nothing"]
+
+
+def test_search_titles_matches_full_scan():
+    library = VideoLibrary()
+    for term in ["", "c", "CAT", "cats", "at google", "video about", "zzz",
+                 "Video about nothing!"]:
+        expected = [video for video in library.get_videos_by_title()
+                    if term.lower() in video.title.lower()]
+        assert library.search_titles(term) == expected
+
+
+def test_search_tags_matches_whole_tags_only():
+    library = VideoLibrary()
+    assert [video.video_id for video in library.search_tags("#CAT")] == [
+        "amazing_cats_video_id", "another_cat_video_id"]
+    assert library.search_tags("#ca") == []
+    assert library.search_tags("cat") == []
+
+
+def test_search_tags_prefix():
+    library = VideoLibrary()
+    assert [video.video_id for video in library.search_tags("#ca", True)] == [
+        "amazing_cats_video_id", "another_cat_video_id",
+        "life_at_google_video_id"]
+    assert len(library.search_tags("#", True)) == 4
+
+
+def test_videos_by_rating():
+    library = VideoLibrary()
+    library.rate_video("nothing_video_id", 4.0)
+    library.rate_video("funny_dogs_video_id", 4.0)
+    library.rate_video("nothing_video_id", 5.0)
+    library.rate_video("life_at_google_video_id", 4.0)
+    assert [video.video_id for video in library.get_videos_by_rating()] == [
+        "nothing_video_id", "funny_dogs_video_id", "life_at_google_video_id",
+        "amazing_cats_video_id", "another_cat_video_id"]
+    assert [video.video_id for video in library.get_videos_by_rating(2)] == [
+        "nothing_video_id", "funny_dogs_video_id"]
+    assert [video.video_id for video in library.get_videos_by_rating(4)][3] \
+        == "amazing_cats_video_id"
+
+
+def test_random_playable_video_skips_flagged_videos():
+    library = VideoLibrary()
+    rng = random.Random(0)
+    library.flag_video("funny_dogs_video_id", "dont_like_dogs")
+    library.flag_video("nothing_video_id", "Not supplied")
+    library.flag_video("amazing_cats_video_id", "Not supplied")
+    library.allow_video("funny_dogs_video_id")
+    picked = {library.get_random_playable_video(rng).video_id
+              for _ in range(100)}
+    assert picked == {"another_cat_video_id", "life_at_google_video_id",
+                      "funny_dogs_video_id"}
+
+    for video_id in picked:
+        library.flag_video(video_id, "Not supplied")
+    assert library.get_random_playable_video(rng) is None
+
+
+def test_sessions_keep_flags_and_ratings_apart():
+    library = VideoLibrary()
+    first = library.session()
+    second = library.session()
+    first.flag_video("funny_dogs_video_id", "dont_like_dogs")
+    first.rate_video("amazing_cats_video_id", 4)
+    second.rate_video("nothing_video_id", 2)
+
+    assert first.get_video("funny_dogs_video_id").flagged
+    assert not second.get_video("funny_dogs_video_id").flagged
+    assert not library.get_video("funny_dogs_video_id").flagged
+    assert first.get_videos_by_rating(1)[0].video_id == "amazing_cats_video_id"
+    assert second.get_videos_by_rating(1)[0].video_id == "nothing_video_id"
+    assert library.get_video("nothing_video_id").avg_rating == 0
+
+    rng = random.Random(0)
+    for _ in range(20):
+        assert first.get_random_playable_video(rng).video_id \
+               != "funny_dogs_video_id"
+    first.allow_video("funny_dogs_video_id")
+    assert not first.get_video("funny_dogs_video_id").flagged
+
+
+def test_shared_library_is_loaded_once():
+    assert VideoLibrary.shared() is VideoLibrary.shared()
+
+
+def test_fuzzy_search_tolerates_typos():
+    library = VideoLibrary()
+    for term, titles in [
+            ("Amazng", ["Amazing Cats"]),
+            ("googel", ["Life at Google"]),
+            ("cat", ["Amazing Cats", "Another Cat Video"]),
+            ("vdeo abut", ["Video about nothing"]),
+            ("at", ["Amazing Cats", "Another Cat Video", "Life at Google"]),
+            ("xyzzy", [])]:
+        assert [video.title
+                for video in library.search_titles_fuzzy(term)] == titles
+    assert library.search_titles_fuzzy("") == library.get_videos_by_title()
+
+
+def test_sessions_share_the_word_index():
+    library = VideoLibrary()
+    session = library.session()
+    session.search_titles_fuzzy("dgos")
+    assert library.session()._word_index.get() is session._word_index.get()
+
+
+def _ranked_by_brute_force(library, term, limit):
+    tag_names = {term.lower(), "#" + term.lower()}
+    scores = (library._relevance(position, term.lower(), tag_names)
+              for position in range(len(library.get_all_videos())))
+    return sorted((score for score in scores if score is not None),
+                  reverse=True)[:limit]
+
+
+def test_ranked_search_finds_the_best_scores(tmp_path):
+    rng = random.Random(8)
+    words = ["cat", "cats", "dog", "scatter", "google", "life", "a"]
+    lines = []
+    for number in range(400):
+        title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 5)))
+        tags = ",".join("#" + rng.choice(words)
+                        for _ in range(rng.randint(0, 2)))
+        lines.append(f"{title} | video_{number} | {tags}\n")
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("".join(lines))
+    library = VideoLibrary(videos_path).session()
+    for number in range(0, 400, 3):
+        library.rate_video(f"video_{number}", 1 + number % 5)
+    for number in range(0, 400, 5):
+        library.flag_video(f"video_{number}", "reason")
+    for term in ["cat", "CATS", "#dog", "a", "e g", "", "missing"]:
+        for limit in [1, 7, 20, 1000]:
+            videos = library.search_titles_ranked(term, limit)
+            scores = [library._relevance(video._position, term.lower(),
+                                         {term.lower(), "#" + term.lower()})
+                      for video in videos]
+            assert scores == _ranked_by_brute_force(library, term, limit)
+
+
+def test_ranked_search_order():
+    library = VideoLibrary().session()
+    assert [video.title for video in library.search_titles_ranked("cat")] == [
+        "Amazing Cats", "Another Cat Video"]
+    library.rate_video("another_cat_video_id", 5)
+    assert [video.title for video in library.search_titles_ranked("cat")] == [
+        "Another Cat Video", "Amazing Cats"]
+    # A tag match counts, even without the term in the title.
+    assert [video.title
+            for video in library.search_titles_ranked("animal", 1)] == [
+        "Another Cat Video"]
+    assert library.search_titles_ranked("video", 0) == []
+    # Flagged videos take no place among the results, and the videos left
+    # tie, so the first in the library comes first.
+    library.flag_video("another_cat_video_id", "reason")
+    assert [video.title
+            for video in library.search_titles_ranked("animal", 2)] == [
+        "Funny Dogs", "Amazing Cats"]
+
+
+def _write_library(videos_path, videos, version):
+    videos_path.write_text("".join(
+        f"{title} | {video_id} | {','.join(tags)}\n"
+        for video_id, (title, tags) in videos.items()))
+    # Every version gets its own modification time, however fast the
+    # file is rewritten.
+    os.utime(videos_path, ns=(version * 10 ** 9, version * 10 ** 9))
+
+
+def _random_video(rng, suffix):
+    words = ["cat", "cats", "dog", "scatter", "google", "life", "a", "Über"]
+    # The suffix keeps titles apart, so that title order has no ties.
+    title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+    tags = ["#" + rng.choice(words) for _ in range(rng.randint(0, 2))]
+    return f"{title} {suffix}", tags
+
+
+def _ids(videos):
+    return [video.video_id for video in videos]
+
+
+@pytest.mark.parametrize("use_session", [False, True])
+def test_reload_matches_a_fresh_load(tmp_path, use_session):
+    rng = random.Random(5)
+    videos_path = tmp_path / "videos.txt"
+    videos = {f"video_{number}": _random_video(rng, number)
+              for number in range(300)}
+    _write_library(videos_path, videos, 1)
+    parent = VideoLibrary(videos_path)
+    library = parent.session() if use_session else parent
+    library.search_titles_fuzzy("dgo")
+    for number in range(0, 300, 7):
+        library.rate_video(f"video_{number}", 1 + number % 5)
+        if number % 2:
+            library.flag_video(f"video_{number}", "reason")
+    flagged = {video.video_id for video in library.get_all_videos()
+               if video.flagged}
+    ratings = {video.video_id: video.avg_rating
+               for video in library.get_all_videos() if video.avg_rating}
+
+    next_number = 300
+    for version in range(2, 5):
+        for video_id in rng.sample(sorted(videos), 20):
+            del videos[video_id]
+        for video_id in rng.sample(sorted(videos), 20):
+            videos[video_id] = _random_video(rng, video_id)
+        for _ in range(20):
+            videos[f"video_{next_number}"] = _random_video(rng, next_number)
+            next_number += 1
+        _write_library(videos_path, videos, version)
+        changes = library.reload()
+        assert len(changes.removed) == len(changes.added) == 20
+        assert 10 < len(changes.changed) <= 20
+
+        fresh = VideoLibrary(videos_path)
+        assert sorted(_ids(library.get_all_videos())) == sorted(videos)
+        assert _ids(library.get_videos_by_title()) == \
+               _ids(fresh.get_videos_by_title())
+        for term in ["", "c", "CAT", "at", "e g", "über", "1", "xyz", "305",
+                     "scater 31", "googel lfe"]:
+            assert _ids(library.search_titles(term)) == \
+                   _ids(fresh.search_titles(term))
+            assert _ids(library.search_titles_fuzzy(term)) == \
+                   _ids(fresh.search_titles_fuzzy(term))
+            tag_names = {term.lower(), "#" + term.lower()}
+            assert [library._relevance(video._position, term.lower(),
+                                       tag_names)
+                    for video in library.search_titles_ranked(term, 10)] == \
+                   sorted((score for score in (
+                       library._relevance(position, term.lower(), tag_names)
+                       for position in library._live_positions())
+                       if score is not None), reverse=True)[:10]
+        for tag in ["#cat", "#CATS", "#d", "#", "#missing"]:
+            for prefix in (False, True):
+                assert _ids(library.search_tags(tag, prefix)) == \
+                       _ids(fresh.search_tags(tag, prefix))
+        for video_id in flagged & set(videos):
+            assert library.get_video(video_id).flagged
+        for video_id in set(ratings) & set(videos):
+            assert library.get_video(video_id).avg_rating == ratings[video_id]
+        assert set(_ids(library.get_videos_by_rating())) == set(videos)
+        for _ in range(50):
+            video = library.get_random_playable_video(rng)
+            assert video.video_id in videos and not video.flagged
+
+    assert library.reload() is None
+    if use_session:
+        assert len(parent.get_all_videos()) == 300
+        assert not parent.get_video("video_7").avg_rating
+
+
+def test_sessions_share_the_reloaded_library(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos = {f"video_{number}": (f"Video {number}", ["#tag"])
+              for number in range(10)}
+    _write_library(videos_path, videos, 1)
+    library = VideoLibrary.shared(videos_path)
+    first, second, third = (library.session() for _ in range(3))
+    first.flag_video("video_1", "reason")
+    first.rate_video("video_3", 4)
+    third.rate_video("video_2", 5)
+
+    del videos["video_1"], videos["video_2"]
+    videos["video_3"] = ("Changed", ["#tag"])
+    videos["video_10"] = ("Video 10", ["#tag"])
+    _write_library(videos_path, videos, 2)
+    assert first.reload() == LibraryChanges(
+        added=["video_10"], removed=["video_1", "video_2"],
+        changed=["video_3"])
+    del videos["video_10"]
+    videos["video_11"] = ("Video 11", [])
+    _write_library(videos_path, videos, 3)
+    assert second.reload() == LibraryChanges(
+        added=["video_11"], removed=["video_1", "video_2"],
+        changed=["video_3"])
+    assert first.reload() == LibraryChanges(
+        added=["video_11"], removed=["video_10"], changed=[])
+    # One successor for every change of the file, shared by the sessions.
+    assert first._title_index is second._title_index
+    assert second.reload() is None
+    assert third.reload() == LibraryChanges(
+        added=["video_11"], removed=["video_1", "video_2"],
+        changed=["video_3"])
+    assert third._title_index is first._title_index
+    fourth = library.session()
+    assert fourth._title_index is first._title_index
+    assert VideoLibrary.shared(videos_path) is fourth._parent
+
+    fresh = VideoLibrary(videos_path)
+    for session in (first, second, third, fourth):
+        assert sorted(_ids(session.get_all_videos())) == sorted(videos)
+        assert _ids(session.get_videos_by_title()) == \
+               _ids(fresh.get_videos_by_title())
+        assert _ids(session.search_titles("video 1")) == ["video_11"]
+    assert first.get_video("video_3").avg_rating == 4
+    assert not second.get_video("video_3").avg_rating
+    assert _ids(first.get_videos_by_rating(1)) == ["video_3"]
+    assert sorted(_ids(third.get_videos_by_rating())) == sorted(videos)
+    rng = random.Random(1)
+    for _ in range(50):
+        assert first.get_random_playable_video(rng).video_id in videos
+    # The library the sessions were made from is left as it was.
+    assert len(library.get_all_videos()) == 10
+    assert library.get_video("video_3").title == "Video 3"
+
+
+def _contents(library):
+    return {name: [list(value) if isinstance(value, (list, memoryview,
+                                                     array.array))
+                   else value for value in values]
+            for name, values in library._snapshot()._asdict().items()}
+
+
+def test_parallel_load_matches_serial_load(tmp_path):
+    rng = random.Random(6)
+    videos_path = tmp_path / "videos.txt"
+    lines = []
+    for number in range(500):
+        title, tags = _random_video(rng, number % 50)
+        lines.append(f" {title} | video_{number % 450} | {', '.join(tags)}")
+    # No newline at the end of the file, and one line ending in \r\n.
+    lines[200] += "\r"
+    videos_path.write_text("\n".join(lines), encoding="utf-8")
+    serial = _contents(VideoLibrary(videos_path, workers=1))
+    snapshot_path(videos_path).unlink()
+    assert _contents(VideoLibrary(videos_path, workers=3)) == serial
+
+
+def test_parallel_load_falls_back_on_titles_spanning_lines(tmp_path):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("".join(
+        f"Video {number} | video_{number} | #tag\n" for number in range(100))
+        + '"Two\nlines" | two_lines | #tag\n' * 3)
+    library = VideoLibrary(videos_path, workers=2)
+    assert library.get_video("two_lines").title == "Two\nlines"
+    snapshot_path(videos_path).unlink()
+    assert _contents(library) == _contents(VideoLibrary(videos_path, workers=1))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_repeated_video_ids_are_one_video(tmp_path, workers):
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("A | a1 | #x\nB | b1 |\n" * 20 + "Z | a1 | #y\n")
+    for library in (VideoLibrary(videos_path, workers=workers),
+                    VideoLibrary(videos_path, workers=workers)):
+        assert [(video.title, video.video_id, video.tags)
+                for video in library.get_all_videos()] == [
+            ("Z", "a1", ("#y",)), ("B", "b1", ())]
+        assert [video.title for video in library.search_titles("z")] == [
+            "Z"]
+        assert library.search_tags("#x") == []
+
+
+def test_ranked_search_breaks_ties_at_the_cut_off_by_library_order(tmp_path):
+    # Both videos only match by tag and score the same, but the tag stream
+    # reads them in title order, the later one first.
+    videos_path = tmp_path / "videos.txt"
+    videos_path.write_text("Zebra | zebra_id | #cat\n"
+                           "Aardvark | aardvark_id | #cat\n"
+                           "Lion | lion_id | #cat\n")
+    library = VideoLibrary(videos_path).session()
+    assert [video.video_id
+            for video in library.search_titles_ranked("cat", 1)] == [
+        "zebra_id"]
+    assert [video.video_id
+            for video in library.search_titles_ranked("cat", 2)] == [
+        "zebra_id", "aardvark_id"]
@@ -0,0 +1,111 @@
+import random
+
+from src.video import Video
+from src.video_playlist import Playlist
+
+
+def _video(number):
+    return Video(f"Video {number}", f"video_{number}", [])
+
+
+def test_playlist_matches_a_list_under_random_edits(capfd):
+    rng = random.Random(0)
+    videos = [_video(number) for number in range(50)]
+    playlist = Playlist("my_playlist")
+    expected = []
+    for _ in range(2000):
+        video = rng.choice(videos)
+        if video.video_id in expected:
+            playlist.remove_video("my_playlist", video.video_id)
+            expected.remove(video.video_id)
+        elif rng.random() < 0.3:
+            index = rng.randrange(len(expected) + 1)
+            playlist._insert(index, video)
+            expected.insert(index, video.video_id)
+        else:
+            playlist.add_video("my_playlist", video)
+            expected.append(video.video_id)
+        assert len(playlist) == len(expected)
+        if expected:
+            index = rng.randrange(len(expected))
+            assert playlist.video_at(index).video_id == expected[index]
+            assert playlist.index_of(expected[index]) == index
+    assert [video.video_id for video in playlist.videos()] == expected
+    capfd.readouterr()
+
+
+def test_cursor_survives_edits_before_it(capfd):
+    videos = [_video(number) for number in range(4)]
+    playlist = Playlist("my_playlist")
+    for video in videos:
+        playlist.add_video("my_playlist", video)
+    assert playlist.start() == "video_0"
+    assert playlist.next_video_id() == "video_1"
+    assert playlist.next_video_id() == "video_2"
+
+    playlist.remove_video("my_playlist", "video_0")
+    playlist.remove_video("my_playlist", "video_1")
+    assert playlist.cursor_index() == 0
+    assert playlist.next_video_id() == "video_3"
+    assert playlist.next_video_id() is None
+    assert playlist.previous_video_id() == "video_2"
+    assert playlist.previous_video_id() is None
+    capfd.readouterr()
+
+
+def test_removing_the_current_video_moves_on_to_the_next(capfd):
+    videos = [_video(number) for number in range(3)]
+    playlist = Playlist("my_playlist")
+    for video in videos:
+        playlist.add_video("my_playlist", video)
+    playlist.start()
+    playlist.next_video_id()
+    playlist.remove_video("my_playlist", "video_1")
+    assert playlist.cursor_index() == 1
+    assert playlist.next_video_id() == "video_2"
+    capfd.readouterr()
+
+
+def test_insert_keeps_the_cursor(capfd):
+    videos = [_video(number) for number in range(4)]
+    playlist = Playlist("my_playlist")
+    for video in videos[1:]:
+        playlist.add_video("my_playlist", video)
+    playlist.start()
+    assert playlist.next_video_id() == "video_2"
+    playlist._insert(0, videos[0])
+    assert playlist.cursor_index() == 2
+    assert playlist.next_video_id() == "video_3"
+    capfd.readouterr()
+
+
+def test_compaction_keeps_the_cursor(capfd):
+    videos = [_video(number) for number in range(8)]
+    playlist = Playlist("my_playlist")
+    for video in videos:
+        playlist.add_video("my_playlist", video)
+    playlist.start()
+    for _ in range(4):
+        playlist.next_video_id()
+    for number in [4, 0, 1, 2, 6]:
+        playlist.remove_video("my_playlist", f"video_{number}")
+    assert [video.video_id for video in playlist.videos()] == [
+        "video_3", "video_5", "video_7"]
+    assert playlist.cursor_index() == 1
+    assert playlist.next_video_id() == "video_5"
+    assert playlist.previous_video_id() == "video_3"
+    capfd.readouterr()
+
+
+def test_pages_skip_removed_videos(capfd):
+    videos = [_video(number) for number in range(10)]
+    playlist = Playlist("my_playlist")
+    for video in videos:
+        playlist.add_video("my_playlist", video)
+    for video in videos[::3]:
+        playlist.remove_video("my_playlist", video.video_id)
+    remaining = [video for video in videos if video not in videos[::3]]
+    assert playlist.videos(2, 3) == remaining[2:5]
+    assert playlist.videos(5, 10) == remaining[5:]
+    assert playlist.videos(6) == []
+    capfd.readouterr()
@@ -0,0 +1,121 @@
+import copy
+
+from src.video import Video
+from src.video_store import VideoStore
+
+
+def test_store_keeps_columns():
+    store = VideoStore()
+    first = store.append("Funny Dogs", "funny_dogs_video_id", ["#dog", "#animal"])
+    second = store.append("Amazing Cats", "amazing_cats_video_id", ["#cat", "#animal"])
+    assert (first, second) == (0, 1)
+    assert len(store) == 2
+    assert store.position("amazing_cats_video_id") == 1
+    assert store.position("does_not_exist") is None
+    assert store.tags(1) == ("#cat", "#animal")
+    tags, _, _ = store.tag_columns()
+    assert tags == ["#dog", "#animal", "#cat"]
+
+
+def test_store_from_columns_matches_appended_store():
+    store = VideoStore()
+    store.append("Funny Dogs", "funny_dogs_video_id", ["#dog", "#animal"])
+    store.append("Video about nothing", "nothing_video_id", [])
+    rebuilt = VideoStore.from_columns(
+        ["Funny Dogs", "Video about nothing"],
+        ["funny_dogs_video_id", "nothing_video_id"],
+        *store.tag_columns())
+    assert rebuilt.tags(0) == ("#dog", "#animal")
+    assert rebuilt.tags(1) == ()
+    assert rebuilt.position("nothing_video_id") == 1
+    assert rebuilt.flag_reason(1) is None
+
+
+def test_video_views_share_state():
+    store = VideoStore()
+    position = store.append("Funny Dogs", "funny_dogs_video_id", ["#dog"])
+    video = Video.view(store, position)
+    same_video = Video.view(store, position)
+    assert video == same_video
+    assert copy.deepcopy(video) is video
+
+    store.set_flag(position, "dont_like_dogs")
+    assert same_video.flagged
+    assert same_video.flag_reason == "dont_like_dogs"
+    store.clear_flag(position)
+    assert not same_video.flagged
+
+
+def test_stand_alone_video():
+    tags = ["#cat", "#animal"]
+    video = Video("Amazing Cats", "amazing_cats_video_id", tags)
+    tags.append("#dog")
+    assert video.tags == ("#cat", "#animal")
+    assert not hasattr(video, "__dict__")
+    assert video.avg_rating == 0
+    video._store.add_rating(0, 4.0)
+    video._store.add_rating(0, 5.0)
+    assert video.rating() == 4.5
+
+
+def test_rating_aggregates():
+    store = VideoStore()
+    position = store.append("Funny Dogs", "funny_dogs_video_id", [])
+    assert store.average_rating(position) == 0
+    assert store.rating_summary(position) is None
+
+    for rating in [1.0, 2.0, 2.0, 5.0]:
+        store.add_rating(position, rating)
+    assert store.average_rating(position) == 2.5
+    summary = store.rating_summary(position)
+    assert summary.count == 4
+    assert summary.variance == 2.25
+    assert (summary.minimum, summary.maximum) == (1.0, 5.0)
+    assert summary.histogram == (1, 2, 0, 0, 1)
+
+
+def test_overlay_copies_flags_and_ratings_on_write():
+    store = VideoStore()
+    position = store.append("Funny Dogs", "funny_dogs_video_id", ["#dog"])
+    store.add_rating(position, 2)
+    overlay = store.overlay()
+    assert overlay.title(position) == "Funny Dogs"
+    assert overlay.rating_summary(position).count == 1
+
+    overlay.add_rating(position, 5)
+    overlay.set_flag(position, "dont_like_dogs")
+    summary = overlay.rating_summary(position)
+    assert (summary.count, summary.average) == (2, 3.5)
+    assert (summary.minimum, summary.maximum) == (2, 5)
+    assert summary.histogram == (0, 1, 0, 0, 1)
+    assert overlay.flag_reason(position) == "dont_like_dogs"
+
+    assert store.average_rating(position) == 2
+    assert store.flag_reason(position) is None
+    overlay.clear_flag(position)
+    assert overlay.flag_reason(position) is None
+
+
+def test_detached_overlay_changes_videos_of_its_own():
+    store = VideoStore()
+    dogs = store.append("Funny Dogs", "funny_dogs_video_id", ["#dog"])
+    cats = store.append("Amazing Cats", "amazing_cats_video_id", ["#cat"])
+    store.set_flag(cats, "no_cats")
+    overlay = store.overlay()
+    overlay.add_rating(dogs, 4)
+    video = Video.view(overlay, dogs)
+
+    overlay.detach()
+    overlay.replace(dogs, "Funnier Dogs", ["#dog", "#funny"])
+    overlay.remove(cats)
+    added = overlay.append("Life at Google", "life_at_google_video_id", [])
+    assert (video.title, video.tags) == ("Funnier Dogs", ("#dog", "#funny"))
+    assert video.avg_rating == 4
+    assert overlay.flag_reason(cats) == "no_cats"
+    assert overlay.position("amazing_cats_video_id") is None
+    assert list(overlay.video_positions()) == [
+        ("funny_dogs_video_id", dogs), ("life_at_google_video_id", added)]
+
+    assert (store.title(dogs), store.tags(dogs)) == ("Funny Dogs", ("#dog",))
+    assert store.position("amazing_cats_video_id") == cats
+    assert len(store) == 2